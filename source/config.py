@@ -19,10 +19,12 @@ PLUGIN_ON = False       # Default= False True reads customized settings from a c
 PLUGIN_NAME = "shopcam" # Specify filename in plugins subfolder without .py extension per below
                         # TLlong, TLshort, secfast, secstill, strmvid, secvid,
                         # secQTL, shopcam, dashcam, slowmo, TLpan, pano
+                        # Comma separated names eg "shopcam, slowmo" are layered in order
 
 VERBOSE_ON = True       # Default= True Sends logging Info to Console. False if running script as daeman
 LOG_TO_FILE_ON = False  # Default= False True logs diagnostic data to a disk file for review
 DEBUG_ON = False        # Default= False True= DEBUG_ON mode returns pixel average data for tuning
+CONFIG_RELOAD_ON = True # Default= True Apply config.py and plugin changes without a restart. Checked every 5 sec or on SIGHUP
 
 # Image Settings
 # --------------
@@ -47,6 +49,9 @@ STREAM_WIDTH = 320           # Default= 320  Width of motion tracking stream det
 STREAM_HEIGHT = 240          # Default= 240  Height of motion tracking stream detection area
 STREAM_FPS = 20              # Default= 20 fps PiVideoStream setting.  Single core RPI suggest 15 fps
 STREAM_STOP_SEC = 4          # Default= 0.7 Allow time to stop video stream thread to release camera
+LIVE_VIEW_ON = False         # Default= False True= Share motion stream frames with timolo2-web.py live view
+LIVE_VIEW_FPS = 5            # Default= 5 Max live view frames per second. Only sent while someone is watching
+ROLLUP_ON = True             # Default= True Keep hourly capture totals in data/rollups for the web calendar
 
 # Note see STREAM_FPS variable below to set motion video stream framerate for stream size above
 
@@ -82,6 +87,17 @@ TIMELAPSE_MAX_FILES = 0       # Default= 0 0=Off or specify MaxFiles to maintain
 TIMELAPSE_SUBDIR_MAX_FILES = 0 # Default= 0 0=Off or specify MaxFiles - Creates New dated sub-folder if MaxFiles exceeded
 TIMELAPSE_SUBDIR_MAX_HOURS = 0 # Default= 0 0=Off or specify MaxHours - Creates New dated sub-folder if MaxHours exceeded
 
+# Incremental Daily Timelapse Video Settings
+# Requires ffmpeg. Segments are joined into a daily video when the date changes
+# ------------------------------------------
+TIMELAPSE_SEGMENT_ON = False       # Default= False True= Encode timelapse images into video segments as they arrive
+TIMELAPSE_SEGMENT_FRAMES = 60      # Default= 60 Number of new timelapse images per background encoded segment
+TIMELAPSE_SEGMENT_DIR = "media/timelapse-segments"  # Default= "media/timelapse-segments" Working folder for daily segments
+TIMELAPSE_SEGMENT_VIDEO_DIR = "media/videos"  # Default= "media/videos" Destination folder for joined daily videos
+TIMELAPSE_SEGMENT_PREFIX = "TL-"   # Default= "TL-" Daily video name prefix. Date YYYYMMDD is appended
+TIMELAPSE_SEGMENT_FPS = 10         # Default= 10 Output video frames per second
+TIMELAPSE_SEGMENT_SIZE = "1280x720"  # Default= "1280x720" Output video size width x height
+
 # Motion Track Settings
 # ---------------------
 MOTION_TRACK_ON = True         # Default= True True=Turns Motion Detect On, False=Off
@@ -123,6 +139,7 @@ MOTION_VIDEO_WIDTH = 800     # Default= 800 Width of video in pixels
 MOTION_VIDEO_HEIGHT = 600    # Default= 600 Height of video in pixels
 MOTION_VIDEO_FPS = 15        # Default= 15 If resolution reduced to 640x480 then slow motion is possible at 90 fps
 MOTION_VIDEO_TIMER_SEC = 10  # Default= 10 secs Duration of single Video clip to take after Motion Detected
+VIDEO_MP4_MODE = "frag"      # Default= "frag" Fragmented mp4 plays while downloading and survives a crash. "faststart" or ""= moov at end
 # ---------------------------------------------------------------------------
 
 # Settings for Pan Tilt Hardware
@@ -132,6 +149,11 @@ PANTILT_ON = False          # Default= False Off, True= Enable Pan Tilt Hat Hard
 PANTILT_IS_PIMORONI = True  # Default= True Use Pimoroni pantilehat, False= Use Waveshare pantilthat
 PANTILT_HOME = (0, 0)       # Default= (0, -10) Pan Tilt Home Postion. Values between -90 and + 90
 PANTILT_SLEEP_SEC = 0.1     # Default= 0.1 Allow time for pantilt servos to move
+PANTILT_PIPELINE_ON = False # Default= False True= Keep camera open for pantilt sequence and pano stops.
+                            # Saves previous image while servos move. Stops are taken in least travel order
+PANTILT_SETTLE_MODEL_ON = False  # Default= False True= Wait per servo travel distance instead of PANTILT_SLEEP_SEC
+PANTILT_SPEED_DEG_SEC = 0   # Default= 0 Use hardware speed profile, else servo degrees per second
+PANTILT_SETTLE_CHECK_ON = False  # Default= False True= Pipeline also waits for still lores frames after move
 
 # Settings for pantilt image sequence
 # Can also be triggerd by Motion if
@@ -180,6 +202,15 @@ PANO_CAM_STOPS = [(-20, 0),
                   (0, 0),
                   (20, 0)
                  ]
+# Pano stitching jobs are queued and run in background per settings below.
+PANO_STITCH_MAX_JOBS = 1     # Default= 1 Maximum number of image-stitching processes running at once
+PANO_STITCH_NICE = 10        # Default= 10 Lower cpu priority of stitching 0=normal 19=lowest
+PANO_STITCH_MIN_MEM_MB = 250 # Default= 250 Do Not start a stitch unless this much memory is available
+PANO_STITCH_QUEUE_MAX = 3    # Default= 3 Max pending stitch jobs. Oldest is dropped when full
+PANO_STITCH_STALE_SEC = 3600 # Default= 3600 Drop pending stitch jobs older than this. 0=Never
+PANO_CALIB_ON = False        # Default= False True= Cache warps for PANO_CAM_STOPS and only warp/blend routine panos
+PANO_CALIB_MAX_RESIDUAL = 3.0 # Default= 3.0 px Max calibration error. Otherwise full stitching with PANO_PROG_PATH
+PANO_CALIB_MAX_DIFF = 30     # Default= 30 Max mean gray difference in overlaps before recalibrating
 
 # Dash Cam Video Repeat Mode
 # IMPORTANT: Suppresses Timelapse, Motion Track and Pano
@@ -218,6 +249,14 @@ WEB_PAGE_REFRESH_ON = True    # False=Off (never)  Refresh True=On (per seconds
 WEB_PAGE_REFRESH_SEC = "900"  # Default= "900" seconds to wait for web page refresh  seconds (15>
 WEB_PAGE_BLANK_ON = False     # True Starts left image with a blank page until a right menu item>
                               # False displays second list[1] item since first may be in progress
+WEB_SERVER_WORKERS = 8        # Default= 8 Max browser requests handled at the same time
+WEB_CONN_TIMEOUT_SEC = 15     # Default= 15 Close idle keep-alive browser connections after seconds
+WEB_STATUS_TTL_SEC = 10       # Default= 10 Seconds to cache disk status. Media usage is cached 3x longer
+WEB_MEDIA_MAX_AGE_SEC = 3600  # Default= 3600 Seconds browsers may cache images and videos. 0= Always check
+WEB_THUMB_CACHE_MB = 100      # Default= 100 Max MB of image thumbnails kept in data/thumbs
+WEB_EVENTS_ON = True          # Default= True Push new media to open pages. Replaces WEB_PAGE_REFRESH_ON
+WEB_MEDIA_INDEX_ON = True     # Default= True Keep data/media-index.db for /api/media queries by type and time
+WEB_CALENDAR_DAYS = 28        # Default= 28 Days shown on the /calendar hourly activity page
 
 # Left iFrame Image Settings
 # --------------------------
@@ -229,6 +268,7 @@ WEB_IFRAME_HEIGHT = "100%"     # Desired frame height to display images. Scroll
 # Right Side Files List
 # ---------------------
 WEB_MAX_LIST_ENTRIES = 0           # 0 = All or Specify Max right side file entries to show (mus>
+WEB_LIST_PAGE_SIZE = 200           # Default= 200 Entries per list page. More are loaded on scroll
 WEB_LIST_HEIGHT = WEB_IMAGE_HEIGHT # Right List - side menu height in px (link selection)
 WEB_LIST_BY_DATETIME_ON = True     # True=datetime False=filename
 WEB_LIST_SORT_DESC_ON = True       # reverse sort order (filename or datetime per web_list_by_da>
@@ -0,0 +1,129 @@
+"""
+configreload.py - Reload pi-timolo2 settings while timolo2-cam.py runs
+
+Settings are read by running config.py (and any enabled plugin files)
+into a fresh dictionary, so nothing is imported, copied or compiled to
+disk. timolo2-cam.py also loads plugins at startup with readSettings().
+ConfigReload checks the file times every CHECK_SEC and also reloads at
+once on SIGHUP
+
+    kill -HUP $(pgrep -f timolo2-cam.py)
+
+poll() returns only the settings that changed as {name: (old, new)}.
+A file with an error (eg saved half edited) is logged and the previous
+settings are kept until the file changes again.
+"""
+import logging
+import os
+import runpy
+import signal
+import time
+
+CHECK_SEC = 5  # Seconds between config file time checks
+
+
+# ------------------------------------------------------------------------------
+def readSettings(path, settings=None):
+    """
+    Return settings dict of upper case names set by python file path.
+    Names in settings (eg config.py values when reading a plugin) are
+    visible to the file and overridden by it.
+    """
+    result = dict(settings or {})
+    values = runpy.run_path(path, init_globals=dict(result))
+    result.update((name, value) for name, value in values.items()
+                  if name.isupper() and not name.startswith("_"))
+    return result
+
+
+# ------------------------------------------------------------------------------
+def settingType(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, (list, tuple)):
+        return "list"
+    return type(value).__name__
+
+
+# ------------------------------------------------------------------------------
+def checkSettings(values, known):
+    """
+    Return list of problems with settings values (eg from a plugin) compared
+    to known settings. Unknown names are usually misspelled and are ignored
+    by the program. None matches any type since it means not set.
+    """
+    problems = []
+    for name, value in sorted(values.items()):
+        if name not in known:
+            problems.append("Unknown Setting %s" % name)
+        elif (value is not None and known[name] is not None
+              and settingType(value) != settingType(known[name])):
+            problems.append("Setting %s = %r is %s. Expected %s like %r"
+                            % (name, value, settingType(value),
+                               settingType(known[name]), known[name]))
+    return problems
+
+
+# ------------------------------------------------------------------------------
+def settingsDiff(old, new):
+    """Return {name: (old value, new value)} of settings added or changed"""
+    return {name: (old.get(name), value) for name, value in new.items()
+            if name not in old or old[name] != value}
+
+
+# ------------------------------------------------------------------------------
+class ConfigReload:
+    '''
+    load_fn() returns (settings dict, list of file paths it read).
+    Call poll() from the main loop. Installs a SIGHUP handler so must be
+    created in the main thread.
+    '''
+
+    def __init__(self, load_fn, check_sec=CHECK_SEC):
+        self.load_fn = load_fn
+        self.check_sec = check_sec
+        self.settings, self.paths = load_fn()
+        self.mtimes = self.fileTimes()
+        self.checked = time.monotonic()
+        self.hup = False
+        signal.signal(signal.SIGHUP, self.onHup)
+
+    def onHup(self, signum, frame):
+        self.hup = True
+
+    def fileTimes(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def poll(self):
+        '''Return {name: (old, new)} of changed settings. Empty if none'''
+        if not self.hup:
+            if time.monotonic() - self.checked < self.check_sec:
+                return {}
+            self.checked = time.monotonic()
+            mtimes = self.fileTimes()
+            if mtimes == self.mtimes:
+                return {}
+            self.mtimes = mtimes
+        else:
+            self.hup = False
+            logging.info("SIGHUP Received. Reloading Settings")
+        try:
+            settings, paths = self.load_fn()
+        except Exception as e:  # any error in a user edited settings file
+            logging.error("Settings Not Reloaded. Error in %s - %s",
+                          " or ".join(self.paths), e)
+            return {}
+        changed = settingsDiff(self.settings, settings)
+        self.settings = settings
+        if paths != self.paths:  # eg PLUGIN_NAME changed
+            self.paths = paths
+            self.mtimes = self.fileTimes()
+        return changed
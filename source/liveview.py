@@ -0,0 +1,209 @@
+"""
+liveview.py - Shared memory live view frames for pi-timolo2
+
+timolo2-cam.py publishes its motion tracking stream frames (CamStream)
+into a small shared memory ring buffer with a sequence counter.
+timolo2-web.py reads the newest frame and serves it as an MJPEG stream,
+so the live camera can be viewed while timolo2-cam.py is running.
+
+Viewers write a heartbeat time into the buffer header. Frames are only
+copied into shared memory while a viewer heartbeat is recent, and only
+at up to LIVE_VIEW_FPS, so the cost is a header read per frame when
+nobody is watching.
+
+Layout. Header then slots of (slot header, frame bytes)
+    header  magic, width, height, channels, slots, seq, viewer_time
+    slot    seq, frame_time
+"""
+import struct
+import threading
+import time
+
+from multiprocessing import shared_memory
+
+SHM_NAME = "timolo2-live"
+MAGIC = b"TLV1"
+HEADER = struct.Struct("<4sIIIIQd")
+SLOT_HEADER = struct.Struct("<Qd")
+SEQ_OFFSET = 20       # HEADER offset of seq
+VIEWER_OFFSET = 28    # HEADER offset of viewer_time
+VIEWER_TIMEOUT_SEC = 3.0  # Publishing stops this long after the last viewer heartbeat
+SLOTS = 3
+
+
+# ------------------------------------------------------------------------------
+def attachShm(name):
+    """
+    Attach to an existing shared memory block without letting this
+    process's resource tracker unlink it at exit.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except (ImportError, AttributeError, KeyError):
+            pass
+        return shm
+
+
+# ------------------------------------------------------------------------------
+class FramePublisher:
+    '''
+    Cam side. Copies frames into the shared memory ring buffer while
+    a viewer is connected. Create once and call publish(frame) per frame.
+    '''
+
+    def __init__(self, size, channels=4, fps=5, name=SHM_NAME):
+        self.width, self.height = size
+        self.channels = channels
+        self.frame_bytes = self.width * self.height * channels
+        self.slot_bytes = SLOT_HEADER.size + self.frame_bytes
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.last_time = 0.0
+        total = HEADER.size + SLOTS * self.slot_bytes
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        except FileExistsError:  # left by a previous run that did not exit cleanly
+            old = attachShm(name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        self.seq = 0
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, self.width, self.height,
+                         channels, SLOTS, 0, 0.0)
+
+    def viewerActive(self):
+        viewer_time = struct.unpack_from("<d", self.shm.buf, VIEWER_OFFSET)[0]
+        return time.time() - viewer_time < VIEWER_TIMEOUT_SEC
+
+    def publish(self, frame):
+        '''Copy frame (height, width, channels uint8 array) if a viewer is active'''
+        if not self.viewerActive():
+            return False
+        now = time.time()
+        if now - self.last_time < self.min_interval:
+            return False
+        if frame is None or frame.nbytes != self.frame_bytes:
+            return False
+        self.last_time = now
+        seq = self.seq + 1
+        offset = HEADER.size + (seq % SLOTS) * self.slot_bytes
+        # invalidate slot while it is written so readers retry
+        SLOT_HEADER.pack_into(self.shm.buf, offset, 0, now)
+        start = offset + SLOT_HEADER.size
+        self.shm.buf[start:start + self.frame_bytes] = frame.reshape(-1).data
+        SLOT_HEADER.pack_into(self.shm.buf, offset, seq, now)
+        struct.pack_into("<Q", self.shm.buf, SEQ_OFFSET, seq)
+        self.seq = seq
+        return True
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (OSError, BufferError):
+            pass
+
+
+# ------------------------------------------------------------------------------
+class FrameReader:
+    '''
+    Viewer side. read() returns (seq, frame array) of the newest frame or
+    None if there is no newer frame than last_seq.
+    Raises FileNotFoundError if the cam is not publishing.
+    '''
+
+    def __init__(self, name=SHM_NAME):
+        import numpy as np
+
+        self.np = np
+        self.shm = attachShm(name)
+        magic, self.width, self.height, self.channels, self.slots, _, _ = \
+            HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            self.shm.close()
+            raise FileNotFoundError("Not a live view buffer %s" % name)
+        self.frame_bytes = self.width * self.height * self.channels
+        self.slot_bytes = SLOT_HEADER.size + self.frame_bytes
+
+    def touch(self):
+        '''Viewer heartbeat. Tells the publisher someone is watching'''
+        struct.pack_into("<d", self.shm.buf, VIEWER_OFFSET, time.time())
+
+    def read(self, last_seq=0):
+        seq = struct.unpack_from("<Q", self.shm.buf, SEQ_OFFSET)[0]
+        if seq == 0 or seq == last_seq:
+            return None
+        offset = HEADER.size + (seq % self.slots) * self.slot_bytes
+        start = offset + SLOT_HEADER.size
+        frame = self.np.frombuffer(self.shm.buf[start:start + self.frame_bytes],
+                                   dtype=self.np.uint8).copy()
+        slot_seq = SLOT_HEADER.unpack_from(self.shm.buf, offset)[0]
+        if slot_seq != seq:
+            return None  # slot was overwritten during copy. Try again
+        return seq, frame.reshape(self.height, self.width, self.channels)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+
+# ------------------------------------------------------------------------------
+def encodeJpeg(frame, quality=80):
+    """Return jpg bytes of a BGR or BGRX frame array"""
+    try:
+        import cv2
+        ok, jpg = cv2.imencode(".jpg", frame[:, :, :3], [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("cv2 jpg encode failed")
+        return jpg.tobytes()
+    except ImportError:
+        from io import BytesIO
+        from PIL import Image
+        out = BytesIO()
+        Image.fromarray(frame[:, :, 2::-1]).save(out, "JPEG", quality=quality)
+        return out.getvalue()
+
+
+# ------------------------------------------------------------------------------
+class LiveView:
+    '''
+    Web side. Shares one jpg encode per new frame between all viewers.
+    Reattaches if the cam process restarts and creates a new buffer.
+    '''
+
+    def __init__(self, name=SHM_NAME, stale_sec=5.0):
+        self.name = name
+        self.stale_sec = stale_sec
+        self.lock = threading.Lock()
+        self.reader = None
+        self.seq = 0
+        self.jpeg = None
+        self.new_time = 0.0
+
+    def frame(self):
+        '''
+        Send viewer heartbeat and return (seq, jpg bytes) of the newest frame.
+        seq is 0 until the first frame arrives. Raises FileNotFoundError if
+        the cam is not publishing.
+        '''
+        with self.lock:
+            now = time.time()
+            if self.reader is not None and now - self.new_time > self.stale_sec:
+                self.reader.close()  # no frames. cam may have restarted
+                self.reader = None
+            if self.reader is None:
+                self.reader = FrameReader(self.name)
+                self.new_time = now
+            self.reader.touch()
+            result = self.reader.read(self.seq)
+            if result is not None:
+                self.seq, frame = result
+                self.jpeg = encodeJpeg(frame)
+                self.new_time = now
+            return (self.seq, self.jpeg) if self.jpeg else (0, None)
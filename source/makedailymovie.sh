@@ -37,6 +37,12 @@ echo "INFO  : $progName $ver  written by Claude Pageau"
 #
 # For more details see GitHub Wiki here
 # https://github.com/pageauc/pi-timolo/wiki/Utilities
+#
+# To catch up on a backlog of days after an outage use the batch encoder.
+# It makes one video per day, encodes days in parallel and skips days
+# that already have a current video. eg
+#
+# ./tlvideo.py batch media/timelapse media/motion -o daily_movies --prefix dailymovie_
 
 #            ------------- Start Script ------------------
 # get current working folder that this script was launched from
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+mediaindex.py - Cached disk and media usage status for timolo2-web.py
+
+DiskStatus reads os.statvfs instead of running df and caches the result
+for a few seconds. MediaUsage keeps a table of file counts and bytes per
+media type for every folder under the web root. Each update only rescans
+folders whose mtime changed, so adding or deleting files costs a scan of
+that one folder instead of a walk of the whole media tree.
+Note a file that grows in place (eg a video being written) is counted at
+its size when its folder last changed.
+
+MediaIndex keeps a persistent sqlite index of media files keyed by
+capture time, kind (motion, timelapse Etc per file name prefix), media
+type, name and size. It is synced the same way, by rescanning changed
+folders only, and answers queries like the last 50 motion images with an
+index range scan. Results are paged with cursors, not offsets.
+
+Display current media usage or query the index
+
+    ./mediaindex.py media
+    ./mediaindex.py media motion 50
+"""
+import base64
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+VIDEO_EXTS = (".mp4", ".h264", ".mkv", ".avi", ".mov")
+MEDIA_TYPES = ("image", "video", "other")
+
+
+# ------------------------------------------------------------------------------
+def mediaType(name):
+    """Return image, video or other per file name extension"""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTS:
+        return "image"
+    if ext in VIDEO_EXTS:
+        return "video"
+    return "other"
+
+
+# ------------------------------------------------------------------------------
+def humanSize(num_bytes):
+    """Format bytes like df -h eg 1.5G (rounded up)"""
+    size = float(num_bytes)
+    for unit in ("", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            if unit and size < 10:
+                return "%.1f%s" % (math.ceil(size * 10) / 10, unit)
+            return "%i%s" % (math.ceil(size), unit)
+        size /= 1024.0
+
+
+# ------------------------------------------------------------------------------
+def mountDevice(path):
+    """Return (device, mount point) from /proc/mounts that holds path"""
+    path = os.path.realpath(path)
+    best = ("unknown", "/")
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                device, mount = fields[0], fields[1].replace("\\040", " ")
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) \
+                        and len(mount) >= len(best[1]):
+                    best = (device, mount)
+    except OSError:
+        pass
+    return best
+
+
+# ------------------------------------------------------------------------------
+class DiskStatus:
+    '''Disk space per os.statvfs cached for ttl_sec'''
+
+    def __init__(self, path, ttl_sec=10):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.device, self.mount = mountDevice(path)
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.status = ""
+
+    def get(self):
+        with self.lock:
+            if time.monotonic() - self.checked < self.ttl_sec:
+                return self.status
+            try:
+                st = os.statvfs(self.path)
+                size = st.f_blocks * st.f_frsize
+                avail = st.f_bavail * st.f_frsize
+                used = (st.f_blocks - st.f_bfree) * st.f_frsize
+                # same percent calculation as df
+                percent = 100.0 * used / max(1, used + avail)
+                self.status = ("Drive %s at %s [Space %i%% Used %s of %s Avail %s]"
+                               % (self.device, self.mount, -(-percent // 1),
+                                  humanSize(used), humanSize(size), humanSize(avail)))
+            except OSError:
+                self.status = "statvfs Error. No drive status avail"
+            self.checked = time.monotonic()
+            return self.status
+
+
+# ------------------------------------------------------------------------------
+class MediaUsage:
+    '''
+    File count and bytes per media type for each folder under root.
+    Symbolic links (eg recent folders) are not counted.
+    '''
+
+    def __init__(self, root, ttl_sec=30):
+        self.root = os.path.abspath(root)
+        self.ttl_sec = ttl_sec
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.table = {}   # dir path -> (mtime_ns, {type: [count, bytes]}, [sub dirs])
+        self.totals = {}
+
+    def scanDir(self, path, mtime_ns):
+        usage = {media_type: [0, 0] for media_type in MEDIA_TYPES}
+        sub_dirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir():
+                        sub_dirs.append(entry.path)
+                    elif entry.is_file():
+                        counts = usage[mediaType(entry.name)]
+                        counts[0] += 1
+                        counts[1] += entry.stat().st_size
+                except OSError:
+                    continue  # file deleted during scan
+        self.table[path] = (mtime_ns, usage, sub_dirs)
+
+    def update(self):
+        '''Rescan changed folders and return totals by type and top folder'''
+        with self.lock:
+            if self.totals and time.monotonic() - self.checked < self.ttl_sec:
+                return self.totals
+            seen = set()
+            by_type = {media_type: [0, 0] for media_type in MEDIA_TYPES}
+            by_folder = {}
+            todo = [(self.root, ".")]
+            rescanned = 0
+            while todo:
+                path, top = todo.pop()
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                    cached = self.table.get(path)
+                    if cached is None or cached[0] != mtime_ns:
+                        self.scanDir(path, mtime_ns)
+                        rescanned += 1
+                except OSError:
+                    continue
+                seen.add(path)
+                _, usage, sub_dirs = self.table[path]
+                folder = by_folder.setdefault(top, [0, 0])
+                for media_type, (count, size) in usage.items():
+                    by_type[media_type][0] += count
+                    by_type[media_type][1] += size
+                    folder[0] += count
+                    folder[1] += size
+                for sub_dir in sub_dirs:
+                    todo.append((sub_dir, os.path.basename(sub_dir) if path == self.root else top))
+            for path in set(self.table) - seen:
+                del self.table[path]  # folder was removed
+            self.totals = {"by_type": by_type, "by_folder": by_folder,
+                           "folders": len(seen), "rescanned": rescanned}
+            self.checked = time.monotonic()
+            return self.totals
+
+    def summary(self):
+        '''Return one line usage per media type eg image 1.2G (3400)'''
+        totals = self.update()
+        return "  ".join("%s %s (%i)" % (media_type, humanSize(size), count)
+                         for media_type, (count, size) in totals["by_type"].items()
+                         if count)
+
+
+# ------------------------------------------------------------------------------
+def captureTime(name, mtime):
+    """Return capture time from a YYYYMMDD-HHMMSS file name or mtime if none"""
+    match = re.search(r"(\d{8}-\d{6})", name)
+    if match:
+        try:
+            return time.mktime(time.strptime(match.group(1), "%Y%m%d-%H%M%S"))
+        except (ValueError, OverflowError):
+            pass
+    return mtime
+
+
+# ------------------------------------------------------------------------------
+class MediaIndex:
+    '''
+    Persistent sqlite index of media files under root. kinds is a list of
+    (kind, file name prefix) eg ("motion", "mo-"). Longest prefix wins and
+    other files have kind other. Kind names must differ from MEDIA_TYPES
+    since query() takes either. Symbolic links (eg recent folders) are not
+    indexed. update() is called by query() at most once per ttl_sec.
+    '''
+
+    def __init__(self, root, db_path, kinds=(), ttl_sec=10):
+        if sqlite3 is None:
+            raise ImportError("MediaIndex requires python sqlite3")
+        for kind, _ in kinds:
+            if kind in MEDIA_TYPES:
+                raise ValueError("Kind %s is also a media type" % kind)
+        self.root = os.path.abspath(root)
+        self.kinds = sorted(kinds, key=lambda kind: len(kind[1]), reverse=True)
+        self.ttl_sec = ttl_sec
+        self.lock = threading.Lock()
+        self.checked = 0
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        try:
+            self.openDb(db_path)
+        except sqlite3.Error as e:
+            raise OSError("Media Index %s Error - %s" % (db_path, e))
+
+    def openDb(self, db_path):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # fewer sd card syncs
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+            CREATE TABLE IF NOT EXISTS media (
+                path TEXT PRIMARY KEY, folder TEXT, name TEXT, kind TEXT, type TEXT,
+                capture_time REAL, size INTEGER, mtime_ns INTEGER);
+            CREATE INDEX IF NOT EXISTS media_time ON media (capture_time, path);
+            CREATE INDEX IF NOT EXISTS media_kind_time ON media (kind, capture_time, path);
+            CREATE INDEX IF NOT EXISTS media_type_time ON media (type, capture_time, path);
+            CREATE INDEX IF NOT EXISTS media_folder ON media (folder);
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        # kinds are stored per file. Reindex everything if the prefixes changed
+        kinds_json = json.dumps(self.kinds)
+        row = self.db.execute("SELECT value FROM settings WHERE key = 'kinds'").fetchone()
+        if row is None or row[0] != kinds_json:
+            with self.db:
+                self.db.execute("DELETE FROM media")
+                self.db.execute("DELETE FROM folders")
+                self.db.execute("INSERT OR REPLACE INTO settings VALUES ('kinds', ?)", (kinds_json,))
+
+    def kindOf(self, name):
+        for kind, prefix in self.kinds:
+            if prefix and name.startswith(prefix):
+                return kind
+        return "other"
+
+    def scanDir(self, rel_dir, path):
+        '''Sync index rows of one changed folder. Returns sub folder paths'''
+        files = {}
+        sub_dirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir():
+                        sub_dirs.append(entry.path)
+                    elif entry.is_file() and mediaType(entry.name) != "other":
+                        st = entry.stat()
+                        files[entry.name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue  # file deleted during scan
+        indexed = {name: (size, mtime_ns) for name, size, mtime_ns in self.db.execute(
+            "SELECT name, size, mtime_ns FROM media WHERE folder = ?", (rel_dir,))}
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        self.db.executemany("DELETE FROM media WHERE path = ?",
+                            [(prefix + name,) for name in set(indexed) - set(files)])
+        self.db.executemany(
+            "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(prefix + name, rel_dir, name, self.kindOf(name), mediaType(name),
+              captureTime(name, mtime_ns / 1e9), size, mtime_ns)
+             for name, (size, mtime_ns) in files.items() if indexed.get(name) != (size, mtime_ns)])
+        return sub_dirs
+
+    def update(self):
+        '''Rescan folders whose mtime changed. Returns number rescanned'''
+        with self.lock:
+            if time.monotonic() - self.checked < self.ttl_sec:
+                return 0
+            known = {path: (parent, mtime_ns) for path, parent, mtime_ns in
+                     self.db.execute("SELECT path, parent, mtime_ns FROM folders")}
+            children = {}
+            for path, (parent, _) in known.items():
+                children.setdefault(parent, []).append(path)
+            seen = set()
+            rescanned = 0
+            todo = [(".", None)]
+            with self.db:
+                while todo:
+                    rel_dir, parent = todo.pop()
+                    path = self.root if rel_dir == "." else os.path.join(self.root, rel_dir)
+                    try:
+                        mtime_ns = os.stat(path).st_mtime_ns
+                        if known.get(rel_dir, (None, None))[1] != mtime_ns:
+                            sub_dirs = [os.path.relpath(sub_dir, self.root)
+                                        for sub_dir in self.scanDir(rel_dir, path)]
+                            self.db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                                            (rel_dir, parent, mtime_ns))
+                            rescanned += 1
+                        else:
+                            sub_dirs = children.get(rel_dir, [])
+                    except OSError:
+                        continue
+                    seen.add(rel_dir)
+                    todo.extend((sub_dir, rel_dir) for sub_dir in sub_dirs)
+                for rel_dir in set(known) - seen:  # folder was removed
+                    self.db.execute("DELETE FROM folders WHERE path = ?", (rel_dir,))
+                    self.db.execute("DELETE FROM media WHERE folder = ?", (rel_dir,))
+            self.checked = time.monotonic()
+            return rescanned
+
+    def query(self, kind=None, start=None, end=None, prefix=None, min_size=None,
+              folder=None, limit=50, cursor=None, newest_first=True):
+        '''
+        Return (list of row dicts, next cursor or None) ordered by capture time.
+        kind is an index kind eg motion or a media type image or video.
+        start and end are unix times, end exclusive. folder limits results to
+        a folder and its sub folders. limit None returns all rows.
+        '''
+        self.update()
+        where = []
+        params = []
+        if kind in MEDIA_TYPES:
+            where.append("type = ?")
+            params.append(kind)
+        elif kind:
+            where.append("kind = ?")
+            params.append(kind)
+        if start is not None:
+            where.append("capture_time >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("capture_time < ?")
+            params.append(end)
+        if prefix:
+            where.append("substr(name, 1, ?) = ?")
+            params += [len(prefix), prefix]
+        if min_size:
+            where.append("size >= ?")
+            params.append(min_size)
+        if folder and folder != ".":
+            where.append("(folder = ? OR substr(folder, 1, ?) = ?)")
+            params += [folder, len(folder) + 1, folder + "/"]
+        if cursor:
+            try:
+                cursor_time, cursor_path = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            except (TypeError, ValueError):
+                raise ValueError("Bad cursor %s" % cursor)
+            where.append("(capture_time, path) %s (?, ?)" % ("<" if newest_first else ">"))
+            params += [cursor_time, cursor_path]
+        order = "DESC" if newest_first else "ASC"
+        sql = ("SELECT path, kind, type, capture_time, size FROM media"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + " ORDER BY capture_time %s, path %s" % (order, order))
+        if limit is not None:
+            sql += " LIMIT %i" % (limit + 1)  # one more to know if there is a next page
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([rows[-1][3], rows[-1][0]]).encode("utf-8")).decode("ascii")
+        return ([{"path": path, "kind": kind, "type": media_type, "time": capture_time,
+                  "size": size} for path, kind, media_type, capture_time, size in rows],
+                next_cursor)
+
+
+# ------------------------------------------------------------------------------
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else "media"
+    if len(sys.argv) > 2:
+        kinds = [("motion", "mo-"), ("timelapse", "tl-"), ("vidrepeat", "vid-"),
+                 ("pano", "pano-"), ("pantilt", "pt-")]
+        index = MediaIndex(root, os.path.join("data", "media-index.db"), kinds)
+        start_time = time.time()
+        rescanned = index.update()
+        print("Synced %i Folders in %.2f sec" % (rescanned, time.time() - start_time))
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+        start_time = time.time()
+        rows, _ = index.query(sys.argv[2], limit=limit)
+        print("Query %s limit %i in %.4f sec" % (sys.argv[2], limit, time.time() - start_time))
+        for row in rows:
+            print("  %s  %-10s %8s  %s" % (time.strftime("%Y-%m-%d %H:%M:%S",
+                                                         time.localtime(row["time"])),
+                                         row["kind"], humanSize(row["size"]), row["path"]))
+        return
+    print(DiskStatus(root).get())
+    usage = MediaUsage(root)
+    start_time = time.time()
+    totals = usage.update()
+    print("Scanned %i Folders in %.2f sec" % (totals["folders"], time.time() - start_time))
+    usage.checked = 0
+    start_time = time.time()
+    usage.update()
+    print("Rechecked in %.3f sec" % (time.time() - start_time))
+    print(usage.summary())
+    for folder, (count, size) in sorted(totals["by_folder"].items()):
+        print("  %-20s %8s %8i files" % (folder, humanSize(size), count))
+
+
+if __name__ == "__main__":
+    main()
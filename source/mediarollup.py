@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+mediarollup.py - Hourly capture rollups for pi-timolo2
+
+timolo2-cam.py counts every file it saves, motion events, timelapse
+frames and time spent in day or night mode into per hour totals while
+it runs. Totals are written to one small json file per day in
+data/rollups (eg 2026-10-19.json) so timolo2-web.py can draw a calendar
+of activity by reading a few files, however large the media archive is.
+
+Rollups are a capture history. Deleting media later does not change them.
+
+Show the last 7 days from the command line
+
+    ./mediarollup.py 7
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+ROLLUP_DIR = os.path.join("data", "rollups")
+FLUSH_SEC = 60     # Max seconds day/night time is kept in memory before it is written
+GAP_MAX_SEC = 600  # Longer gaps between dayMode calls (eg cam stopped) are not counted
+FIELDS = ("files", "bytes", "motion_events", "motion_files", "timelapse_frames",
+          "day_sec", "night_sec")
+
+
+# ------------------------------------------------------------------------------
+def dayPath(rollup_dir, day):
+    return os.path.join(rollup_dir, day + ".json")
+
+
+# ------------------------------------------------------------------------------
+def readDay(rollup_dir, day):
+    """Return {hour: totals dict} for day YYYY-MM-DD. Empty if nothing was captured"""
+    try:
+        with open(dayPath(rollup_dir, day)) as f:
+            hours = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {int(hour): totals for hour, totals in hours.items()}
+
+
+# ------------------------------------------------------------------------------
+def readDays(rollup_dir, days, end_time=None):
+    """Return [(YYYY-MM-DD, {hour: totals})] for days ending at end_time, newest first"""
+    if end_time is None:
+        end_time = time.time()
+    t = time.localtime(end_time)
+    result = []
+    for day_num in range(days):
+        # noon avoids skipping or repeating a day at daylight saving changes
+        day = time.strftime("%Y-%m-%d", time.localtime(
+            time.mktime((t.tm_year, t.tm_mon, t.tm_mday - day_num, 12, 0, 0, 0, 0, -1))))
+        result.append((day, readDay(rollup_dir, day)))
+    return result
+
+
+# ------------------------------------------------------------------------------
+class HourRollup:
+    '''
+    Cam side per hour totals. kinds is a list of (kind, file name prefix)
+    used to tell motion and timelapse files apart. Call addFile() for each
+    saved file, addEvent() per motion trigger and dayMode() each loop.
+    '''
+
+    def __init__(self, rollup_dir=ROLLUP_DIR, kinds=()):
+        self.rollup_dir = rollup_dir
+        # longest prefix first so eg pano- is not matched by a shorter prefix
+        self.kinds = sorted(kinds, key=lambda kind: len(kind[1]), reverse=True)
+        self.day = None
+        self.hours = {}
+        self.dirty = False
+        self.flushed = time.monotonic()
+        self.mode_time = None
+        if not os.path.isdir(rollup_dir):
+            os.makedirs(rollup_dir)
+
+    def kindOf(self, file_path):
+        name = os.path.basename(file_path)
+        for kind, prefix in self.kinds:
+            if prefix and name.startswith(prefix):
+                return kind
+        return "other"
+
+    def totals(self, now):
+        '''Return the totals dict of the hour now is in. Writes the previous day on a date change'''
+        t = time.localtime(now)
+        day = time.strftime("%Y-%m-%d", t)
+        if day != self.day:
+            if self.dirty:
+                self.flush()
+            self.day = day
+            self.hours = {str(hour): totals for hour, totals
+                          in readDay(self.rollup_dir, day).items()}
+        return self.hours.setdefault(str(t.tm_hour), dict.fromkeys(FIELDS, 0))
+
+    def add(self, field, value=1, now=None):
+        totals = self.totals(time.time() if now is None else now)
+        totals[field] = totals.get(field, 0) + value
+        self.dirty = True
+
+    def addFile(self, file_path):
+        '''Count a saved media file and its size'''
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return  # not saved
+        now = time.time()
+        kind = self.kindOf(file_path)
+        self.add("files", 1, now)
+        self.add("bytes", size, now)
+        if kind == "motion":
+            self.add("motion_files", 1, now)
+        elif kind == "timelapse":
+            self.add("timelapse_frames", 1, now)
+        self.flush()
+
+    def addEvent(self):
+        '''Count a motion trigger (one trigger may save several files)'''
+        self.add("motion_events")
+        self.flush()
+
+    def dayMode(self, day_mode):
+        '''Add time since the last call to day_sec or night_sec of this hour'''
+        now = time.time()
+        if self.mode_time is not None and 0 < now - self.mode_time < GAP_MAX_SEC:
+            self.add("day_sec" if day_mode else "night_sec", now - self.mode_time, now)
+        self.mode_time = now
+        if time.monotonic() - self.flushed > FLUSH_SEC:
+            self.flush()
+
+    def flush(self):
+        '''Write totals of the current day if changed. Replaces the file in one step'''
+        self.flushed = time.monotonic()
+        if not self.dirty:
+            return
+        path = dayPath(self.rollup_dir, self.day)
+        tmp_path = path + ".tmp"
+        hours = {hour: {field: (round(value, 1) if isinstance(value, float) else value)
+                        for field, value in totals.items()}
+                 for hour, totals in self.hours.items()}
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(hours, f, sort_keys=True)
+            os.replace(tmp_path, path)
+            self.dirty = False
+        except OSError as e:
+            logging.warning("Could Not Save Rollup %s - %s", path, e)
+
+
+# ------------------------------------------------------------------------------
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    for day, hours in readDays(ROLLUP_DIR, days):
+        files = sum(totals.get("files", 0) for totals in hours.values())
+        events = sum(totals.get("motion_events", 0) for totals in hours.values())
+        frames = sum(totals.get("timelapse_frames", 0) for totals in hours.values())
+        strip = "".join("." if not hours.get(hour) else
+                        ("M" if hours[hour].get("motion_events") else "t")
+                        for hour in range(24))
+        print("%s  %s  %6i files %5i motion %5i timelapse" % (day, strip, files, events, frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+mediawatch.py - Push new and deleted media to browsers for timolo2-web.py
+
+Browsers open a server-sent events (SSE) connection for the folder they
+are viewing. After the response headers are sent the connection is
+handed to MediaEvents, which keeps it open without using a web server
+worker thread. One thread waits on linux inotify for files created,
+written or deleted in watched folders and sends an event to every
+browser viewing that folder, so server load depends on the number of
+media changes, not on the number of open pages.
+If inotify is not available watched folders are polled every POLL_SEC
+(one scan per changed folder, however many browsers are viewing it).
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+PING_SEC = 15      # Send a comment line this often to detect closed browsers
+POLL_SEC = 2       # Folder check interval if inotify is not available
+SEND_TIMEOUT = 1.0  # Drop a browser that does not accept an event within this time
+
+
+# ------------------------------------------------------------------------------
+class Inotify:
+    '''Minimal linux inotify using ctypes. Raises OSError if not available'''
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path):
+        wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % path)
+        return wd
+
+    def unwatch(self, wd):
+        self.rm_watch(self.fd, wd)
+
+    def read(self):
+        '''Return list of (wd, mask, name) events waiting to be read'''
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + name_len].rstrip(b"\0"))
+            pos += name_len
+            events.append((wd, mask, name))
+        return events
+
+
+# ------------------------------------------------------------------------------
+def scanNames(path):
+    """Return {name: mtime_ns} for folder path. Used when polling"""
+    names = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    names[entry.name] = entry.stat(follow_symlinks=False).st_mtime_ns
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return names
+
+
+# ------------------------------------------------------------------------------
+class MediaEvents:
+    '''
+    Send server-sent events to browsers viewing a folder.
+    format_fn(dir_path, kind, name) returns the event bytes to send for
+    kind "created" or "deleted", or None to skip the change.
+    '''
+
+    def __init__(self, format_fn):
+        self.format_fn = format_fn
+        self.lock = threading.Lock()
+        self.dirs = {}  # dir path -> {"wd": wd, "socks": set(), "names": {}, "mtime": 0}
+        self.wds = {}   # inotify wd -> dir path
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            logging.warning("inotify Not Available. Polling Folders - %s", e)
+            self.inotify = None
+        self.thread = threading.Thread(target=self.update, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def subscribe(self, dir_path, sock):
+        '''Add a browser connection that already received the SSE headers'''
+        dir_path = os.path.abspath(dir_path)
+        sock.settimeout(SEND_TIMEOUT)
+        with self.lock:
+            watched = self.dirs.get(dir_path)
+            if watched is None:
+                watched = {"wd": None, "socks": set(), "names": {}, "mtime": 0}
+                if self.inotify is not None:
+                    watched["wd"] = self.inotify.watch(dir_path)
+                    self.wds[watched["wd"]] = dir_path
+                else:
+                    watched["mtime"] = os.stat(dir_path).st_mtime_ns
+                    watched["names"] = scanNames(dir_path)
+                self.dirs[dir_path] = watched
+            watched["socks"].add(sock)
+
+    def drop(self, dir_path, sock):
+        '''Close a browser connection. Caller holds lock'''
+        watched = self.dirs.get(dir_path)
+        if watched is not None:
+            watched["socks"].discard(sock)
+            if not watched["socks"]:
+                if watched["wd"] is not None:
+                    self.wds.pop(watched["wd"], None)
+                    self.inotify.unwatch(watched["wd"])
+                del self.dirs[dir_path]
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def send(self, dir_path, message):
+        '''Send message to all browsers viewing dir_path. Caller holds lock'''
+        watched = self.dirs.get(dir_path)
+        if watched is None:
+            return
+        for sock in list(watched["socks"]):
+            try:
+                sock.sendall(message)
+            except OSError:
+                self.drop(dir_path, sock)
+
+    def changed(self, dir_path, kind, name):
+        try:
+            message = self.format_fn(dir_path, kind, name)
+        except OSError:
+            return  # file gone again before it could be described
+        if message:
+            with self.lock:
+                self.send(dir_path, message)
+
+    def poll(self):
+        '''Find changes by folder mtime when inotify is not available'''
+        with self.lock:
+            dir_paths = list(self.dirs)
+        for dir_path in dir_paths:
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            with self.lock:
+                watched = self.dirs.get(dir_path)
+                if watched is None or watched["mtime"] == mtime:
+                    continue
+                watched["mtime"] = mtime
+                old_names = watched["names"]
+                watched["names"] = new_names = scanNames(dir_path)
+            for name in set(old_names) - set(new_names):
+                self.changed(dir_path, "deleted", name)
+            for name, name_mtime in new_names.items():
+                if old_names.get(name) != name_mtime:
+                    self.changed(dir_path, "created", name)
+
+    def update(self):
+        '''Thread loop. Wait for folder changes and ping browsers'''
+        last_ping = time.monotonic()
+        while True:
+            if self.inotify is not None:
+                ready, _, _ = select.select([self.inotify.fd], [], [], 1.0)
+                for wd, mask, name in (self.inotify.read() if ready else []):
+                    with self.lock:
+                        dir_path = self.wds.get(wd)
+                    if dir_path is None:
+                        continue
+                    if mask & IN_IGNORED:  # folder deleted. close its browsers
+                        with self.lock:
+                            watched = self.dirs.get(dir_path)
+                            for sock in list(watched["socks"]) if watched else []:
+                                self.drop(dir_path, sock)
+                        continue
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        self.changed(dir_path, "deleted", name)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self.changed(dir_path, "created", name)
+                    elif mask & IN_CREATE and (mask & IN_ISDIR or
+                                               os.path.islink(os.path.join(dir_path, name))):
+                        # folders and recent symlinks are not written and closed
+                        self.changed(dir_path, "created", name)
+            else:
+                time.sleep(POLL_SEC)
+                self.poll()
+            if time.monotonic() - last_ping > PING_SEC:
+                last_ping = time.monotonic()
+                with self.lock:
+                    for dir_path in list(self.dirs):
+                        self.send(dir_path, b": ping\n\n")
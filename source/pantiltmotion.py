@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+pantiltmotion.py - Pantilt servo settle model for pi-timolo2
+
+Estimates how long to wait after a pantilt move from the angular distance
+moved and a speed profile for the pantilt hardware, instead of a fixed
+PANTILT_SLEEP_SEC for every move. Includes a simulated pantilt driver and
+clock so pantilt sequences can be timed without hardware.
+
+Compare fixed sleep and settle model timing for config.py stops
+
+    ./pantiltmotion.py
+"""
+import logging
+
+from pantiltseq import stopDistance, travelOrder
+
+UNKNOWN_TRAVEL_DEG = 180  # Assumed travel when the current position is unknown
+
+# deg_per_sec is loaded servo speed. settle_sec is time to stop oscillating
+SERVO_PROFILES = {
+    "Pimoroni": {"deg_per_sec": 400.0, "settle_sec": 0.05},
+    "Waveshare": {"deg_per_sec": 250.0, "settle_sec": 0.08},
+}
+
+
+# ------------------------------------------------------------------------------
+class ServoModel:
+    '''
+    Settle time model for pantilt servos.
+    settleTime() returns seconds to wait after moving from_pos to to_pos.
+    '''
+
+    def __init__(self, hardware="Pimoroni", deg_per_sec=0, settle_sec=None):
+        profile = SERVO_PROFILES.get(hardware, SERVO_PROFILES["Waveshare"])
+        self.hardware = hardware
+        self.deg_per_sec = deg_per_sec if deg_per_sec > 0 else profile["deg_per_sec"]
+        self.settle_sec = profile["settle_sec"] if settle_sec is None else settle_sec
+
+    def moveTime(self, travel_deg):
+        if travel_deg <= 0:
+            return 0.0
+        return self.settle_sec + travel_deg / self.deg_per_sec
+
+    def settleTime(self, from_pos, to_pos):
+        if from_pos is None:
+            return self.moveTime(UNKNOWN_TRAVEL_DEG)
+        return self.moveTime(stopDistance(from_pos, to_pos))
+
+
+# ------------------------------------------------------------------------------
+class SimClock:
+    '''Simulated clock. sleep() advances time without waiting'''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.now += max(0.0, sec)
+
+
+# ------------------------------------------------------------------------------
+class SimPanTilt:
+    '''
+    Simulated pantilt driver with the same pan() and tilt() calls as the
+    pimoroni and waveshare libraries. Servos move at the model speed so
+    settled() reports if a capture now would be blurred by movement.
+    '''
+
+    def __init__(self, model, clock=None):
+        self.model = model
+        self.clock = clock or SimClock()
+        self.pos = [0, 0]
+        self.done_at = 0.0
+        self.moves = []  # (time, axis, from_deg, to_deg)
+
+    def move(self, axis, deg):
+        now = self.clock.time()
+        travel = abs(deg - self.pos[axis])
+        self.moves.append((now, axis, self.pos[axis], deg))
+        self.pos[axis] = deg
+        if travel > 0:
+            self.done_at = max(self.done_at, now + self.model.moveTime(travel))
+
+    def pan(self, deg):
+        self.move(0, deg)
+
+    def tilt(self, deg):
+        self.move(1, deg)
+
+    def settled(self):
+        return self.clock.time() >= self.done_at
+
+
+# ------------------------------------------------------------------------------
+def timeSequence(stops, model, wait_fn, start_pos=(0, 0), end_pos=None):
+    """
+    Time a pantilt sequence on a SimPanTilt. wait_fn(from_pos, to_pos)
+    returns the wait after each move. Returns (total sec, blurred captures)
+    """
+    clock = SimClock()
+    pantilt = SimPanTilt(model, clock)
+    pantilt.pos = list(start_pos)
+    pos = tuple(start_pos)
+    blurred = 0
+    for i in travelOrder(stops, start_pos, end_pos):
+        pantilt.pan(stops[i][0])
+        pantilt.tilt(stops[i][1])
+        clock.sleep(wait_fn(pos, stops[i]))
+        if not pantilt.settled():
+            blurred += 1
+        pos = stops[i]
+    return clock.time(), blurred
+
+
+# ------------------------------------------------------------------------------
+def main():
+    try:
+        from config import PANTILT_SEQ_STOPS, PANO_CAM_STOPS, PANTILT_SLEEP_SEC, PANTILT_HOME
+    except ImportError:
+        PANTILT_SEQ_STOPS = [(90, 0), (45, 0), (0, 0), (-45, 0), (-90, 0)]
+        PANO_CAM_STOPS = [(-20, 0), (0, 0), (20, 0)]
+        PANTILT_SLEEP_SEC = 0.1
+        PANTILT_HOME = (0, 0)
+    for hardware in SERVO_PROFILES:
+        model = ServoModel(hardware)
+        for name, stops in (("PANTILT_SEQ_STOPS", PANTILT_SEQ_STOPS),
+                            ("PANO_CAM_STOPS", PANO_CAM_STOPS)):
+            fixed = timeSequence(stops, model, lambda a, b: PANTILT_SLEEP_SEC,
+                                 PANTILT_HOME, PANTILT_HOME)
+            modelled = timeSequence(stops, model, model.settleTime,
+                                    PANTILT_HOME, PANTILT_HOME)
+            print("%-9s %-17s fixed %.2f sec (%i blurred)  model %.2f sec (%i blurred)"
+                  % (hardware, name, fixed[0], fixed[1], modelled[0], modelled[1]))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,222 @@
+"""
+pantiltseq.py - Pipelined pantilt image sequences for pi-timolo2
+
+Used by takePantiltSequence() and takePano() when PANTILT_PIPELINE_ON = True.
+The camera is opened and warmed up once for the whole sequence and each
+stop is captured into memory. A writer thread saves and post processes
+the previous image while the servos move to the next stop.
+Stops are visited in the order that needs the least servo travel.
+Set settle_model to a pantiltmotion.ServoModel to wait per distance moved
+and settle_check = True to also wait for still frames on the lores stream.
+File names still follow the configured stop order, so pano images are
+passed to the stitcher in the correct sequence.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+
+WRITE_QUEUE_MAX = 2  # Max captured images waiting to be saved (limits memory)
+BRUTE_FORCE_MAX = 7  # Use exact stop ordering up to this many stops
+LORES_SIZE = (320, 240)  # lores stream size for settle_check
+STILL_DIFF_MAX = 2.0     # Mean lores pixel change between frames when still
+STILL_WAIT_MAX = 1.0     # Max extra seconds waiting for still frames
+
+
+# ------------------------------------------------------------------------------
+def exifData(metadata, model):
+    """
+    Return exif bytes from picamera2 capture metadata. Same main tags as
+    picam2.capture_file() writes so EXIF display and pyexiv2 copies work.
+    """
+    from PIL import Image, TiffImagePlugin
+
+    now = time.strftime("%Y:%m:%d %H:%M:%S")
+    exif = Image.Exif()
+    exif[0x010F] = "Raspberry Pi"  # Make
+    exif[0x0110] = model           # Model
+    exif[0x0132] = now             # DateTime
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0x9003] = now         # DateTimeOriginal
+    if "ExposureTime" in metadata:
+        exif_ifd[0x829A] = TiffImagePlugin.IFDRational(metadata["ExposureTime"], 1000000)
+    gain = metadata.get("AnalogueGain", 1.0) * metadata.get("DigitalGain", 1.0)
+    exif_ifd[0x8827] = int(round(gain * 100))  # ISOSpeedRatings
+    return exif.tobytes()
+
+
+# ------------------------------------------------------------------------------
+def stopDistance(pos_a, pos_b):
+    """
+    Servo travel in degrees between two (pan, tilt) positions.
+    Pan and tilt servos move at the same time so the longest move counts.
+    """
+    return max(abs(pos_a[0] - pos_b[0]), abs(pos_a[1] - pos_b[1]))
+
+
+# ------------------------------------------------------------------------------
+def pathDistance(stops, order, start_pos, end_pos=None):
+    total = 0
+    pos = start_pos
+    for i in order:
+        total += stopDistance(pos, stops[i])
+        pos = stops[i]
+    if end_pos is not None:
+        total += stopDistance(pos, end_pos)
+    return total
+
+
+# ------------------------------------------------------------------------------
+def travelOrder(stops, start_pos, end_pos=None):
+    """
+    Return list of stop indexes that minimises total servo travel from
+    start_pos through all stops and back to end_pos (eg PANTILT_HOME)
+    """
+    indexes = list(range(len(stops)))
+    if len(stops) <= BRUTE_FORCE_MAX:
+        return list(min(itertools.permutations(indexes),
+                        key=lambda order: pathDistance(stops, order, start_pos, end_pos)))
+    # nearest neighbour for long stop lists
+    order = []
+    pos = start_pos
+    while indexes:
+        nearest = min(indexes, key=lambda i: stopDistance(pos, stops[i]))
+        indexes.remove(nearest)
+        order.append(nearest)
+        pos = stops[nearest]
+    return order
+
+
+# ------------------------------------------------------------------------------
+class PantiltSequence:
+    '''
+    Capture a list of pantilt stops with the camera held open.
+    pantilt is the pantilthat module or waveshare PanTilt object.
+    '''
+
+    def __init__(self, pantilt, size=(1280, 720), vflip=False, hflip=False,
+                 settle_sec=0.1, jpg_quality=95):
+        self.pantilt = pantilt
+        self.size = size
+        self.vflip = vflip
+        self.hflip = hflip
+        self.settle_sec = settle_sec
+        self.jpg_quality = jpg_quality
+        self.settle_model = None
+        self.settle_check = False
+        self.sleep = time.sleep  # replace with SimClock.sleep to time without hardware
+        self.picam2 = None
+        self.model = ""  # camera model for exif
+        self.write_queue = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+        self.errors = 0
+
+    def settleTime(self, from_pos, to_pos):
+        '''Seconds to wait for servos to stop after a move'''
+        if self.settle_model is not None:
+            return self.settle_model.settleTime(from_pos, to_pos)
+        return self.settle_sec
+
+    def waitStill(self):
+        '''Wait until lores frames stop changing. Returns False on timeout'''
+        import numpy as np
+
+        lores_h = LORES_SIZE[1]
+        prev = self.picam2.capture_array("lores")[:lores_h].astype(np.int16)
+        start_time = time.time()
+        while time.time() - start_time < STILL_WAIT_MAX:
+            frame = self.picam2.capture_array("lores")[:lores_h].astype(np.int16)
+            if np.mean(np.abs(frame - prev)) < STILL_DIFF_MAX:
+                return True
+            prev = frame
+        logging.warning("Frames Not Still After %.1f sec", STILL_WAIT_MAX)
+        return False
+
+    def moveTo(self, from_pos, to_pos):
+        self.pantilt.pan(to_pos[0])
+        self.pantilt.tilt(to_pos[1])
+        self.sleep(self.settleTime(from_pos, to_pos))
+        if self.settle_check and self.picam2 is not None:
+            self.waitStill()
+
+    def writer(self, post_fn):
+        '''Thread that saves captured images then runs post_fn(file_path)'''
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            image, file_path, metadata = item
+            try:
+                exif = exifData(metadata, self.model)
+                if file_path.lower().endswith((".jpg", ".jpeg")) and self.jpg_quality > 0:
+                    image.save(file_path, quality=self.jpg_quality, exif=exif)
+                else:
+                    image.save(file_path, exif=exif)
+                if post_fn is not None:
+                    post_fn(file_path)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                logging.error("Could Not Save %s - %s", file_path, str(e))
+
+    def run(self, stops, file_paths, exposure_microsec=0, analogue_gain=0,
+            post_fn=None, start_pos=(0, 0), end_pos=None):
+        '''
+        Move to each stop and capture an image to the matching file_paths entry.
+        Returns the final pantilt position.
+        '''
+        from picamera2 import Picamera2
+        from libcamera import Transform
+
+        start_time = time.time()
+        order = travelOrder(stops, start_pos, end_pos)
+        logging.info("Stop Order %s Travel %i deg (was %i deg)",
+                     [i + 1 for i in order],
+                     pathDistance(stops, order, start_pos, end_pos),
+                     pathDistance(stops, range(len(stops)), start_pos, end_pos))
+        thread = threading.Thread(target=self.writer, args=(post_fn,))
+        thread.daemon = True
+        thread.start()
+        pos = start_pos
+        picam2 = Picamera2()
+        try:
+            lores = {"size": LORES_SIZE} if self.settle_check else None
+            config = picam2.create_still_configuration(
+                {"size": self.size}, lores=lores,
+                transform=Transform(vflip=self.vflip, hflip=self.hflip))
+            picam2.configure(config)
+            if exposure_microsec > 0:
+                picam2.set_controls({"ExposureTime": exposure_microsec,
+                                     "AnalogueGain": analogue_gain,
+                                     "FrameDurationLimits": (exposure_microsec,
+                                                             exposure_microsec)})
+            # first move overlaps camera start and warm up
+            self.pantilt.pan(stops[order[0]][0])
+            self.pantilt.tilt(stops[order[0]][1])
+            picam2.start()
+            self.picam2 = picam2
+            self.model = picam2.camera_properties.get("Model", "")
+            # same warm up as takeImage() so exposure has settled
+            warm_up = 4 if analogue_gain < 1 else analogue_gain
+            self.sleep(max(warm_up, self.settleTime(pos, stops[order[0]])))
+            pos = stops[order[0]]
+            for seq, i in enumerate(order):
+                if seq > 0:
+                    self.moveTo(pos, stops[i])
+                    pos = stops[i]
+                # keep the metadata for exif since the image is saved by PIL
+                request = picam2.capture_request()
+                try:
+                    image = request.make_image("main")
+                    metadata = request.get_metadata()
+                finally:
+                    request.release()
+                logging.info("pan_x=%i tilt_y=%i %s", pos[0], pos[1], file_paths[i])
+                # writer saves this image while servos move to next stop
+                self.write_queue.put((image, file_paths[i], metadata))
+        finally:
+            self.picam2 = None
+            picam2.close()
+            self.write_queue.put(None)
+            thread.join()
+        logging.info("%i Stops in %.1f sec", len(stops), time.time() - start_time)
+        return pos
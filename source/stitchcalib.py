@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+stitchcalib.py - Calibrated fixed stop pano stitching for pi-timolo2
+
+PANO_CAM_STOPS are fixed pantilt positions, so the warp between the
+images of every pano is the same. The first run detects features,
+computes a homography per stop relative to the middle image plus
+feathered seam masks and caches them in a calibration file keyed by the
+stop set and image size. Later panos are only warped and blended.
+
+If the calibration residual (px reprojection error) is above
+--max-residual, or the blended overlap areas no longer match
+(--max-diff mean gray levels, eg camera was bumped) a new calibration is
+attempted. If that fails the full image-stitching program is run instead.
+
+Used by stitchqueue.py when PANO_CALIB_ON = True eg
+
+    ./stitchcalib.py --calib data/pano-calib.npz --fallback /usr/local/bin/image-stitching \
+                     media/pano/panos/pano-1000.jpg pano-1000-1.jpg pano-1000-2.jpg pano-1000-3.jpg
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+CALIB_FILE = "data/pano-calib.npz"
+MATCH_RATIO = 0.75     # Lowe ratio test for feature matches
+MIN_MATCHES = 12       # Minimum good matches between neighbouring images
+FEATHER_PX = 40        # Width of blend transition at seams
+CHECK_SCALE = 0.25     # Image scale used to check overlap mismatch
+MAX_CANVAS_SCALE = 6   # Reject homographies that blow up the canvas
+BAND_ROWS = 128        # Canvas rows blended at a time when saving a pano
+
+
+# ------------------------------------------------------------------------------
+def pairHomography(img_dst, img_src):
+    """
+    Return homography that maps img_src onto img_dst and its mean
+    inlier reprojection error in px. (None, inf) if not enough matches.
+    """
+    if hasattr(cv2, "SIFT_create"):
+        detector = cv2.SIFT_create()
+        norm = cv2.NORM_L2
+    else:
+        detector = cv2.ORB_create(4000)
+        norm = cv2.NORM_HAMMING
+    gray_dst = cv2.cvtColor(img_dst, cv2.COLOR_BGR2GRAY)
+    gray_src = cv2.cvtColor(img_src, cv2.COLOR_BGR2GRAY)
+    kp_dst, des_dst = detector.detectAndCompute(gray_dst, None)
+    kp_src, des_src = detector.detectAndCompute(gray_src, None)
+    if des_dst is None or des_src is None:
+        return None, float("inf")
+    matches = cv2.BFMatcher(norm).knnMatch(des_src, des_dst, k=2)
+    good = [pair[0] for pair in matches
+            if len(pair) == 2 and pair[0].distance < MATCH_RATIO * pair[1].distance]
+    if len(good) < MIN_MATCHES:
+        return None, float("inf")
+    src_pts = np.float32([kp_src[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+    dst_pts = np.float32([kp_dst[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+    homography, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 4.0)
+    if homography is None:
+        return None, float("inf")
+    inliers = mask.ravel() == 1
+    projected = cv2.perspectiveTransform(src_pts[inliers], homography)
+    residual = float(np.mean(np.linalg.norm(projected - dst_pts[inliers], axis=2)))
+    return homography, residual
+
+
+# ------------------------------------------------------------------------------
+def calibrate(images, key):
+    """
+    Compute warps and seam masks for a list of images. Returns a calibration
+    dict or None if the images could not be registered.
+    """
+    ref = len(images) // 2
+    homographies = [None] * len(images)
+    homographies[ref] = np.eye(3)
+    residuals = []
+    for i in list(range(ref + 1, len(images))) + list(range(ref - 1, -1, -1)):
+        neighbour = i - 1 if i > ref else i + 1
+        pair, residual = pairHomography(images[neighbour], images[i])
+        if pair is None:
+            logging.warning("Not Enough Feature Matches for Image %i", i + 1)
+            return None
+        homographies[i] = homographies[neighbour] @ pair
+        residuals.append(residual)
+    # find canvas that holds all warped images
+    corners = []
+    for img, homography in zip(images, homographies):
+        h, w = img.shape[:2]
+        pts = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        corners.append(cv2.perspectiveTransform(pts, homography))
+    corners = np.concatenate(corners)
+    x_min, y_min = np.floor(corners.min(axis=(0, 1))).astype(int)
+    x_max, y_max = np.ceil(corners.max(axis=(0, 1))).astype(int)
+    canvas_w, canvas_h = int(x_max - x_min), int(y_max - y_min)
+    img_h, img_w = images[ref].shape[:2]
+    if canvas_w > img_w * MAX_CANVAS_SCALE or canvas_h > img_h * MAX_CANVAS_SCALE:
+        logging.warning("Rejected Calibration. Canvas %ix%i Too Large", canvas_w, canvas_h)
+        return None
+    shift = np.array([[1, 0, -x_min], [0, 1, -y_min], [0, 0, 1]], dtype=np.float64)
+    homographies = np.stack([shift @ homography for homography in homographies])
+    # feathered seam masks. Each canvas px is weighted by distance to image edge
+    dists = []
+    for img, homography in zip(images, homographies):
+        valid = np.full(img.shape[:2], 255, dtype=np.uint8)
+        warped = cv2.warpPerspective(valid, homography, (canvas_w, canvas_h))
+        dists.append(cv2.distanceTransform(warped, cv2.DIST_L2, 3))
+    dists = np.stack(dists)
+    owner = np.argmax(dists, axis=0)
+    weights = []
+    for i in range(len(images)):
+        seam = (owner == i).astype(np.float32)
+        seam = cv2.blur(seam, (FEATHER_PX, FEATHER_PX)) * (dists[i] > 0)
+        weights.append(seam)
+    weights = np.stack(weights)
+    total = weights.sum(axis=0)
+    total[total == 0] = 1.0
+    weights = np.round(weights / total * 255).astype(np.uint8)
+    residual = float(max(residuals)) if residuals else 0.0
+    logging.info("Calibrated %i Images Canvas %ix%i Residual %.2f px",
+                 len(images), canvas_w, canvas_h, residual)
+    return {"key": np.array(key), "homographies": homographies,
+            "weights": weights, "residual": np.array(residual),
+            "image_size": np.array([img_w, img_h])}
+
+
+# ------------------------------------------------------------------------------
+def loadCalib(calib_path, key):
+    """Return cached calibration dict if it exists and matches key"""
+    try:
+        with np.load(calib_path) as data:
+            calib = {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+    if str(calib["key"]) != key:
+        logging.info("Calibration Key Changed. Recalibrate")
+        return None
+    return calib
+
+
+# ------------------------------------------------------------------------------
+def saveCalib(calib_path, calib):
+    calib_dir = os.path.dirname(calib_path)
+    if calib_dir and not os.path.isdir(calib_dir):
+        os.makedirs(calib_dir)
+    tmp_path = calib_path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **calib)
+    os.replace(tmp_path, calib_path)
+
+
+# ------------------------------------------------------------------------------
+def overlapDiff(images, calib):
+    """Mean gray level difference where warped images overlap (reduced scale)"""
+    scale = np.diag([CHECK_SCALE, CHECK_SCALE, 1.0])
+    h, w = calib["weights"].shape[1:]
+    size = (int(w * CHECK_SCALE), int(h * CHECK_SCALE))
+    warped = []
+    for img, homography in zip(images, calib["homographies"]):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        valid = np.full(gray.shape, 255, dtype=np.uint8)
+        warped.append((cv2.warpPerspective(gray, scale @ homography, size).astype(np.float32),
+                       cv2.warpPerspective(valid, scale @ homography, size) > 0))
+    diffs = []
+    for (gray_a, valid_a), (gray_b, valid_b) in zip(warped, warped[1:]):
+        both = valid_a & valid_b
+        if both.any():
+            diffs.append(float(np.mean(np.abs(gray_a[both] - gray_b[both]))))
+    return max(diffs) if diffs else 0.0
+
+
+# ------------------------------------------------------------------------------
+def assemble(images, calib, pano_path):
+    """
+    Warp and blend images onto the calibrated canvas and save pano_path.
+    The canvas is blended in bands of BAND_ROWS rows so memory use stays
+    near the size of the saved uint8 pano even for many full size stops.
+    """
+    weights = calib["weights"]
+    # crop to area covered by all rows/cols with image data
+    coverage = weights.any(axis=0)
+    rows = np.where(coverage.any(axis=1))[0]
+    cols = np.where(coverage.any(axis=0))[0]
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = cols[0], cols[-1] + 1
+    pano = np.empty((bottom - top, right - left, 3), dtype=np.uint8)
+    for band_top in range(top, bottom, BAND_ROWS):
+        band_bottom = min(band_top + BAND_ROWS, bottom)
+        size = (right - left, band_bottom - band_top)
+        shift = np.array([[1.0, 0.0, -left], [0.0, 1.0, -band_top], [0.0, 0.0, 1.0]])
+        band = np.zeros((size[1], size[0], 3), dtype=np.uint32)
+        for img, homography, weight in zip(images, calib["homographies"], weights):
+            band_weight = weight[band_top:band_bottom, left:right]
+            if not band_weight.any():
+                continue
+            warped = cv2.warpPerspective(img, shift @ homography, size)
+            band += np.multiply(warped, band_weight[..., None], dtype=np.uint32)
+        # weights are 0-255 so divide back to 0-255 pixel values with rounding
+        pano[band_top - top:band_bottom - top] = np.minimum((band + 127) // 255, 255)
+    return cv2.imwrite(pano_path, pano)
+
+
+# ------------------------------------------------------------------------------
+def stitchPano(pano_path, image_paths, calib_path, key, max_residual, max_diff):
+    """
+    Assemble pano_path using cached calibration, recalibrating if required.
+    Returns True if the pano was saved, False if full stitching is needed.
+    """
+    images = [cv2.imread(path) for path in image_paths]
+    if any(img is None for img in images):
+        logging.error("Could Not Read Pano Images %s", " ".join(image_paths))
+        return False
+    calib = loadCalib(calib_path, key)
+    if calib is not None and len(calib["homographies"]) != len(images):
+        calib = None
+    if calib is not None:
+        diff = overlapDiff(images, calib)
+        if diff > max_diff:
+            logging.warning("Overlap Mismatch %.1f > %.1f. Recalibrate", diff, max_diff)
+            calib = None
+    if calib is None:
+        calib = calibrate(images, key)
+        if calib is None or float(calib["residual"]) > max_residual:
+            logging.warning("Calibration Failed or Residual Above %.1f px", max_residual)
+            return False
+        saveCalib(calib_path, calib)
+    return assemble(images, calib, pano_path)
+
+
+# ------------------------------------------------------------------------------
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(funcName)-10s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(description="pi-timolo2 calibrated pano stitching")
+    parser.add_argument("--calib", default=CALIB_FILE, help="calibration cache file")
+    parser.add_argument("--key", default="", help="stop set and image size key")
+    parser.add_argument("--max-residual", type=float, default=3.0)
+    parser.add_argument("--max-diff", type=float, default=30.0)
+    parser.add_argument("--fallback", help="full stitching program eg image-stitching")
+    parser.add_argument("pano_path")
+    parser.add_argument("image_paths", nargs="+")
+    args = parser.parse_args()
+    start_time = time.time()
+    if stitchPano(args.pano_path, args.image_paths, args.calib, args.key,
+                  args.max_residual, args.max_diff):
+        logging.info("Saved %s in %.1f sec", args.pano_path, time.time() - start_time)
+        sys.exit(0)
+    if args.fallback:
+        logging.info("Fallback to Full Stitching %s", args.fallback)
+        os.execv(args.fallback, [args.fallback, args.pano_path] + args.image_paths)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+stitchqueue.py - Bounded pano image stitching job queue for pi-timolo2
+
+takePano() adds a job for each set of pano images. Jobs are run by a
+background thread with at most PANO_STITCH_MAX_JOBS image-stitching
+processes at once, at a lower cpu priority and only when enough memory
+is available. Pending jobs are saved to a json file so they survive a
+restart. When the queue is full the oldest pending job is dropped and
+jobs older than PANO_STITCH_STALE_SEC are discarded.
+
+Display queue status and recent job timings
+
+    ./stitchqueue.py
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from sysinfo import memAvailableMB
+
+QUEUE_FILE = "data/pano-queue.json"
+HISTORY_MAX = 20  # Number of finished jobs kept for status timings
+
+
+# ------------------------------------------------------------------------------
+def pidRunning(pid, pano_path):
+    """
+    Return True if stitch process pid is still running for pano_path.
+    The command line is checked so a reused pid is not mistaken for the job.
+    """
+    if not pid:
+        return False
+    try:
+        with open("/proc/%i/cmdline" % pid, "rb") as f:
+            return pano_path.encode() in f.read().split(b"\0")
+    except FileNotFoundError:
+        return False
+    except OSError:  # no /proc. Only check the pid exists
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+
+
+# ------------------------------------------------------------------------------
+def readQueueFile(queue_path):
+    """Return saved queue dict or an empty queue"""
+    try:
+        with open(queue_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"pending": [], "running": [], "history": []}
+
+
+# ------------------------------------------------------------------------------
+class StitchQueue:
+    '''
+    Run pano image stitching jobs in the background with a concurrency
+    limit, niceness and memory guard.
+    '''
+
+    def __init__(self, prog_path, queue_path=QUEUE_FILE, max_jobs=1, nice=10,
+                 min_mem_mb=250, queue_max=3, stale_sec=3600):
+        # prog_path may be a list eg calibrated stitcher command and options
+        if isinstance(prog_path, (list, tuple)):
+            self.prog_cmd = list(prog_path)
+        else:
+            self.prog_cmd = [prog_path]
+        self.prog_path = self.prog_cmd[0]
+        self.queue_path = queue_path
+        self.max_jobs = max(1, max_jobs)
+        self.nice = nice
+        self.min_mem_mb = min_mem_mb
+        self.queue_max = max(1, queue_max)
+        self.stale_sec = stale_sec
+        self.lock = threading.Lock()
+        self.running = {}  # Popen -> job dict
+        self.orphans = []  # jobs still running from before a restart
+        saved = readQueueFile(queue_path)
+        self.pending = saved.get("pending", [])
+        self.history = saved.get("history", [])
+        # jobs that were running when the program stopped are run again
+        # unless their stitch process outlived the restart
+        for job in reversed(saved.get("running", [])):
+            if pidRunning(job.get("pid"), job["pano"]):
+                logging.info("Stitch Still Running pid=%i %s", job["pid"], job["pano"])
+                self.orphans.append(job)
+            else:
+                self.pending.insert(0, job)
+        if self.pending:
+            logging.info("Restored %i Pending Stitch Jobs from %s",
+                         len(self.pending), queue_path)
+        self.save()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.update, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def addJob(self, pano_path, image_paths):
+        '''Queue a stitch of image_paths into pano_path'''
+        job = {"pano": pano_path, "images": list(image_paths),
+               "queued": time.time()}
+        with self.lock:
+            while len(self.pending) >= self.queue_max:
+                dropped = self.pending.pop(0)
+                logging.warning("Stitch Queue Full. Dropped %s", dropped["pano"])
+            self.pending.append(job)
+            self.save()
+        logging.info("Queued %s  pending=%i running=%i",
+                     pano_path, len(self.pending), self.numRunning())
+
+    def status(self):
+        '''Return dict of pending, running jobs and recent job timings'''
+        with self.lock:
+            return self.snapshot()
+
+    def snapshot(self):
+        return {"pending": self.pending,
+                "running": list(self.running.values()) + self.orphans,
+                "history": self.history}
+
+    def save(self):
+        '''Write queue to queue_path. Caller holds lock'''
+        tmp_path = self.queue_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=1)
+            os.replace(tmp_path, self.queue_path)
+        except OSError as e:
+            logging.warning("Could Not Save %s - %s", self.queue_path, str(e))
+
+    def lowPriority(self):
+        try:
+            os.nice(self.nice)
+        except OSError:
+            pass
+
+    def startJob(self, job):
+        '''Start image-stitching for job. Caller holds lock'''
+        cmd = self.prog_cmd + [job["pano"]] + job["images"]
+        logging.info("Start %s", " ".join(cmd))
+        try:
+            # own session so stopping timolo2-cam.py does not stop the stitch
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, close_fds=True,
+                                    preexec_fn=self.lowPriority, start_new_session=True)
+        except OSError as e:
+            logging.error("Failed to Start %s - %s", self.prog_path, str(e))
+            job["returncode"] = None
+            self.finishJob(job)
+            return
+        job["started"] = time.time()
+        job["pid"] = proc.pid
+        self.running[proc] = job
+
+    def numRunning(self):
+        return len(self.running) + len(self.orphans)
+
+    def finishJob(self, job):
+        '''Move job to history with timings. Caller holds lock'''
+        job["finished"] = time.time()
+        job["wait_sec"] = round(job.get("started", job["finished"]) - job["queued"], 1)
+        job["stitch_sec"] = round(job["finished"] - job.get("started", job["finished"]), 1)
+        self.history = (self.history + [job])[-HISTORY_MAX:]
+
+    def update(self):
+        '''Thread loop. Reap finished jobs and start pending ones'''
+        while not self.stopped:
+            with self.lock:
+                changed = False
+                for proc, job in list(self.running.items()):
+                    if proc.poll() is not None:
+                        del self.running[proc]
+                        job["returncode"] = proc.returncode
+                        self.finishJob(job)
+                        changed = True
+                        if proc.returncode == 0:
+                            logging.info("Stitched %s in %.1f sec",
+                                         job["pano"], job["stitch_sec"])
+                        else:
+                            logging.error("Stitch Failed rc=%i %s",
+                                          proc.returncode, job["pano"])
+                for job in self.orphans[:]:
+                    if not pidRunning(job.get("pid"), job["pano"]):
+                        # not our child so the exit status is unknown
+                        self.orphans.remove(job)
+                        job["returncode"] = None
+                        self.finishJob(job)
+                        changed = True
+                        logging.info("Stitch pid=%i Ended %s", job["pid"], job["pano"])
+                now = time.time()
+                for job in self.pending[:]:
+                    stale = self.stale_sec > 0 and now - job["queued"] > self.stale_sec
+                    missing = not all(os.path.isfile(path) for path in job["images"])
+                    if stale or missing:
+                        logging.warning("Drop %s Stitch Job %s",
+                                        "Stale" if stale else "Missing Images", job["pano"])
+                        self.pending.remove(job)
+                        changed = True
+                while self.pending and self.numRunning() < self.max_jobs:
+                    mem_mb = memAvailableMB()
+                    if mem_mb is not None and mem_mb < self.min_mem_mb:
+                        break  # wait for memory to be freed
+                    self.startJob(self.pending.pop(0))
+                    changed = True
+                if changed:
+                    self.save()
+            time.sleep(1)
+
+    def stop(self):
+        '''Stop the queue thread. Running stitch processes are left to finish'''
+        self.stopped = True
+
+
+# ------------------------------------------------------------------------------
+def printStatus(queue_path=QUEUE_FILE):
+    status = readQueueFile(queue_path)
+    print("Pano Stitch Queue %s" % queue_path)
+    for job in status.get("running", []):
+        print("  RUNNING  %s for %.0f sec" % (job["pano"], time.time() - job.get("started", time.time())))
+    for job in status.get("pending", []):
+        print("  PENDING  %s queued %.0f sec ago" % (job["pano"], time.time() - job["queued"]))
+    for job in status.get("history", []):
+        print("  DONE     %s rc=%s wait=%ss stitch=%ss" % (
+            job["pano"], job.get("returncode"), job.get("wait_sec"), job.get("stitch_sec")))
+
+
+if __name__ == "__main__":
+    printStatus(sys.argv[1] if len(sys.argv) > 1 else QUEUE_FILE)
@@ -23,6 +23,8 @@ class CamStream:
         # add code to process stream image arrays.
     '''
 
+    publisher = None  # optional liveview.FramePublisher for timolo2-web.py live view
+
     def __init__(self, size=(320, 248), vflip=False, hflip=False):
         self.size = size
         self.vflip = vflip
@@ -100,6 +102,8 @@ Wait ...
     def read(self):
         '''return the frame array data'''
         self.frame = self.picam2.capture_array("main")
+        if self.publisher is not None:
+            self.publisher.publish(self.frame)
         return self.frame
 
     def stop(self):
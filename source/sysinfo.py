@@ -0,0 +1,20 @@
+"""
+sysinfo.py - System resource helpers shared by pi-timolo2 modules
+
+Used by tlvideo.py to size the batch encode pool and by stitchqueue.py
+to hold pano stitching until enough memory is free, so neither depends
+on the other.
+"""
+
+
+# ------------------------------------------------------------------------------
+def memAvailableMB():
+    """Return MemAvailable from /proc/meminfo in MB or None"""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
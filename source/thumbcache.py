@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+thumbcache.py - On demand image thumbnails for timolo2-web.py
+
+Thumbnails are decoded at reduced scale so a full size jpg is never fully
+decoded. PIL Image.draft() lets the jpeg decoder scale by 1/2, 1/4 or 1/8
+and cv2 IMREAD_REDUCED_COLOR_* is used if PIL is not installed.
+Results are saved in a disk cache keyed by source path, mtime, size and
+width. The least recently used thumbnails are deleted when the cache is
+larger than max_mb. Requests for a thumbnail already being made wait for
+that result instead of decoding the image again.
+
+Make a thumbnail from the command line
+
+    ./thumbcache.py media/motion/mo-1000.jpg 320
+"""
+import collections
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+THUMB_QUALITY = 80
+THUMB_WIDTH_MIN = 32
+THUMB_WIDTH_MAX = 1280
+
+
+# ------------------------------------------------------------------------------
+def makeThumbPIL(src_path, thumb_path, width):
+    with Image.open(src_path) as img:
+        # jpeg decoder scales by 1/2, 1/4 or 1/8 while still at least width
+        img.draft("RGB", (width, max(1, img.height * width // max(1, img.width))))
+        img = img.convert("RGB")
+        img.thumbnail((width, img.height), Image.BILINEAR)
+        img.save(thumb_path, "JPEG", quality=THUMB_QUALITY)
+
+
+# ------------------------------------------------------------------------------
+def makeThumbCV2(src_path, thumb_path, width):
+    img = None
+    for flag in (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_COLOR_4,
+                 cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_COLOR):
+        img = cv2.imread(src_path, flag)
+        if img is None:
+            raise OSError("cv2 Could Not Read %s" % src_path)
+        if img.shape[1] >= width:
+            break
+    if img.shape[1] > width:
+        height = max(1, img.shape[0] * width // img.shape[1])
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    if not cv2.imwrite(thumb_path, img, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY]):
+        raise OSError("cv2 Could Not Write %s" % thumb_path)
+
+
+# ------------------------------------------------------------------------------
+class ThumbCache:
+    '''
+    Size bounded LRU disk cache of jpg thumbnails.
+    get() returns the thumbnail path, making it if required.
+    '''
+
+    def __init__(self, cache_dir, max_mb=100):
+        if Image is None and cv2 is None:
+            raise ImportError("ThumbCache requires PIL or cv2")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.in_flight = {}  # thumb name -> threading.Event
+        self.entries = collections.OrderedDict()  # thumb name -> bytes. oldest first
+        self.total_bytes = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        found = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp.jpg"):
+                    os.remove(entry.path)  # left by an interrupted thumbnail
+                elif entry.name.endswith(".jpg") and entry.is_file():
+                    st = entry.stat()
+                    found.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def thumbName(self, src_path, st, width):
+        key = "%s:%i:%i:%i" % (os.path.abspath(src_path), st.st_mtime_ns, st.st_size, width)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg"
+
+    def evict(self):
+        '''Delete least recently used thumbnails over max size. Caller holds lock'''
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def get(self, src_path, width):
+        '''Return thumbnail path for src_path scaled to width px'''
+        width = min(max(width, THUMB_WIDTH_MIN), THUMB_WIDTH_MAX)
+        st = os.stat(src_path)
+        name = self.thumbName(src_path, st, width)
+        thumb_path = os.path.join(self.cache_dir, name)
+        while True:
+            with self.lock:
+                if name in self.entries:
+                    self.entries.move_to_end(name)
+                    try:
+                        # access time keeps lru order over restarts. mtime (etag) unchanged
+                        os.utime(thumb_path, ns=(time.time_ns(), os.stat(thumb_path).st_mtime_ns))
+                        return thumb_path
+                    except OSError:  # deleted outside the cache
+                        self.total_bytes -= self.entries.pop(name)
+                event = self.in_flight.get(name)
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[name] = event
+                    break
+            event.wait()  # another request is making this thumbnail
+            with self.lock:
+                if name not in self.entries:
+                    raise OSError("Thumbnail Failed for %s" % src_path)
+        try:
+            tmp_path = thumb_path[:-4] + ".tmp.jpg"
+            start_time = time.time()
+            try:
+                if Image is not None:
+                    makeThumbPIL(src_path, tmp_path, width)
+                else:
+                    makeThumbCV2(src_path, tmp_path, width)
+                os.replace(tmp_path, thumb_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            logging.debug("Thumb %s w=%i in %.3f sec", src_path, width, time.time() - start_time)
+            with self.lock:
+                size = os.path.getsize(thumb_path)
+                self.entries[name] = size
+                self.total_bytes += size
+                self.evict()
+            return thumb_path
+        finally:
+            with self.lock:
+                self.in_flight.pop(name).set()
+
+
+# ------------------------------------------------------------------------------
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: %s image_path [width]" % sys.argv[0])
+        sys.exit(1)
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 320
+    cache = ThumbCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "thumbs"))
+    start_time = time.time()
+    thumb_path = cache.get(sys.argv[1], width)
+    print("Made %s in %.3f sec" % (thumb_path, time.time() - start_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ PROG_VER = "ver 13.19"  # Requires Latest 13.13 release of config.py
 __version__ = PROG_VER  # May test for version number at a future time
 import logging
 import os
+import time
+PROG_START = time.monotonic()  # Used to report startup time
 os.environ["LIBCAMERA_LOG_LEVELS"]="FATAL"
 WARN_ON = False  # Add short delay to review warning messages
 my_path = os.path.abspath(__file__)  # Find the full path of this python script
@@ -33,18 +35,12 @@ print("Loading Wait ....")
 import datetime
 import sys
 import subprocess
-import shutil
 import glob
-import time
+import json
 import math
 import numpy as np
-from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
-from picamera2.encoders import H264Encoder, Quality
-from picamera2.outputs import FfmpegOutput
-from picamera2 import Picamera2, Preview
-from libcamera import controls, Transform
+from picamera2 import Picamera2
+from libcamera import Transform
 
 # Disable picamera2 and libcamera logging. Some DEBUG messages may still appear
 logging.getLogger('picamera2').setLevel(logging.CRITICAL)
@@ -65,26 +61,6 @@ except ImportError:
     MOTION_START_AT = ""
     VIDEO_START_AT = ""
 
-# Attempt to import pyexiv2.  Note python3 can be a problem
-try:
-    # pyexiv2 Transfers image exif data to writeTextToImage
-    # For python3 install of pyexiv2 lib
-    # See https://github.com/pageauc/pi-timolo/issues/79
-    # Bypass pyexiv2 if library Not Found
-    import pyexiv2
-except ImportError:
-    print("WARN  : Could Not Import pyexiv2. Required for Saving Image EXIF meta data")
-    print(
-        "        If Running under python3 then Install pyexiv2 library for python3 per"
-    )
-    print("      sudo apt install python3-py3exiv2 -y")
-    WARN_ON = True
-except OSError as e:
-    print("WARN  : Could Not import python3 pyexiv2 due to an Operating System Error")
-    print(f"        {str(e)}")
-    print("        Camera images will be missing exif meta data")
-    WARN_ON = True
-
 """
 This is a dictionary of the default settings for pi-timolo.py
 If you don't want to use a config.py file these will create the required
@@ -121,6 +97,10 @@ default_settings = {
     "STREAM_HEIGHT": 240,
     "STREAM_FPS": 20,
     "STREAM_STOP_SEC": 0.7,
+    "LIVE_VIEW_ON": False,
+    "LIVE_VIEW_FPS": 5,
+    "ROLLUP_ON": True,
+    "CONFIG_RELOAD_ON": True,
     "SHOW_DATE_ON_IMAGE": True,
     "SHOW_TEXT_FONT_SIZE": 18,
     "SHOW_TEXT_BOTTOM": True,
@@ -144,6 +124,13 @@ default_settings = {
     "TIMELAPSE_SUBDIR_MAX_HOURS": 0,
     "TIMELAPSE_RECENT_MAX": 200,
     "TIMELAPSE_RECENT_DIR": "media/recent/timelapse",
+    "TIMELAPSE_SEGMENT_ON": False,
+    "TIMELAPSE_SEGMENT_FRAMES": 60,
+    "TIMELAPSE_SEGMENT_DIR": "media/timelapse-segments",
+    "TIMELAPSE_SEGMENT_VIDEO_DIR": "media/videos",
+    "TIMELAPSE_SEGMENT_PREFIX": "TL-",
+    "TIMELAPSE_SEGMENT_FPS": 10,
+    "TIMELAPSE_SEGMENT_SIZE": "1280x720",
     "MOTION_TRACK_ON": True,
     "MOTION_TRACK_QUICK_PIC_ON": False,
     "MOTION_TRACK_INFO_ON": True,
@@ -159,6 +146,7 @@ default_settings = {
     "MOTION_VIDEO_WIDTH": 640,
     "MOTION_VIDEO_HEIGHT": 480,
     "MOTION_VIDEO_TIMER_SEC": 10,
+    "VIDEO_MP4_MODE": "frag",
     "MOTION_TRACK_MINI_TL_ON": False,
     "MOTION_TRACK_MINI_TL_SEQ_SEC": 20,
     "MOTION_TRACK_MINI_TL_TIMER_SEC": 4,
@@ -188,6 +176,11 @@ default_settings = {
     "PANTILT_ON": False,
     "PANTILT_IS_PIMORONI": False,
     "PANTILT_HOME": (0, -10),
+    "PANTILT_SLEEP_SEC": 0.1,
+    "PANTILT_PIPELINE_ON": False,
+    "PANTILT_SETTLE_MODEL_ON": False,
+    "PANTILT_SPEED_DEG_SEC": 0,
+    "PANTILT_SETTLE_CHECK_ON": False,
     "PANTILT_SEQ_ON": False,
     "PANTILT_SEQ_TIMER_SEC": 600,
     "PANTILT_SEQ_IMAGES_DIR": "media/pantilt_seq",
@@ -220,6 +213,14 @@ default_settings = {
         (0, 10),
         (-36, 10),
     ],
+    "PANO_STITCH_MAX_JOBS": 1,
+    "PANO_STITCH_NICE": 10,
+    "PANO_STITCH_MIN_MEM_MB": 250,
+    "PANO_STITCH_QUEUE_MAX": 3,
+    "PANO_STITCH_STALE_SEC": 3600,
+    "PANO_CALIB_ON": False,
+    "PANO_CALIB_MAX_RESIDUAL": 3.0,
+    "PANO_CALIB_MAX_DIFF": 30,
     "SPACE_TIMER_HOURS": 0,
     "SPACE_TARGET_MB": 500,
     "SPACE_MEDIA_DIR": "/home/pi/pi-timolo2/media",
@@ -230,11 +231,20 @@ default_settings = {
     "WEB_PAGE_REFRESH_ON": True,
     "WEB_PAGE_REFRESH_SEC": "900",
     "WEB_PAGE_BLANK_ON": False,
+    "WEB_SERVER_WORKERS": 8,
+    "WEB_CONN_TIMEOUT_SEC": 15,
+    "WEB_STATUS_TTL_SEC": 10,
+    "WEB_MEDIA_MAX_AGE_SEC": 3600,
+    "WEB_THUMB_CACHE_MB": 100,
+    "WEB_EVENTS_ON": True,
+    "WEB_MEDIA_INDEX_ON": True,
+    "WEB_CALENDAR_DAYS": 28,
     "WEB_IMAGE_HEIGHT": "768",
     "WEB_IFRAME_WIDTH_PERCENT": "70%",
     "WEB_IFRAME_WIDTH": "100%",
     "WEB_IFRAME_HEIGHT": "100%",
     "WEB_MAX_LIST_ENTRIES": 0,
+    "WEB_LIST_PAGE_SIZE": 200,
     "WEB_LIST_HEIGHT": "768",
     "WEB_LIST_BY_DATETIME_ON": True,
     "WEB_LIST_SORT_DESC_ON": True,
@@ -283,11 +293,9 @@ Check if variables were imported from config.py. If not create variable using
 the values in the default_settings dictionary above.
 """
 for key, val in default_settings.items():
-    try:
-        exec(key)
-    except NameError:
+    if key not in globals():
         print("WARN  : config.py Variable Not Found. Setting " + key + " = " + str(val))
-        exec(key + "=val")
+        globals()[key] = val
         WARN_ON = True
 
 # Setup logging per config.py variables.
@@ -313,6 +321,81 @@ else:
     )
 logging.info("picamera2 and libcamera logging Disabled.")
 logging.warning("Some DEBUG messages may still appear.")
+
+# ------------------------------------------------------------------------------
+def pluginPaths(plugin_name):
+    """
+    Return plugin file paths for PLUGIN_NAME. Several plugins can be
+    layered in order with a comma separated list eg "shopcam, pano"
+    Later plugins override earlier ones.
+    """
+    if isinstance(plugin_name, str):
+        plugin_name = plugin_name.split(",")
+    paths = []
+    for name in plugin_name:
+        name = name.strip()
+        if name.endswith(".py"):
+            name = name[:-3]  # Remove .py extension
+        if name:
+            paths.append(os.path.join(base_dir, "plugins", name + ".py"))
+    return paths
+
+
+# Check if plugins are on and load their variable overlays in memory.
+# Nothing is copied or compiled to the plugins folder.
+if PLUGIN_ON:
+    from configreload import readSettings, checkSettings, settingsDiff
+    plugin_dir = os.path.join(base_dir, "plugins")
+    known_settings = {key: val for key, val in globals().items()
+                      if key.isupper() and not key.startswith("_")}
+    plugin_settings = dict(known_settings)
+    for plugin_path in pluginPaths(PLUGIN_NAME):
+        logging.info("pluginEnabled - loading PLUGIN_NAME %s ", plugin_path)
+        if not os.path.isdir(plugin_dir):
+            logging.error("plugin Directory Not Found at %s", plugin_dir)
+            logging.error("Rerun github curl install script to install plugins")
+            logging.error(
+                "https://github.com/pageauc/pi-timolo/wiki/"
+                "How-to-Install-or-Upgrade#quick-install"
+            )
+            logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
+            sys.exit(1)
+        elif not os.path.isfile(plugin_path):
+            logging.error("File Not Found PLUGIN_NAME %s", plugin_path)
+            logging.error("Check Spelling of PLUGIN_NAME Value in %s", config_file_path)
+            logging.error("------- Valid Names -------")
+            valid_plugin = glob.glob(plugin_dir + "/*py")
+            valid_plugin.sort()
+            for entry in valid_plugin:
+                plugin_filename = os.path.basename(entry)
+                plugin = plugin_filename.rsplit(".", 1)[0]
+                if not ((plugin == "__init__") or (plugin == "current")):
+                    logging.error("        %s", plugin )
+            logging.error("------- End of List -------")
+            logging.error("Note: PLUGIN_NAME Should Not have .py Ending.")
+            logging.error("or Rerun github curl install command.  See github wiki")
+            logging.error(
+                "https://github.com/pageauc/pi-timolo/wiki/"
+                "How-to-Install-or-Upgrade#quick-install"
+            )
+            logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
+            sys.exit(1)
+        try:
+            # plugin sees config.py and earlier plugin values
+            values = readSettings(plugin_path, plugin_settings)
+        except Exception as e:  # any error in a user edited plugin file
+            logging.error("Failed Loading Plugin %s - %s", plugin_path, e)
+            logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
+            sys.exit(1)
+        changed = {key: new_val for key, (old_val, new_val)
+                   in settingsDiff(plugin_settings, values).items()}
+        for problem in checkSettings(changed, known_settings):
+            logging.warning("%s %s", os.path.basename(plugin_path), problem)
+        plugin_settings = values
+    globals().update(plugin_settings)
+else:
+    logging.info("No Plugin Enabled per PLUGIN_ON=%s", PLUGIN_ON)
+
 # import specified pantilt library based on config.py setting
 if PANTILT_ON:
     pan_x, tilt_y = PANTILT_HOME
@@ -378,15 +461,46 @@ else:
         MOTION_CODE = False
         WARN_ON = True
 
-# Give some time to read any warnings
-if WARN_ON and VERBOSE_ON:
+# Import heavier libraries only for enabled features
+if SHOW_DATE_ON_IMAGE or IMAGE_GRAYSCALE or IMAGE_ROTATION is not None:
+    from PIL import Image
+    from PIL import ImageFont
+    from PIL import ImageDraw
+if MOTION_VIDEO_ON or VIDEO_REPEAT_ON:
+    from picamera2.encoders import H264Encoder
+    from picamera2.outputs import FfmpegOutput
+
+if SHOW_DATE_ON_IMAGE or IMAGE_SHOW_EXIF_ON:
+    # Attempt to import pyexiv2.  Note python3 can be a problem
+    try:
+        # pyexiv2 Transfers image exif data to writeTextToImage
+        # For python3 install of pyexiv2 lib
+        # See https://github.com/pageauc/pi-timolo/issues/79
+        # Bypass pyexiv2 if library Not Found
+        import pyexiv2
+    except ImportError:
+        print("WARN  : Could Not Import pyexiv2. Required for Saving Image EXIF meta data")
+        print(
+            "        If Running under python3 then Install pyexiv2 library for python3 per"
+        )
+        print("      sudo apt install python3-py3exiv2 -y")
+        WARN_ON = True
+    except OSError as e:
+        print("WARN  : Could Not import python3 pyexiv2 due to an Operating System Error")
+        print(f"        {str(e)}")
+        print("        Camera images will be missing exif meta data")
+        WARN_ON = True
+
+# Give some time to read any warnings. Not needed when run by supervisor
+if WARN_ON and VERBOSE_ON and sys.stdout.isatty():
     print("")
     print("Please Review Warnings  Wait 10 sec ...")
     time.sleep(10)
     print("Loading Wait ....")
 
 try:
-    import cv2
+    if MOTION_TRACK_ON or IMAGE_SHOW_STREAM:
+        import cv2
 except ImportError:
     if sys.version_info > (2, 9):
         logging.error("Failed to import cv2 opencv for python3")
@@ -412,81 +526,40 @@ except ImportError:
     logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
     sys.exit(1)
 
+# publish stream frames to shared memory for timolo2-web.py live view if required
+if LIVE_VIEW_ON:
+    from liveview import FramePublisher
+    CamStream.publisher = FramePublisher((STREAM_WIDTH, STREAM_HEIGHT), fps=LIVE_VIEW_FPS)
 
-# Check if plugins are on and import as required
-if PLUGIN_ON:  # Check and verify plugin and load variable overlay
-    plugin_dir = os.path.join(base_dir, "plugins")
-    # Check if there is a .py at the end of PLUGIN_NAME variable
-    if PLUGIN_NAME.endswith(".py"):
-        PLUGIN_NAME = PLUGIN_NAME[:-3]  # Remove .py extensiion
-    plugin_path = os.path.join(plugin_dir, PLUGIN_NAME + ".py")
-    logging.info("pluginEnabled - loading PLUGIN_NAME %s ", plugin_path)
-    if not os.path.isdir(plugin_dir):
-        logging.error("plugin Directory Not Found at %s", plugin_dir)
-        logging.error("Rerun github curl install script to install plugins")
-        logging.error(
-            "https://github.com/pageauc/pi-timolo/wiki/"
-            "How-to-Install-or-Upgrade#quick-install"
-        )
-        logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
-        sys.exit(1)
-    elif not os.path.isfile(plugin_path):
-        logging.error("File Not Found PLUGIN_NAME %s", plugin_path)
-        logging.error("Check Spelling of PLUGIN_NAME Value in %s", config_file_path)
-        logging.error("------- Valid Names -------")
-        valid_plugin = glob.glob(plugin_dir + "/*py")
-        valid_plugin.sort()
-        for entry in valid_plugin:
-            plugin_filename = os.path.basename(entry)
-            plugin = plugin_filename.rsplit(".", 1)[0]
-            if not ((plugin == "__init__") or (plugin == "current")):
-                logging.error("        %s", plugin )
-        logging.error("------- End of List -------")
-        logging.error("Note: PLUGIN_NAME Should Not have .py Ending.")
-        logging.error("or Rerun github curl install command.  See github wiki")
-        logging.error(
-            "https://github.com/pageauc/pi-timolo/wiki/"
-            "How-to-Install-or-Upgrade#quick-install"
-        )
-        logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
-        sys.exit(1)
-    else:
-        plugin_current = os.path.join(plugin_dir, "current.py")
-        try:  # Copy image file to recent folder
-            logging.info("Copy %s to %s", plugin_path, plugin_current)
-            shutil.copy(plugin_path, plugin_current)
-        except OSError as e:
-            logging.error(
-                "Copy Failed from %s to %s - %s", plugin_path, plugin_current, str(e)
-            )
-            logging.error("Check permissions, disk space, Etc.")
-            logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
-            sys.exit(1)
-        logging.info("Import Plugin %s", plugin_path)
-        sys.path.insert(0, plugin_dir)  # add plugin Directory to program PATH
-        from plugins.current import *
+# import incremental timelapse video segment encoder if required
+if TIMELAPSE_SEGMENT_ON:
+    from tlvideo import TlSegmenter
 
-        try:
-            if os.path.isfile(plugin_current):
-                os.remove(plugin_current)
-            plugin_current_pyc = os.path.join(plugin_dir, "current.pyc")
-            if os.path.isfile(plugin_current_pyc):
-                os.remove(plugin_current_pyc)
-        except OSError as e:
-            logging.warning("Failed Removal of %s - %s", plugin_current_pyc, str(e))
-            time.sleep(5)
-else:
-    logging.info("No Plugin Enabled per PLUGIN_ON=%s", PLUGIN_ON)
+# import settings reload on config.py change or SIGHUP if required
+if CONFIG_RELOAD_ON:
+    from configreload import ConfigReload, readSettings, checkSettings
 
-# -------------------  End import of python library modules --------------------
+# import hourly capture totals for timolo2-web.py calendar if required
+if ROLLUP_ON:
+    from mediarollup import HourRollup
 
-# Turn on VERBOSE_ON when DEBUG_ON mode is enabled
-if DEBUG_ON:
-    VERBOSE_ON = True
+# import pipelined pantilt sequence engine if required
+if PANTILT_ON and PANTILT_PIPELINE_ON:
+    from pantiltseq import PantiltSequence
 
-# Make sure image format extention starts with a dot
-if not IMAGE_FORMAT.startswith(".", 0, 1):
-    IMAGE_FORMAT = "." + IMAGE_FORMAT
+# import pantilt servo settle model if required
+if PANTILT_ON and PANTILT_SETTLE_MODEL_ON:
+    from pantiltmotion import ServoModel
+    servo_model = ServoModel(PANTILT_IS, PANTILT_SPEED_DEG_SEC)
+pantilt_pos = None  # Last pantilt position moved to. None= Unknown
+
+# import pano stitching job queue if required
+if PANO_ON:
+    from stitchqueue import StitchQueue
+
+
+# -------------------  End import of python library modules --------------------
+IMPORT_SEC = time.monotonic() - PROG_START
 
 # ==================================
 #      System Variables
@@ -495,8 +568,7 @@ if not IMAGE_FORMAT.startswith(".", 0, 1):
 SECONDS_TO_MICRO = 1000000  # Used to convert from seconds to microseconds
 MB_TO_BYTES = 1048576  # Conversion from MB to Bytes
 day_mode = False  # default should always be False.
-MOTION_PATH = os.path.join(base_dir, MOTION_DIR)  # Store Motion images
-# motion dat file to save currentCount
+cam_max_resolution = None  # (width, height) from rpiCamInfo()
 
 # Setup filepath's for storing image numbering data
 DATA_DIR = "./data"
@@ -506,7 +578,17 @@ NUM_PATH_PANO = os.path.join(DATA_DIR, PANO_IMAGE_PREFIX + base_file_name + ".da
 NUM_PATH_PANTILT_SEQ = os.path.join(
     DATA_DIR, PANTILT_SEQ_IMAGE_PREFIX + base_file_name + ".dat"
 )
-TIMELAPSE_PATH = os.path.join(base_dir, TIMELAPSE_DIR)  # Store Time Lapse images
+PANO_QUEUE_PATH = os.path.join(DATA_DIR, "pano-queue.json")
+PANO_CALIB_PATH = os.path.join(DATA_DIR, "pano-calib.npz")
+CAM_PROBE_CACHE_PATH = os.path.join(DATA_DIR, "cam-probe.json")  # rpicam-hello output. Reused until reboot
+ROLLUP_DIR = os.path.join(DATA_DIR, "rollups")  # Hourly capture totals. One json file per day
+media_rollup = None
+if ROLLUP_ON:
+    media_rollup = HourRollup(ROLLUP_DIR, [("motion", MOTION_PREFIX),
+                                           ("timelapse", TIMELAPSE_PREFIX),
+                                           ("vidrepeat", VIDEO_PREFIX),
+                                           ("pano", PANO_IMAGE_PREFIX),
+                                           ("pantilt", PANTILT_SEQ_IMAGE_PREFIX)])
 
 # Colors for drawing lines
 CV_WHITE = (255, 255, 255)
@@ -516,48 +598,135 @@ CV_GREEN = (0, 255, 0)
 CV_RED = (0, 0, 255)
 LINE_THICKNESS = 1  # Thickness of opencv drawing lines
 LINE_COLOR = CV_WHITE  # color of lines to highlight motion stream area
-image_width = IMAGE_WIDTH
-image_height = IMAGE_HEIGHT
-DARK_GAIN = min(DARK_GAIN, 16)
-
-# increase size of MOTION_TRACK_QUICK_PIC_ON image
-BIG_IMAGE = MOTION_TRACK_QUICK_PIC_BIGGER
-BIG_IMAGE_WIDTH = int(STREAM_WIDTH * BIG_IMAGE)
-BIG_IMAGE_HEIGHT = int(STREAM_HEIGHT * BIG_IMAGE)
-
-TRACK_TRIG_LEN = MOTION_TRACK_TRIG_LEN  # Pixels moved to trigger motion photo
-# Don't track progress until this Len reached.
-TRACK_TRIG_LEN_MIN = int(MOTION_TRACK_TRIG_LEN / 6)
-# Set max overshoot triglen allowed half cam height
-TRACK_TRIG_LEN_MAX = int(STREAM_HEIGHT / 2)
-# Timeout seconds Stops motion tracking when no activity
-TRACK_TIMEOUT = MOTION_TRACK_TIMEOUT_SEC
-
-# OpenCV Contour sq px area must be greater than this.
-MIN_AREA = MOTION_TRACK_MIN_AREA
+
+
+# ------------------------------------------------------------------------------
+def setDerivedSettings():
+    """
+    Set variables computed from config.py settings.
+    Run at startup and again when settings are reloaded.
+    """
+    global VERBOSE_ON, IMAGE_FORMAT, MOTION_PATH, TIMELAPSE_PATH
+    global image_width, image_height, DARK_GAIN
+    global BIG_IMAGE, BIG_IMAGE_WIDTH, BIG_IMAGE_HEIGHT
+    global TRACK_TRIG_LEN, TRACK_TRIG_LEN_MIN, TRACK_TRIG_LEN_MAX, TRACK_TIMEOUT, MIN_AREA
+    # Turn on VERBOSE_ON when DEBUG_ON mode is enabled
+    if DEBUG_ON:
+        VERBOSE_ON = True
+    # Make sure image format extention starts with a dot
+    if not IMAGE_FORMAT.startswith(".", 0, 1):
+        IMAGE_FORMAT = "." + IMAGE_FORMAT
+    MOTION_PATH = os.path.join(base_dir, MOTION_DIR)  # Store Motion images
+    TIMELAPSE_PATH = os.path.join(base_dir, TIMELAPSE_DIR)  # Store Time Lapse images
+    image_width = IMAGE_WIDTH
+    image_height = IMAGE_HEIGHT
+    if cam_max_resolution is not None:
+        # Round image resolution to avoid picamera errors
+        image_width = min(image_width, cam_max_resolution[0])
+        image_height = min(image_height, cam_max_resolution[1])
+    DARK_GAIN = min(DARK_GAIN, 16)
+
+    # increase size of MOTION_TRACK_QUICK_PIC_ON image
+    BIG_IMAGE = MOTION_TRACK_QUICK_PIC_BIGGER
+    BIG_IMAGE_WIDTH = int(STREAM_WIDTH * BIG_IMAGE)
+    BIG_IMAGE_HEIGHT = int(STREAM_HEIGHT * BIG_IMAGE)
+
+    TRACK_TRIG_LEN = MOTION_TRACK_TRIG_LEN  # Pixels moved to trigger motion photo
+    # Don't track progress until this Len reached.
+    TRACK_TRIG_LEN_MIN = int(MOTION_TRACK_TRIG_LEN / 6)
+    # Set max overshoot triglen allowed half cam height
+    TRACK_TRIG_LEN_MAX = int(STREAM_HEIGHT / 2)
+    # Timeout seconds Stops motion tracking when no activity
+    TRACK_TIMEOUT = MOTION_TRACK_TIMEOUT_SEC
+
+    # OpenCV Contour sq px area must be greater than this.
+    MIN_AREA = MOTION_TRACK_MIN_AREA
+
+
+setDerivedSettings()
 BLUR_SIZE = 10  # OpenCV setting for Gaussian difference image blur
 THRESHOLD_SENSITIVITY = 20  # OpenCV setting for difference image threshold
 
+# ffmpeg mp4 flags per VIDEO_MP4_MODE. frag writes the moov first then a fragment
+# per keyframe so clips play while downloading, and a clip cut off by a crash
+# plays up to its last fragment. faststart moves the moov to the front after
+# recording ends (needs a complete file)
+MP4_MOVFLAGS = {
+    "frag": "+frag_keyframe+empty_moov+default_base_moof",
+    "faststart": "+faststart",
+    "": None,
+}
+
 
 # ------------------------------------------------------------------------------
-def rpiCamInfo():
-    cam_hello_ver = 'rpicam-hello'
+def getBootId():
+    """Return linux boot id. Changes on every reboot. None if not available"""
     try:
-        # Use rpicam-hello to check if the camera is detected
-        result = subprocess.run([cam_hello_ver, '--list-cameras'],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE, text=True)
-    except FileNotFoundError:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# ------------------------------------------------------------------------------
+def readCamProbeCache(boot_id):
+    """
+    Return (cam_hello_ver, stdout) of a camera probe saved since the last
+    reboot or None. Cameras can only be changed with the power off.
+    """
+    if boot_id is None:
+        return None
+    try:
+        with open(CAM_PROBE_CACHE_PATH) as f:
+            cache = json.load(f)
+        if cache["boot_id"] == boot_id:
+            return cache["cam_hello_ver"], cache["stdout"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+# ------------------------------------------------------------------------------
+def writeCamProbeCache(boot_id, cam_hello_ver, stdout):
+    if boot_id is None:
+        return
+    tmp_path = CAM_PROBE_CACHE_PATH + ".tmp"
+    try:
+        if not os.path.isdir(os.path.dirname(CAM_PROBE_CACHE_PATH)):
+            os.makedirs(os.path.dirname(CAM_PROBE_CACHE_PATH))
+        with open(tmp_path, "w") as f:
+            json.dump({"boot_id": boot_id, "cam_hello_ver": cam_hello_ver, "stdout": stdout}, f)
+        os.replace(tmp_path, CAM_PROBE_CACHE_PATH)
+    except OSError as e:
+        logging.warning("Could Not Save Camera Probe Cache %s - %s", CAM_PROBE_CACHE_PATH, e)
+
+
+# ------------------------------------------------------------------------------
+def rpiCamInfo():
+    boot_id = getBootId()
+    cached = readCamProbeCache(boot_id)
+    if cached is not None:
+        cam_hello_ver, stdout = cached
+        logging.info("Using Camera Probe Cached Since Boot in %s", CAM_PROBE_CACHE_PATH)
+        result = subprocess.CompletedProcess([cam_hello_ver, '--list-cameras'], 0, stdout, "")
+    else:
+        cam_hello_ver = 'rpicam-hello'
         try:
-            cam_hello_ver = 'libcamera-hello'
-            # Use libcamera-hello to check if the camera is detected
+            # Use rpicam-hello to check if the camera is detected
             result = subprocess.run([cam_hello_ver, '--list-cameras'],
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE, text=True)
         except FileNotFoundError:
-            logging.error(f"{cam_hello_ver} command Not Found.")
-            logging.error("Are you running this on a Raspberry Pi with libcamera installed?")
-            sys.exit(1)
+            try:
+                cam_hello_ver = 'libcamera-hello'
+                # Use libcamera-hello to check if the camera is detected
+                result = subprocess.run([cam_hello_ver, '--list-cameras'],
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, text=True)
+            except FileNotFoundError:
+                logging.error(f"{cam_hello_ver} command Not Found.")
+                logging.error("Are you running this on a Raspberry Pi with libcamera installed?")
+                sys.exit(1)
     if result.returncode == 0:
         logging.info(f"Checking for RPI camera using {cam_hello_ver} --list-cameras")
         print(result.stdout)
@@ -602,12 +771,17 @@ def rpiCamInfo():
         # this is not used due to break above.  Rethinking
         if max_resolution:
             logging.info("%s", max_resolution )
-            cam_resolution = max_resolution.split('x')
+            # eg 4608x2592 10-bit RGGB
+            cam_resolution = max_resolution.split()[0].split('x')
             try:
                 im_w = int(cam_resolution[0])
                 im_h = int(cam_resolution[1])
             except ValueError:
                 return None
+            # Only cache a probe that found a camera. rpicam-hello also
+            # exits 0 when it reports "No cameras available!"
+            if cached is None:
+                writeCamProbeCache(boot_id, cam_hello_ver, result.stdout)
             return (im_w, im_h)
         logging.warning("No Max resolution information Found.")
         return None
@@ -617,12 +791,29 @@ def rpiCamInfo():
         sys.exit(1)
 
 
+# ------------------------------------------------------------------------------
+def settingProblem(name, value):
+    """
+    Return why value is not valid for setting name, or None if it is.
+    Used by checkConfig() at startup and for reloaded settings.
+    """
+    if name == "VIDEO_MP4_MODE" and value not in MP4_MOVFLAGS:
+        return 'Not Valid. Use "frag", "faststart" or ""'
+    return None
+
+
 # ------------------------------------------------------------------------------
 def checkConfig():
     """
     Check if both User disabled everything
     in config.py. At least one option needs to be enabled
     """
+    global VIDEO_MP4_MODE
+    problem = settingProblem("VIDEO_MP4_MODE", VIDEO_MP4_MODE)
+    if problem is not None:
+        logging.warning('VIDEO_MP4_MODE = "%s" %s', VIDEO_MP4_MODE, problem)
+        logging.warning('Setting VIDEO_MP4_MODE = "frag"')
+        VIDEO_MP4_MODE = "frag"
     if not MOTION_TRACK_ON and not TIMELAPSE_ON and not PANTILT_SEQ_ON and not PANO_ON and not VIDEO_REPEAT_ON:
         error_ext = (
             "You need to have Motion, Timelapse, PanTilt Seq, Pano or Video Repeat turned ON\n"
@@ -636,6 +827,107 @@ def checkConfig():
         sys.exit(1)
 
 
+# ------------------------------------------------------------------------------
+# Settings read once at startup. A change is logged and applied on restart
+RESTART_SETTINGS = {
+    "MOTION_TRACK_ON", "TIMELAPSE_ON", "VIDEO_REPEAT_ON", "PANTILT_ON",
+    "PANTILT_IS_PIMORONI", "PANTILT_PIPELINE_ON", "PANTILT_SETTLE_MODEL_ON",
+    "PANTILT_SPEED_DEG_SEC", "PANO_ON", "PANO_STITCH_MAX_JOBS", "PANO_STITCH_NICE",
+    "PANO_STITCH_MIN_MEM_MB", "PANO_STITCH_QUEUE_MAX", "PANO_STITCH_STALE_SEC",
+    "PANO_CALIB_ON", "TIMELAPSE_SEGMENT_ON", "TIMELAPSE_SEGMENT_DIR",
+    "TIMELAPSE_SEGMENT_VIDEO_DIR", "TIMELAPSE_SEGMENT_PREFIX", "TIMELAPSE_SEGMENT_FRAMES",
+    "TIMELAPSE_SEGMENT_FPS", "TIMELAPSE_SEGMENT_SIZE", "LIVE_VIEW_ON", "ROLLUP_ON",
+    "LOG_TO_FILE_ON", "VERBOSE_ON", "DEBUG_ON", "CONFIG_RELOAD_ON", "MOTION_PREFIX", "TIMELAPSE_PREFIX",
+    "VIDEO_PREFIX", "PANO_IMAGE_PREFIX", "PANTILT_SEQ_IMAGE_PREFIX",
+}
+# Settings that need libraries only imported at startup if the setting was on
+RELOAD_LIBS = {
+    "MOTION_VIDEO_ON": ("H264Encoder", "FfmpegOutput"),
+    "SHOW_DATE_ON_IMAGE": ("Image", "ImageFont", "ImageDraw", "pyexiv2"),
+    "IMAGE_GRAYSCALE": ("Image",),
+    "IMAGE_ROTATION": ("Image",),
+    "IMAGE_SHOW_EXIF_ON": ("pyexiv2",),
+    "IMAGE_SHOW_STREAM": ("cv2",),
+}
+# Libraries needed by settings that need a restart to change
+STARTUP_LIBS = {
+    "MOTION_TRACK_ON": ("cv2",),
+    "VIDEO_REPEAT_ON": ("H264Encoder", "FfmpegOutput"),
+}
+# Settings used to start the motion tracking stream
+STREAM_SETTINGS = {"STREAM_WIDTH", "STREAM_HEIGHT", "IMAGE_VFLIP", "IMAGE_HFLIP"}
+
+
+# ------------------------------------------------------------------------------
+def checkFeatureLibs():
+    """
+    Exit if a library needed by an enabled feature was not imported.
+    Libraries are imported only for features that are on once config.py
+    and plugins are loaded, so a setting changed after the imports would
+    otherwise fail with NameError part way through a capture.
+    pyexiv2 is left out since it is optional and warned about on import.
+    """
+    missing = []
+    for name, libs in list(STARTUP_LIBS.items()) + list(RELOAD_LIBS.items()):
+        value = globals()[name]
+        if value is not None and value is not False:
+            missing += ["%s needs %s" % (name, lib) for lib in libs
+                        if lib != "pyexiv2" and lib not in globals()]
+    if missing:
+        for problem in missing:
+            logging.error("%s. Not Imported", problem)
+        logging.error("Exiting %s %s Due to Error", PROG_NAME, PROG_VER)
+        sys.exit(1)
+
+
+# ------------------------------------------------------------------------------
+def loadSettings():
+    """
+    Return (settings, file paths read) of default_settings overridden by
+    config.py then the PLUGIN_NAME plugins if PLUGIN_ON. Used by ConfigReload
+    """
+    settings = readSettings(config_file_path, default_settings)
+    paths = [config_file_path]
+    if settings["PLUGIN_ON"]:
+        for plugin_path in pluginPaths(settings["PLUGIN_NAME"]):
+            paths.append(plugin_path)
+            settings = readSettings(plugin_path, settings)
+    return settings, paths
+
+
+# ------------------------------------------------------------------------------
+def applySettings(changed):
+    """
+    Set reloaded settings {name: (old, new)} that can change while running.
+    Values that fail the startup checks or change type are not applied.
+    Returns True if the motion tracking stream must be restarted.
+    """
+    restart_stream = False
+    for name, (old_val, new_val) in sorted(changed.items()):
+        missing = [lib for lib in RELOAD_LIBS.get(name, ()) if lib not in globals()]
+        if name in RESTART_SETTINGS or (missing and new_val is not None and new_val is not False):
+            logging.warning("%s Changed to %s. Restart %s to Apply%s", name, new_val, PROG_NAME,
+                            " (Needs %s)" % ", ".join(missing) if missing else "")
+            continue
+        problems = checkSettings({name: new_val}, {name: old_val})
+        problem = settingProblem(name, new_val)
+        if problem is not None:
+            problems.append("%s = %r %s" % (name, new_val, problem))
+        if problems:
+            logging.warning("Reload Not Applied - %s. Keeping %r", problems[0], old_val)
+            continue
+        logging.info("Reload %s = %s (was %s)", name, new_val, old_val)
+        globals()[name] = new_val
+        if name in STREAM_SETTINGS:
+            restart_stream = True
+    setDerivedSettings()
+    if CamStream.publisher is not None and (
+            restart_stream or "LIVE_VIEW_FPS" in changed):
+        CamStream.publisher.close()
+        CamStream.publisher = FramePublisher((STREAM_WIDTH, STREAM_HEIGHT), fps=LIVE_VIEW_FPS)
+    return restart_stream
+
+
 # ------------------------------------------------------------------------------
 def getLastSubdir(dir_path):
     # Scan for directories and return most recent
@@ -1030,9 +1322,8 @@ def writeTextToImage(image_path, date_to_print, currentday_mode):
             # rgb settings for black text text_foreground_colour
             text_foreground_colour = CV_WHITE
             text_colour = "White"
-    img_data = cv2.imread(image_path)
-    # This is grayscale image so channels is not avail or used
-    img_height, img_width, channels = img_data.shape
+    im_draw = Image.open(image_path)
+    img_width, img_height = im_draw.size
     # centre text and compensate for graphics text being wider
     img_xpos = int((img_width / 2) - (len(image_path) * 2))
     if SHOW_TEXT_BOTTOM:
@@ -1048,8 +1339,6 @@ def writeTextToImage(image_path, date_to_print, currentday_mode):
     except:
         image_text = image_txt  # Just set for python3
 
-    im_draw = Image.open(image_path)
-
     try:  # Read exif data since ImageDraw does not save image metadata
         im_metadata = pyexiv2.ImageMetadata(image_path)
         im_metadata.read()
@@ -1162,6 +1451,8 @@ def postImageProcessing(
                     )
         # write next image file_counter number to dat file
         writeCounter(file_counter, counter_path)
+    if media_rollup is not None:
+        media_rollup.addFile(file_name)
     return file_counter
 
 
@@ -1332,6 +1623,15 @@ def takeImage(file_path, img_data):
         logging.info("Save Image to %s", file_path)
     picam2.capture_file(file_path)      # Capture the image
     picam2.close()  # Close the camera instance
+    imageSettingsUpdate(file_path)
+
+
+# ------------------------------------------------------------------------------
+def imageSettingsUpdate(file_path):
+    """
+    Apply config.py grayscale, exif display, rotation and stream box
+    settings to a saved image.
+    """
     if IMAGE_GRAYSCALE:
         saveGrayscaleImage(file_path)
     if IMAGE_SHOW_EXIF_ON:
@@ -1527,6 +1827,8 @@ def takeMiniTimelapse(mo_path, filename_prefix, num_on, motion_num_count, curren
     while keep_taking_images:
         logging.info(f"{image_count}")
         takeImage(file_name, img_data)
+        if media_rollup is not None:
+            media_rollup.addFile(file_name)
         motion_num_count += 1
         writeCounter(motion_num_count, NUM_PATH_MOTION)
         file_name = getImageFilename(mo_path, filename_prefix, num_on, motion_num_count)
@@ -1557,8 +1859,15 @@ def takeVideo(file_name, vid_seconds, vid_w=1280, vid_h=720, vid_fps=25):
                                                                transform=Transform(vflip=IMAGE_VFLIP,
                                                                                    hflip=IMAGE_HFLIP)))
             picam2.set_controls({"FrameRate": vid_fps})
-            encoder = H264Encoder(10000000)
-            output = FfmpegOutput(file_path_mp4)
+            movflags = MP4_MOVFLAGS[VIDEO_MP4_MODE]
+            if movflags:
+                # a keyframe (and fragment) every second. FfmpegOutput splits
+                # its output on spaces so ffmpeg options can precede the path
+                encoder = H264Encoder(10000000, iperiod=vid_fps)
+                output = FfmpegOutput("-movflags %s %s" % (movflags, file_path_mp4))
+            else:
+                encoder = H264Encoder(10000000)
+                output = FfmpegOutput(file_path_mp4)
 
             vid_retries -=1
             try:
@@ -1572,6 +1881,8 @@ def takeVideo(file_name, vid_seconds, vid_w=1280, vid_h=720, vid_fps=25):
         time.sleep(vid_seconds)
         picam2.stop_recording()
         picam2.close()
+        if media_rollup is not None:
+            media_rollup.addFile(file_path_mp4)
         if MOTION_RECENT_MAX:
             logging.info("Saved Motion Tracking Video to %s", file_path_mp4)
         else:
@@ -1589,10 +1900,24 @@ def pantiltGoHome():
     motion tracking and timelapse camera pointing.
     """
     if PANTILT_ON:
-        pantilthat.pan(PANTILT_HOME[0])
-        time.sleep(PANTILT_SLEEP_SEC)
-        pantilthat.tilt(PANTILT_HOME[1])
+        pantiltMove(PANTILT_HOME)
+
+
+# ------------------------------------------------------------------------------
+def pantiltMove(cam_pos):
+    """
+    Move pantilt to cam_pos (pan_x, tilt_y) and wait for the servos to settle.
+    With PANTILT_SETTLE_MODEL_ON the wait depends on the distance moved,
+    otherwise PANTILT_SLEEP_SEC is used.
+    """
+    global pantilt_pos
+    pantilthat.pan(cam_pos[0])
+    pantilthat.tilt(cam_pos[1])
+    if PANTILT_SETTLE_MODEL_ON:
+        time.sleep(servo_model.settleTime(pantilt_pos, cam_pos))
+    else:
         time.sleep(PANTILT_SLEEP_SEC)
+    pantilt_pos = tuple(cam_pos)
 
 
 # ------------------------------------------------------------------------------
@@ -1605,6 +1930,33 @@ def addFilepathSeq(file_path, seq_num):
     return seq_filepath
 
 
+# ------------------------------------------------------------------------------
+def takePantiltPipeline(stops, file_paths, img_data, post_fn):
+    """
+    Capture images at pantilt stops with the camera held open. Each image
+    is saved and post_fn(file_path) run while the servos move to the next stop.
+    """
+    px_ave = getStreamPixAve(img_data)
+    exposure_microsec, analogue_gain = getExposureSettings(px_ave)
+    logging.info(f"px_ave={px_ave}, Exposure={exposure_microsec} microsec, Gain={analogue_gain} Auto is 0")
+    jpg_qual = IMAGE_JPG_QUAL
+    if IMAGE_FORMAT.upper() not in (".JPG", ".JPEG"):
+        jpg_qual = 0
+    global pantilt_pos
+    pt_seq = PantiltSequence(pantilthat,
+                             (image_width, image_height),
+                             IMAGE_VFLIP,
+                             IMAGE_HFLIP,
+                             PANTILT_SLEEP_SEC,
+                             jpg_qual)
+    if PANTILT_SETTLE_MODEL_ON:
+        pt_seq.settle_model = servo_model
+        pt_seq.settle_check = PANTILT_SETTLE_CHECK_ON
+    start_pos = PANTILT_HOME if pantilt_pos is None else pantilt_pos
+    pantilt_pos = pt_seq.run(stops, file_paths, exposure_microsec, analogue_gain,
+                             post_fn, start_pos=start_pos, end_pos=PANTILT_HOME)
+
+
 # ------------------------------------------------------------------------------
 def takePantiltSequence(file_name, day_mode, num_count, num_path, img_data):
     """
@@ -1632,18 +1984,8 @@ def takePantiltSequence(file_name, day_mode, num_count, num_path, img_data):
         logging.info("MOTION_TRACK_ON={MOTION_TRACK_ON}, TIMELAPSE_ON={TIMELAPSE_ON}")
         logging.info(f"PANTILT_SEQ_ON={PANTILT_SEQ_ON} Take Sequence Every {PANTILT_SEQ_TIMER_SEC} sec")
         logging.info(f"Start PanTilt Images at Stops {PANTILT_SEQ_STOPS}")
-    # initialize file_counter to ensure each image file_name is unique
-    pantilt_seq_image_num = 0
-
-    for cam_pos in PANTILT_SEQ_STOPS:  # take images at each specified stop
-        pantilt_seq_image_num += 1  # Set image numbering for this image
-        seq_filepath = addFilepathSeq(file_name, pantilt_seq_image_num)
-        pan_x, tilt_y = cam_pos  # set pan tilt values for this image
-        pantilthat.pan(pan_x)
-        pantilthat.tilt(tilt_y)
-        logging.info("pan_x=%i tilt_y=%i", pan_x, tilt_y)
-        time.sleep(PANTILT_SLEEP_SEC)
-        takeImage(seq_filepath, img_data)
+    def postSeqImage(seq_filepath):
+        """Text, numbering and recent symlink for one sequence image"""
         if MOTION_TRACK_PANTILT_SEQ_ON:
             postImageProcessing(
                 MOTION_NUM_ON,
@@ -1680,6 +2022,27 @@ def takePantiltSequence(file_name, day_mode, num_count, num_path, img_data):
                 PANTILT_SEQ_IMAGE_PREFIX,
             )
 
+    if PANTILT_PIPELINE_ON:
+        seq_filepaths = [addFilepathSeq(file_name, seq_num + 1)
+                         for seq_num in range(len(PANTILT_SEQ_STOPS))]
+
+        def postPipelineImage(seq_filepath):
+            imageSettingsUpdate(seq_filepath)
+            postSeqImage(seq_filepath)
+
+        takePantiltPipeline(PANTILT_SEQ_STOPS, seq_filepaths, img_data, postPipelineImage)
+    else:
+        # initialize file_counter to ensure each image file_name is unique
+        pantilt_seq_image_num = 0
+        for cam_pos in PANTILT_SEQ_STOPS:  # take images at each specified stop
+            pantilt_seq_image_num += 1  # Set image numbering for this image
+            seq_filepath = addFilepathSeq(file_name, pantilt_seq_image_num)
+            pan_x, tilt_y = cam_pos  # set pan tilt values for this image
+            pantiltMove(cam_pos)
+            logging.info("pan_x=%i tilt_y=%i", pan_x, tilt_y)
+            takeImage(seq_filepath, img_data)
+            postSeqImage(seq_filepath)
+
     if PANTILT_SEQ_NUM_ON:
         num_count += 1
         writeCounter(num_count, NUM_PATH_PANTILT_SEQ)
@@ -1694,13 +2057,13 @@ def takePantiltSequence(file_name, day_mode, num_count, num_path, img_data):
 
 
 # ------------------------------------------------------------------------------
-def takePano(pano_seq_num, day_mode, img_data):
+def takePano(pano_seq_num, day_mode, img_data, stitch_queue):
     """
     Take a series of overlapping images using pantilt at specified PANO_CAM_STOPS
     then attempt to stitch the images into one panoramic image. Note this
-    will take time so depending on number of cpu cores and speed. The PANO_TIMER
-    should be set to avoid multiple stitching operations at once.
-    use htop or top to check stitching PID activity.
+    will take time so depending on number of cpu cores and speed. Stitching
+    is queued on stitch_queue which limits the number of stitching processes
+    running at once. Run ./stitchqueue.py to check queue status.
 
     Successfuly Stitching needs good lighting so it should be restricted to
     day light hours or sufficient indoor lighting.
@@ -1716,17 +2079,14 @@ def takePano(pano_seq_num, day_mode, img_data):
     logging.info("Start timer=%i sec  pano_seq_num=%s", PANO_TIMER_SEC, pano_seq_num)
 
     pano_image_num = 0  # initialize file_counter to ensure each image file_name is unique
-    pano_image_files = (
-        ""  # string of contatenated image input pano file_names for stitch command line
-    )
+    pano_image_files = []  # list of image input pano file_names for stitch command
     pano_file_path = os.path.join(
         PANO_DIR,
         PANO_IMAGE_PREFIX + IMAGE_NAME_PREFIX + str(pano_seq_num) + IMAGE_FORMAT,
     )
 
-    for cam_pos in PANO_CAM_STOPS:  # take images at each specified stop
+    for cam_pos in PANO_CAM_STOPS:  # build image file names for each stop
         pano_image_num += 1  # Set image numbering for this image
-        pan_x, tilt_y = cam_pos  # set pan tilt values for this image
         pano_file_name = os.path.join(
             PANO_IMAGES_DIR,
             PANO_IMAGE_PREFIX
@@ -1736,21 +2096,31 @@ def takePano(pano_seq_num, day_mode, img_data):
             + str(pano_image_num)
             + IMAGE_FORMAT,
         )
-        pano_image_files += " " + pano_file_name
-        pantilthat.pan(pan_x)
-        pantilthat.tilt(tilt_y)
-        if pano_seq_num == 1:
-            time.sleep(0.3)
-        time.sleep(PANTILT_SLEEP_SEC)
-        takeImage(pano_file_name, img_data)
-        logging.info(
-            "Size %ix%i Saved %s at cam_pos(%i, %i)",
-            image_width,
-            image_height,
-            pano_file_name,
-            pan_x,
-            tilt_y,
-        )
+        pano_image_files.append(pano_file_name)
+
+    if PANTILT_PIPELINE_ON:
+        def postPanoImage(pano_file_name):
+            imageSettingsUpdate(pano_file_name)
+            logging.info("Size %ix%i Saved %s", image_width, image_height, pano_file_name)
+            if media_rollup is not None:
+                media_rollup.addFile(pano_file_name)
+
+        takePantiltPipeline(PANO_CAM_STOPS, pano_image_files, img_data, postPanoImage)
+    else:
+        for cam_pos, pano_file_name in zip(PANO_CAM_STOPS, pano_image_files):
+            pan_x, tilt_y = cam_pos  # set pan tilt values for this image
+            pantiltMove(cam_pos)
+            takeImage(pano_file_name, img_data)
+            if media_rollup is not None:
+                media_rollup.addFile(pano_file_name)
+            logging.info(
+                "Size %ix%i Saved %s at cam_pos(%i, %i)",
+                image_width,
+                image_height,
+                pano_file_name,
+                pan_x,
+                tilt_y,
+            )
     # Center pantilt
     pantiltGoHome()
     logging.info("End")
@@ -1765,17 +2135,8 @@ def takePano(pano_seq_num, day_mode, img_data):
         logging.info("Please run menubox.sh UPGRADE to correct problem")
         logging.warning("Exiting - Cannot Run Image Stitching of Images.")
         return
-    # Create the stitch command line string
-    stitch_cmd = PANO_PROG_PATH + " " + pano_file_path + pano_image_files
-    try:
-        logging.info("Run Image Stitching Command per Below")
-        print(f"{stitch_cmd}")
-        # spawn stitch command with parameters as seperate task
-        proc = subprocess.Popen(
-            stitch_cmd, shell=True, stdin=None, stdout=None, stderr=None, close_fds=True
-        )
-    except IOError:
-        logging.error("Failed subprocess %s", stitch_cmd)
+    # Queue the stitch job. It runs in background when a slot is free
+    stitch_queue.addJob(pano_file_path, pano_image_files)
     pano_seq_num += 1
     if PANO_NUM_RECYCLE and PANO_NUM_MAX > 0:
         if pano_seq_num >= PANO_NUM_START + PANO_NUM_MAX:
@@ -1841,6 +2202,10 @@ def videoRepeat():
     video_num_counter = VIDEO_NUM_START
     keep_recording = True
     while keep_recording:
+        if config_reload is not None:
+            changed = config_reload.poll()
+            if changed:
+                applySettings(changed)
         # if required check free disk space and delete older files
         # Set variable SPACE_TARGET_EXT='mp4' and
         # SPACE_MEDIA_DIR= to appropriate folder path
@@ -1953,6 +2318,15 @@ def timolo():
             timelapse_num_count = getCurrentCount(NUM_PATH_TIMELAPSE,
                                                   TIMELAPSE_NUM_START)
             tl_cnt = str(timelapse_num_count)
+        if TIMELAPSE_SEGMENT_ON:
+            logging.info("Incremental Video Segments Every %i Images to %s",
+                         TIMELAPSE_SEGMENT_FRAMES, TIMELAPSE_SEGMENT_DIR)
+            tl_segmenter = TlSegmenter(TIMELAPSE_SEGMENT_DIR,
+                                       TIMELAPSE_SEGMENT_VIDEO_DIR,
+                                       TIMELAPSE_SEGMENT_PREFIX,
+                                       TIMELAPSE_SEGMENT_FRAMES,
+                                       TIMELAPSE_SEGMENT_FPS,
+                                       TIMELAPSE_SEGMENT_SIZE)
     else:
         logging.warning("Timelapse is Surpressed per TIMELAPSE_ON=%s",
                          TIMELAPSE_ON)
@@ -2045,6 +2419,38 @@ def timolo():
     first_timelapse = True  # Force a timelapse on startup
     while True:  # Start main program Loop.
         motion_found = False
+        changed = config_reload.poll() if config_reload is not None else {}
+        if changed:
+            # Apply config.py or plugin changes without restarting the camera.
+            # Timers and thresholds are read each loop. Refresh values kept here
+            restart_stream = applySettings(changed)
+            track_timer = TRACK_TIMEOUT
+            if "TIMELAPSE_START_AT" in changed:
+                start_timelapse = getSchedStart(TIMELAPSE_START_AT)
+            if "MOTION_START_AT" in changed:
+                start_motion = getSchedStart(MOTION_START_AT)
+            if any(name.endswith("_DIR") or "_SUBDIR_" in name for name in changed):
+                checkMediaPaths()
+                if TIMELAPSE_ON:
+                    tlPath = subDirChecks(TIMELAPSE_SUBDIR_MAX_HOURS, TIMELAPSE_SUBDIR_MAX_FILES,
+                                          TIMELAPSE_DIR, TIMELAPSE_PREFIX)
+                if MOTION_TRACK_ON:
+                    mo_path = subDirChecks(MOTION_SUBDIR_MAX_HOURS, MOTION_SUBDIR_MAX_FILES,
+                                           MOTION_DIR, MOTION_PREFIX)
+            if restart_stream and MOTION_TRACK_ON:
+                logging.info("Restart picamera2 VideoStream Thread for New Settings ...")
+                vs.stop()
+                time.sleep(STREAM_STOP_SEC)
+                vs = CamStream(size=(STREAM_WIDTH, STREAM_HEIGHT),
+                               vflip=IMAGE_VFLIP,
+                               hflip=IMAGE_HFLIP).start()
+                time.sleep(.5)
+                img_data1 = vs.read()
+                img_data2 = img_data1
+                gray_image1 = cv2.cvtColor(img_data1, cv2.COLOR_BGR2GRAY)
+                start_track = False
+                track_start_pos = []
+                track_length = 0.0
         if (MOTION_TRACK_ON
             and (not MOTION_NUM_RECYCLE_ON)
             and (motion_num_count > MOTION_NUM_START + MOTION_NUM_MAX)
@@ -2105,6 +2511,8 @@ def timolo():
             time.sleep(STREAM_STOP_SEC)
         if not day_mode and TIMELAPSE_ON:
             time.sleep(0.02)  # short delay to aviod high cpu usage at night
+        if media_rollup is not None:
+            media_rollup.dayMode(day_mode)
         # Don't take images if IMAGE_NO_NIGHT_SHOTS
         # or IMAGE_NO_DAY_SHOTS settings are True
         if not timeToSleep(day_mode):
@@ -2269,6 +2677,8 @@ def timolo():
                     saveRecent(
                         TIMELAPSE_RECENT_MAX, TIMELAPSE_RECENT_DIR, file_name, tl_prefix
                     )
+                    if TIMELAPSE_SEGMENT_ON:
+                        tl_segmenter.addFrame(file_name)
 
                     if MOTION_TRACK_ON:
                         logging.info("Restart picamera2 VideoStream Thread ...")
@@ -2406,6 +2816,8 @@ def timolo():
                         (MOTION_FORCE_SEC / 60),
                     )
                 if motion_found or motion_force_start:
+                    if motion_found and media_rollup is not None:
+                        media_rollup.addEvent()
                     motion_prefix = MOTION_PREFIX + IMAGE_NAME_PREFIX
                     file_name = getImageFilename(
                         mo_path, motion_prefix, MOTION_NUM_ON, motion_num_count
@@ -2513,6 +2925,26 @@ def timolo():
                     start_pano = True
                     pano_seq_num = getCurrentCount(NUM_PATH_PANO, PANO_NUM_START)
                     pano_timer = datetime.datetime.now()
+                    stitch_cmd = PANO_PROG_PATH
+                    if PANO_CALIB_ON:
+                        # calibration is only valid for this stop set and image size
+                        calib_key = "%s %ix%i vflip=%s hflip=%s" % (
+                            PANO_CAM_STOPS, image_width, image_height,
+                            IMAGE_VFLIP, IMAGE_HFLIP)
+                        stitch_cmd = [sys.executable,
+                                      os.path.join(base_dir, "stitchcalib.py"),
+                                      "--calib", PANO_CALIB_PATH,
+                                      "--key", calib_key,
+                                      "--max-residual", str(PANO_CALIB_MAX_RESIDUAL),
+                                      "--max-diff", str(PANO_CALIB_MAX_DIFF),
+                                      "--fallback", PANO_PROG_PATH]
+                    stitch_queue = StitchQueue(stitch_cmd,
+                                               PANO_QUEUE_PATH,
+                                               PANO_STITCH_MAX_JOBS,
+                                               PANO_STITCH_NICE,
+                                               PANO_STITCH_MIN_MEM_MB,
+                                               PANO_STITCH_QUEUE_MAX,
+                                               PANO_STITCH_STALE_SEC)
                 else:
                     # Check if pano timer expired and if so start a pano sequence
                     pano_timer, start_pano = checkTimer(pano_timer, PANO_TIMER_SEC)
@@ -2521,7 +2953,7 @@ def timolo():
                         logging.info("Stop Motion Tracking picamera2 VideoStream ...")
                         vs.stop()
                         time.sleep(STREAM_STOP_SEC)
-                    pano_seq_num = takePano(pano_seq_num, day_mode, img_data2)
+                    pano_seq_num = takePano(pano_seq_num, day_mode, img_data2, stitch_queue)
                     if MOTION_TRACK_ON:
                         logging.info("Restart Motion Tracking picamera2 VideoStream Thread ...")
                         vs = CamStream(size=(STREAM_WIDTH, STREAM_HEIGHT),
@@ -2556,19 +2988,25 @@ def timolo():
 if __name__ == "__main__":
 
     cam_max_resolution = rpiCamInfo()
-    if cam_max_resolution is not None:
-        image_width_max = cam_max_resolution[0]
-        image_height_max = cam_max_resolution[1]
-        # Round image resolution to avoid picamera errors
-        image_width = min(image_width, image_width_max)
-        image_height = min(image_height, image_height_max)
+    setDerivedSettings()
     checkConfig()
+    checkFeatureLibs()
+    config_reload = None
+    if CONFIG_RELOAD_ON:
+        try:
+            config_reload = ConfigReload(loadSettings)
+            logging.info("Settings Reload On. Edit %s or Send SIGHUP to Apply Changes",
+                         config_file_path)
+        except Exception as e:  # settings file error. Keep running without reload
+            logging.warning("Settings Reload Disabled - %s", e)
+    logging.info("Startup Took %.2f sec (Library Imports %.2f sec)",
+                 time.monotonic() - PROG_START, IMPORT_SEC)
 
     if PANTILT_ON:
         logging.info("Camera Pantilt Hardware is %s", PANTILT_IS)
     if PLUGIN_ON:
         logging.info(
-            "Start pi-timolo per %s and plugins/%s.py Settings",
+            "Start pi-timolo per %s and plugins %s Settings",
             config_file_path,
             PLUGIN_NAME,
         )
@@ -2590,14 +3028,6 @@ if __name__ == "__main__":
         else:
             sys.stdout.write("User Pressed Keyboard ctrl-c \n")
             sys.stdout.write("Exiting %s %s \n", PROG_NAME, PROG_VER)
-    try:
-        if PLUGIN_ON:
-            if os.path.isfile(plugin_current):
-                os.remove(plugin_current)
-            plugin_current_pyc = os.path.join(plugin_dir, "current.pyc")
-            if os.path.isfile(plugin_current_pyc):
-                os.remove(plugin_current_pyc)
-    except OSError as e:
-        logging.warning("Failed To Remove File %s - %s", plugin_current_pyc, str(e))
-        sys.exit(1)
+    if CamStream.publisher is not None:
+        CamStream.publisher.close()
     print("Wait ...")
@@ -34,7 +34,7 @@ INFO  : $progName $ver  written by Claude Pageau
 echo "Note: config.py will not be overwritten. Updated settings are in config.py.new"
 
 timoloFiles=("menubox.sh" "timolo2-cam.py" "timolo2-cam.sh" "timolo2-web.py" "timolo2-web.sh" \
-"image-stitching" "config.cfg" "makevideo.sh" "mvleavelast.sh" "strmpilibcam.py")
+"image-stitching" "config.cfg" "makevideo.sh" "mvleavelast.sh" "strmpilibcam.py" "tlvideo.py" "stitchqueue.py" "stitchcalib.py" "pantiltseq.py" "pantiltmotion.py" "mediaindex.py" "webbench.py" "thumbcache.py" "liveview.py" "mediawatch.py" "zipstream.py" "mediarollup.py" "configreload.py" "sysinfo.py")
 
 for fname in "${timoloFiles[@]}" ; do
     wget_output=$(wget -O $fname -q --show-progress https://raw.github.com/pageauc/pi-timolo2/master/source/$fname)
@@ -70,7 +70,7 @@ fi
 
 chmod +x *py
 chmod -x config*py
-chmod -x strmpilibcam.py
+chmod -x strmpilibcam.py pantiltseq.py liveview.py mediawatch.py configreload.py sysinfo.py
 chmod +x *sh
 
 echo "copy image-stitching to /usr/local/bin"
@@ -5,18 +5,30 @@ Tracks largest moving object in camera view and calculates speed based on calibr
 This webserver allows viewing images and reports
 '''
 # import cgi
+import email.utils
 import html
+import json
 import os
-import subprocess
+import collections
+import select
+import selectors
 import socket
 import fcntl
 import struct
 import socketserver
 import sys
+import threading
 import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from http.server import SimpleHTTPRequestHandler
-from io import BytesIO
+
+from mediaindex import DiskStatus, MediaIndex, MediaUsage, humanSize, mediaType
+from mediarollup import readDays
+from thumbcache import ThumbCache
+from liveview import LiveView
+from mediawatch import MediaEvents
+from zipstream import ZipStream, folderFiles
 
 PROG_VER = "ver 13.3 written by Claude Pageau modified by Alexandre Strube for python3 compatibility"
 
@@ -35,10 +47,33 @@ else:
     print("Importing Configuration Variables from File %s" % CONFIG_FILE_PATH)
     from config import *
 
+# Settings added after older config.py files were created
+default_settings = {
+    "WEB_SERVER_WORKERS": 8,
+    "WEB_CONN_TIMEOUT_SEC": 15,
+    "WEB_LIST_PAGE_SIZE": 200,
+    "WEB_STATUS_TTL_SEC": 10,
+    "WEB_MEDIA_MAX_AGE_SEC": 3600,
+    "WEB_THUMB_CACHE_MB": 100,
+    "LIVE_VIEW_ON": False,
+    "LIVE_VIEW_FPS": 5,
+    "WEB_EVENTS_ON": True,
+    "WEB_MEDIA_INDEX_ON": True,
+    "WEB_CALENDAR_DAYS": 28,
+    "MOTION_PREFIX": "mo-",
+    "TIMELAPSE_PREFIX": "tl-",
+    "VIDEO_PREFIX": "vid-",
+    "PANO_IMAGE_PREFIX": "pano-",
+    "PANTILT_SEQ_IMAGE_PREFIX": "pt-",
+}
+for key, val in default_settings.items():
+    if key not in globals():
+        print("WARN  : config.py Variable Not Found. Setting %s = %s" % (key, val))
+        globals()[key] = val
+
 os.chdir(WEB_SERVER_ROOT)
 web_root = os.getcwd()
 os.chdir(BASE_DIR)
-MNT_POINT = "./"
 
 if WEB_LIST_BY_DATETIME_ON:
     dir_sort = 'Sort DateTime'
@@ -52,6 +87,31 @@ else:
 
 list_title = "%s %s" % (dir_sort, dir_order)
 
+DIR_CACHE_MAX = 32  # Number of sorted directory listings kept in memory
+API_LIST_PATH = "/api/list"  # JSON listing eg /api/list/motion/?offset=200&limit=200
+API_LIST_LIMIT_MAX = 1000    # Max entries returned per JSON listing request
+API_STATUS_PATH = "/api/status"  # JSON disk and media usage status
+API_EVENTS_PATH = "/api/events"  # Server-sent events for a folder eg /api/events/motion/
+API_MEDIA_PATH = "/api/media"    # Media index query eg /api/media?type=motion&limit=50
+API_ROLLUPS_PATH = "/api/rollups"  # Hourly capture totals eg /api/rollups?days=7
+CALENDAR_PATH = "/calendar"  # Hourly activity page drawn from timolo2-cam.py rollups
+CALENDAR_DAYS_MAX = 366
+ROLLUP_DIR = os.path.join(BASE_DIR, "data", "rollups")
+ZIP_PATH = "/zip"  # Stored zip of a folder eg /zip/motion/?from=2026-10-19&to=2026-10-20&type=image
+LIVE_PATH = "/live.mjpg"  # MJPEG live view from timolo2-cam.py shared memory frames
+LIVE_PAGE_PATH = "/live"  # Page showing LIVE_PATH
+LIVE_VIEWERS_MAX = 4      # Live view streams at once. More viewers get 503 Busy
+LIVE_SEND_TIMEOUT = 10    # Drop a live viewer that does not accept a frame within seconds
+THUMB_PATH = "/thumb"  # Image thumbnails eg /thumb/motion/mo-1000.jpg?w=320
+THUMB_WIDTH = 320      # Default thumbnail width px
+RANGES_MAX = 16     # More byte ranges than this in one request returns the whole file
+COPY_BUFSIZE = 64 * 1024
+CHUNK_SIZE = 16 * 1024  # Generated pages are sent in chunks of about this size
+CONN_LINGER_SEC = 0.05  # Worker waits this long for a kept alive connection's next request
+CONN_LINGER_STEP = 0.01 # while no other connection is waiting for a worker
+# Listing entry. mtime and size are from one stat per entry (symlinks followed)
+DirEntry = collections.namedtuple("DirEntry", "name is_dir is_link mtime size")
+
 #-------------------------------------------------------------------------------
 def get_ip_address(ifname):
     '''
@@ -69,66 +129,970 @@ def get_ip_address(ifname):
     except IOError:
         return None
 
+# Disk space and media usage per type are cached, not read on every page view
+disk_status = DiskStatus(web_root, WEB_STATUS_TTL_SEC)
+media_usage = MediaUsage(web_root, WEB_STATUS_TTL_SEC * 3)
+# Media index kinds by file name prefix. Other media files have kind other.
+# Names differ from the media types image and video so /api/media?type= can use either
+MEDIA_KINDS = [("motion", MOTION_PREFIX), ("timelapse", TIMELAPSE_PREFIX), ("vidrepeat", VIDEO_PREFIX),
+               ("pano", PANO_IMAGE_PREFIX), ("pantilt", PANTILT_SEQ_IMAGE_PREFIX)]
+media_index = None
+if WEB_MEDIA_INDEX_ON:
+    try:
+        media_index = MediaIndex(web_root, os.path.join(BASE_DIR, "data", "media-index.db"),
+                                 MEDIA_KINDS, WEB_STATUS_TTL_SEC)
+    except (ImportError, OSError, ValueError) as e:
+        print("WARN  : Media Index Disabled - %s" % e)
+# Thumbnail cache is outside the web root so it is not listed
+try:
+    thumb_cache = ThumbCache(os.path.join(BASE_DIR, "data", "thumbs"), WEB_THUMB_CACHE_MB)
+except (ImportError, OSError) as e:
+    print("WARN  : Thumbnails Disabled - %s" % e)
+    thumb_cache = None
+live_view = LiveView() if LIVE_VIEW_ON else None
+
+#-------------------------------------------------------------------------------
+def scan_directory(path):
+    '''
+    Return a sorted list of DirEntry for path using os.scandir with a single
+    stat per entry. Sorted per WEB_LIST_BY_DATETIME_ON.
+    '''
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            is_link = entry.is_symlink()
+            try:
+                st = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:  # broken symlink
+                st = entry.stat(follow_symlinks=False)
+                is_dir = False
+            entries.append(DirEntry(entry.name, is_dir, is_link, st.st_mtime, st.st_size))
+    if WEB_LIST_BY_DATETIME_ON:
+        # Sort by most recent modified date/time first
+        entries.sort(key=lambda e: e.mtime, reverse=WEB_LIST_BY_DATETIME_ON)
+    else:
+        # Sort by File Name
+        entries.sort(key=lambda e: e.name.lower(), reverse=WEB_LIST_BY_DATETIME_ON)
+    return entries
+
+#-------------------------------------------------------------------------------
+class DirCache:
+    '''
+    Sorted directory listings kept in memory and keyed by the directory mtime.
+    Adding, removing or renaming a file changes the directory mtime so the
+    next request rescans. A listing scanned in the same second the directory
+    last changed is not trusted, since a later change in that second may not
+    change the mtime.
+    '''
+
+    def __init__(self, max_dirs=DIR_CACHE_MAX):
+        self.max_dirs = max_dirs
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()  # path -> (mtime_ns, scan_time, entries)
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.cache.get(path)
+            if (cached is not None and cached[0] == mtime_ns
+                    and cached[1] - mtime_ns / 1e9 > 1.0):
+                self.cache.move_to_end(path)
+                return cached[2]
+        scan_time = time.time()
+        entries = scan_directory(path)
+        with self.lock:
+            self.cache[path] = (mtime_ns, scan_time, entries)
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.max_dirs:
+                self.cache.popitem(last=False)
+        return entries
+
+dir_cache = DirCache()
+
+#-------------------------------------------------------------------------------
+def entry_info(entry, url_path):
+    '''
+    Return dict describing a DirEntry for the listing and JSON api.
+    Directory href is absolute, file href is relative to the listed directory.
+    '''
+    displayname = name = entry.name
+    if entry.is_link:
+        displayname = name + "@"  # symbolic link found
+    if entry.is_dir:
+        displayname = name + "/"
+        href = urllib.parse.quote(os.path.join(url_path, displayname))
+        entry_type = "dir"
+    else:
+        href = urllib.parse.quote(name)
+        entry_type = mediaType(name)
+        if entry_type == "other":
+            entry_type = "file"
+    return {"name": name,
+            "display": displayname,
+            "href": href,
+            "type": entry_type,
+            "link": entry.is_link,
+            "thumb": (urllib.parse.quote(THUMB_PATH + url_path + name) + "?w=%i" % THUMB_WIDTH
+                      if entry_type == "image" else None),
+            "size": entry.size,
+            "mtime": entry.mtime,
+            "modified": time.strftime('%H:%M:%S %d-%b-%Y', time.localtime(entry.mtime))}
+
+#-------------------------------------------------------------------------------
+def media_event(dir_path, kind, name):
+    '''
+    Return server-sent event bytes for a file created or deleted in dir_path.
+    created data is the entry_info json of the file, deleted data is its name.
+    '''
+    if kind == "deleted":
+        data = {"name": name}
+    else:
+        path = os.path.join(dir_path, name)
+        is_link = os.path.islink(path)
+        try:
+            st = os.stat(path)
+            is_dir = os.path.isdir(path)
+        except OSError:  # broken symlink
+            st = os.lstat(path)
+            is_dir = False
+        rel_path = os.path.relpath(dir_path, web_root)
+        url_path = "/" if rel_path == "." else "/" + rel_path.replace(os.sep, "/") + "/"
+        data = entry_info(DirEntry(name, is_dir, is_link, st.st_mtime, st.st_size), url_path)
+    return b"event: %s\ndata: %s\n\n" % (kind.encode('utf-8'), json.dumps(data).encode('utf-8'))
+
+# New and deleted media are pushed to open listing pages instead of a page refresh
+media_events = MediaEvents(media_event) if WEB_EVENTS_ON else None
+live_slots = threading.Semaphore(LIVE_VIEWERS_MAX)
+
+#-------------------------------------------------------------------------------
+def stream_live(sock):
+    '''
+    Thread that sends multipart MJPEG live view frames at up to LIVE_VIEW_FPS
+    to a browser connection detached from the web server pool. Runs until
+    the browser closes the stream or timolo2-cam.py stops sharing frames.
+    '''
+    interval = 1.0 / max(1, LIVE_VIEW_FPS)
+    last_seq = 0
+    sock.settimeout(LIVE_SEND_TIMEOUT)
+    try:
+        while True:
+            try:
+                seq, jpeg = live_view.frame()
+            except (FileNotFoundError, ValueError):
+                return  # cam stopped
+            if seq != last_seq:
+                last_seq = seq
+                sock.sendall(b"--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %i\r\n\r\n"
+                             % len(jpeg) + jpeg + b"\r\n")
+            time.sleep(interval)
+    except OSError:
+        pass  # browser closed the stream
+    finally:
+        live_slots.release()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
 #-------------------------------------------------------------------------------
-def df(drive_mnt):
+def parse_time(text, end=False):
     '''
-       function to read disk drive data using unix df command
-       for the specified mount point.
-       Returns a formatted string of Disk Status
+    Return unix time of local date YYYY-MM-DD or date time YYYY-MM-DDTHH:MM[:SS],
+    None if text is empty. end=True returns the end of the day, minute or second
+    so a to date includes all of that day. Raises ValueError for other text.
     '''
+    if not text:
+        return None
+    text = text.strip().replace(" ", "T")
+    for fmt, step in (("%Y-%m-%dT%H:%M:%S", 1), ("%Y-%m-%dT%H:%M", 60), ("%Y-%m-%d", 0)):
+        try:
+            t = time.strptime(text, fmt)
+        except ValueError:
+            continue
+        if end and step == 0:  # next midnight. mktime allows day 32 and DST changes
+            return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        return time.mktime(t) + (step if end else 0)
+    raise ValueError("Bad Time %s" % text)
+
+#-------------------------------------------------------------------------------
+def query_int(query, key, default):
+    '''Return int query string parameter or default'''
     try:
-        df = subprocess.Popen(["df", "-h", drive_mnt], stdout=subprocess.PIPE)
-        output = df.communicate()[0].decode('utf-8')
-        device, size, used, available, percent, mountpoint = output.split("\n")[1].split()
-        drive_status = ("Drive %s at %s [Space %s Used %s of %s Avail %s]" %
-                        (device, mountpoint, percent, used, size, available))
-    except:
-        drive_status = "df command Error. No drive status avail"
-    return drive_status
+        return max(0, int(query[key][0]))
+    except (KeyError, IndexError, ValueError):
+        return default
+
+#-------------------------------------------------------------------------------
+def file_etag(st):
+    '''Strong ETag from inode, size and mtime of an os.stat result'''
+    return '"%x-%x-%x"' % (st.st_ino, st.st_size, st.st_mtime_ns)
+
+#-------------------------------------------------------------------------------
+def parse_ranges(header, size):
+    '''
+    Parse a Range header eg bytes=0-499,-500 for a file of size bytes.
+    Returns list of (first, last) byte positions, [] if none can be satisfied
+    or None if the header is invalid and should be ignored.
+    '''
+    units, _, specs = header.partition("=")
+    if units.strip().lower() != "bytes":
+        return None
+    ranges = []
+    try:
+        for spec in specs.split(","):
+            first, sep, last = spec.strip().partition("-")
+            if not sep:
+                return None
+            if not first:  # suffix range eg -500 is last 500 bytes
+                length = int(last)
+                if length > 0 and size > 0:
+                    ranges.append((max(0, size - length), size - 1))
+                continue
+            first = int(first)
+            last = int(last) if last else size - 1
+            if last < first and first < size:
+                return None
+            if first < size:
+                ranges.append((first, min(last, size - 1)))
+    except ValueError:
+        return None
+    if len(ranges) > RANGES_MAX:
+        return None
+    return ranges
+
+#-------------------------------------------------------------------------------
+class FileBody:
+    '''
+    Response body made of parts of an open file. parts is a list of
+    (header bytes, offset, length) followed by trailer bytes eg for a
+    multipart/byteranges response. copyfile() sends the parts with sendfile.
+    read() returns the same bytes for code that copies it like a file.
+    '''
+
+    def __init__(self, f, parts, trailer=b""):
+        self.file = f
+        self.parts = parts
+        self.trailer = trailer
+        self.length = sum(len(head) + length for head, _, length in parts) + len(trailer)
+        self.chunks = self.iter_chunks()
+
+    def iter_chunks(self, bufsize=COPY_BUFSIZE):
+        for head, offset, length in self.parts:
+            if head:
+                yield head
+            self.file.seek(offset)
+            while length > 0:
+                data = self.file.read(min(bufsize, length))
+                if not data:
+                    return  # file was truncated
+                length -= len(data)
+                yield data
+        if self.trailer:
+            yield self.trailer
+
+    def read(self, size=-1):
+        return next(self.chunks, b"")
+
+    def close(self):
+        self.file.close()
+
+#-------------------------------------------------------------------------------
+class ChunkedBody:
+    '''
+    Response body generated while it is sent, from a generator of bytes.
+    copyfile() sends it with chunked transfer encoding.
+    '''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def close(self):
+        self.chunks.close()
+
+#-------------------------------------------------------------------------------
+class PoolHTTPServer(socketserver.TCPServer):
+    '''
+    TCPServer that handles requests in a pool of WEB_SERVER_WORKERS
+    threads so a slow client (eg a phone streaming an mp4) does not block
+    other browsers. New and idle kept alive connections wait in a selector,
+    not in a worker, and are given to the pool when their next request
+    arrives. Connections idle for conn_timeout seconds are closed.
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog. Default 5 drops connects when a page opens many
+
+    def __init__(self, server_address, handler_class, max_workers=8, conn_timeout=15):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                       thread_name_prefix="web")
+        self.conn_timeout = conn_timeout
+        self.detached = set()  # connections handed to MediaEvents. Not closed here
+        self.parked = set()    # connections to return to the idle selector
+        self.detached_lock = threading.Lock()
+        self.idle = selectors.DefaultSelector()
+        self.idle_new = []     # (request, client_address) waiting to be selected
+        self.queued = 0        # connections with a request waiting for a worker
+        self.idle_lock = threading.Lock()
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.idle.register(self.wake_recv, selectors.EVENT_READ)
+        socketserver.TCPServer.__init__(self, server_address, handler_class)
+        self.idle_thread = threading.Thread(target=self.idle_loop, args=())
+        self.idle_thread.daemon = True
+        self.idle_thread.start()
+
+    def detach(self, request):
+        '''Keep request open after its handler returns and free the worker'''
+        with self.detached_lock:
+            self.detached.add(request)
+
+    def keep_alive(self, request):
+        '''Return request to the idle selector after its handler returns'''
+        with self.detached_lock:
+            self.parked.add(request)
+
+    def park(self, request, client_address):
+        with self.idle_lock:
+            self.idle_new.append((request, client_address))
+        try:
+            self.wake_send.send(b"\0")
+        except BlockingIOError:
+            pass  # idle_loop already has wake ups waiting
+
+    def process_request(self, request, client_address):
+        # browsers open spare connections that may never send a request
+        self.park(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        with self.idle_lock:
+            self.queued -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.detached_lock:
+                detached = request in self.detached
+                parked = request in self.parked
+                self.detached.discard(request)
+                self.parked.discard(request)
+            if parked and not detached:
+                self.park(request, client_address)
+            elif not detached:
+                self.shutdown_request(request)
+
+    def idle_loop(self):
+        '''Thread loop. Give connections with a request to the pool. Close timed out ones'''
+        while True:
+            for key, _ in self.idle.select(timeout=1.0):
+                if key.fileobj is self.wake_recv:
+                    try:
+                        while self.wake_recv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.idle.unregister(key.fileobj)
+                with self.idle_lock:
+                    self.queued += 1
+                self.pool.submit(self.process_request_thread, key.fileobj, key.data[0])
+            now = time.monotonic()
+            with self.idle_lock:
+                idle_new, self.idle_new = self.idle_new, []
+            for request, client_address in idle_new:
+                try:
+                    self.idle.register(request, selectors.EVENT_READ, (client_address, now))
+                except (ValueError, OSError):  # already closed
+                    self.shutdown_request(request)
+            for key in list(self.idle.get_map().values()):
+                if key.fileobj is not self.wake_recv and now - key.data[1] > self.conn_timeout:
+                    self.idle.unregister(key.fileobj)
+                    self.shutdown_request(key.fileobj)
+
+    def handle_error(self, request, client_address):
+        # browsers often drop connections eg when a video is closed
+        if isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout)):
+            return
+        socketserver.TCPServer.handle_error(self, request, client_address)
+
+    def server_close(self):
+        socketserver.TCPServer.server_close(self)
+        self.pool.shutdown(wait=False)
 
 #-------------------------------------------------------------------------------
 class DirectoryHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open for the page, iframe and list requests.
+    # Every response sends Content-Length or is chunked. Idle connections wait
+    # in the server selector. timeout only limits a client stalled mid request
+    protocol_version = "HTTP/1.1"
+    timeout = WEB_CONN_TIMEOUT_SEC
+    # Send each write at once. Otherwise the body after the headers waits for
+    # the browser's delayed ack (about 40 ms) on a kept alive connection
+    disable_nagle_algorithm = True
 
-    def list_directory(self, path):
+    def handle(self):
+        '''Handle requests while they arrive then hand the idle connection back to the server'''
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.request_waiting():
+                self.server.keep_alive(self.request)
+                return
+            self.handle_one_request()
+
+    def request_waiting(self):
+        '''
+        Return True if the next request is already buffered or arrives within
+        CONN_LINGER_SEC while no other connection is waiting for a worker.
+        Saves handing the connection to the server selector and back for
+        requests sent one after another eg page images.
+        '''
+        self.connection.setblocking(False)
         try:
-            list = os.listdir(path)
-            all_entries = len(list)
-        except os.error:
-            self.send_error(404, b"No permission to list directory")
+            if self.rfile.peek(1):
+                return True
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+        deadline = time.monotonic() + CONN_LINGER_SEC
+        while self.server.queued <= 0 and time.monotonic() < deadline:
+            if select.select([self.connection], [], [], CONN_LINGER_STEP)[0]:
+                return True
+        return False
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == API_LIST_PATH or url.path.startswith(API_LIST_PATH + "/"):
+            self.send_list_json(url)
+            return
+        if url.path == API_MEDIA_PATH:
+            self.send_media_json(url)
+            return
+        if url.path == API_STATUS_PATH:
+            self.send_json({"disk": disk_status.get(), "media": media_usage.update()})
+            return
+        if url.path == API_ROLLUPS_PATH:
+            days = max(1, min(query_int(urllib.parse.parse_qs(url.query), "days", WEB_CALENDAR_DAYS),
+                              CALENDAR_DAYS_MAX))
+            self.send_json([{"date": day, "hours": hours} for day, hours in readDays(ROLLUP_DIR, days)])
+            return
+        if url.path == CALENDAR_PATH:
+            self.send_calendar(url)
+            return
+        if url.path == ZIP_PATH or url.path.startswith(ZIP_PATH + "/"):
+            self.send_zip(url)
+            return
+        if url.path == API_EVENTS_PATH or url.path.startswith(API_EVENTS_PATH + "/"):
+            self.send_events(url)
+            return
+        if url.path == LIVE_PATH:
+            self.send_live()
+            return
+        if url.path == LIVE_PAGE_PATH:
+            body = (b'<html><body style="margin:0"><img src="%s" style="max-width:100%%" '
+                    b'alt="Live View Not Available"></body></html>' % LIVE_PATH.encode('utf-8'))
+            self.send_response(200)
+            self.send_header("Content-type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def send_zip(self, url):
+        '''
+        Stream a stored zip of the files under a folder, generated while it is
+        sent with chunked transfer encoding. Query parameters from and to
+        (eg 2026-10-19 or 2026-10-19T12:00) select files by modified time and
+        type selects image or video. A Range request resumes a download at a
+        byte offset. Use a past to time so new files do not change the archive.
+        '''
+        path = self.translate_path(url.path[len(ZIP_PATH):] or "/")
+        if not os.path.isdir(path):
+            self.send_error(404, "Directory Not Found")
+            return
+        query = urllib.parse.parse_qs(url.query)
+        time_from = query.get("from", [""])[0]
+        time_to = query.get("to", [""])[0]
+        media_type = query.get("type", [""])[0]
+        try:
+            start_time = parse_time(time_from)
+            end_time = parse_time(time_to, end=True)
+        except ValueError:
+            self.send_error(400, "Bad from or to. Use YYYY-MM-DD or YYYY-MM-DDTHH:MM")
+            return
+
+        def keep(file_path, st):
+            return ((start_time is None or st.st_mtime >= start_time)
+                    and (end_time is None or st.st_mtime < end_time)
+                    and (not media_type or mediaType(file_path) == media_type))
+
+        if media_index is not None and media_type not in ("", "image", "video"):
+            # index kind eg motion. Files by capture time from the media index
+            try:
+                rows, _ = media_index.query(media_type, start_time, end_time,
+                                            folder=os.path.relpath(path, web_root),
+                                            limit=None, newest_first=False)
+            except ValueError:
+                rows = []
+            files = []
+            for row in rows:
+                file_path = os.path.join(web_root, row["path"])
+                try:
+                    st = os.stat(file_path)
+                except OSError:  # deleted since the index was updated
+                    continue
+                files.append((os.path.relpath(file_path, path).replace(os.sep, "/"), file_path, st))
+            files.sort()
+        else:
+            files = folderFiles(path, keep)
+        archive = ZipStream(files)
+        first, last = 0, archive.size - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range.strip() == archive.etag):
+            ranges = parse_ranges(range_header, archive.size)
+            if ranges == []:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%i" % archive.size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if ranges and len(ranges) == 1:  # multiple ranges get the whole archive
+                first, last = ranges[0]
+        zip_name = "-".join([os.path.basename(os.path.normpath(path))]
+                            + ["".join(c for c in text if c.isalnum())
+                               for text in (time_from, time_to, media_type) if text])
+        self.send_response(206 if (first, last) != (0, archive.size - 1) else 200)
+        self.send_header("Content-type", "application/zip")
+        self.send_header("Content-Disposition", 'attachment; filename="%s.zip"' % zip_name)
+        if (first, last) != (0, archive.size - 1):
+            self.send_header("Content-Range", "bytes %i-%i/%i" % (first, last, archive.size))
+        self.send_chunked_header()
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", archive.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            self.write_chunked(archive.chunks(first, last), COPY_BUFSIZE)
+        except OSError as e:
+            if isinstance(e, (ConnectionError, socket.timeout)):
+                raise
+            # no final chunk so the browser sees an incomplete download
+            self.log_error("Zip Stopped %s - %s", path, e)
+            self.close_connection = True
+
+    def send_events(self, url):
+        '''
+        Open a server-sent events stream of files created and deleted in a folder.
+        The connection is handed to media_events so it does not hold a worker.
+        '''
+        if media_events is None:
+            self.send_error(404, "Events Off. Set WEB_EVENTS_ON = True in config.py")
+            return
+        url_path = url.path[len(API_EVENTS_PATH):] or "/"
+        if not url_path.endswith("/"):
+            url_path += "/"
+        path = self.translate_path(url_path)
+        if not os.path.isdir(path):
+            self.send_error(404, "Directory Not Found")
+            return
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(b"retry: 5000\n\n")  # browser reconnect delay ms
+        self.wfile.flush()
+        try:
+            media_events.subscribe(path, self.request)
+        except OSError as e:
+            self.log_error("Events Not Available for %s - %s", path, e)
+            return
+        self.server.detach(self.request)
+
+    def send_live(self):
+        '''
+        Start a live view MJPEG stream. The connection is handed to a
+        stream_live thread so it does not hold a worker.
+        Frames are shared by timolo2-cam.py only while a viewer is connected.
+        '''
+        if live_view is None:
+            self.send_error(404, "Live View Off. Set LIVE_VIEW_ON = True in config.py")
+            return
+        try:
+            live_view.frame()
+        except (FileNotFoundError, ValueError):
+            self.send_error(503, "Live View Not Available. Is timolo2-cam.py Motion Tracking Running?")
+            return
+        if not live_slots.acquire(blocking=False):
+            self.send_error(503, "Live View Busy. Max %i Viewers" % LIVE_VIEWERS_MAX)
+            return
+        try:
+            self.close_connection = True  # stream ends when the browser closes it
+            self.send_response(200)
+            self.send_header("Content-type", "multipart/x-mixed-replace; boundary=FRAME")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+        except OSError:
+            live_slots.release()
+            raise
+        self.server.detach(self.request)
+        thread = threading.Thread(target=stream_live, args=(self.request,))
+        thread.daemon = True
+        thread.start()
+
+    def not_modified(self, st, etag):
+        '''Return True if request validators show the client copy is current'''
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # weak comparison. W/ prefix is ignored
+            return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(st.st_mtime) <= since
+        return False
+
+    def send_head(self):
+        '''
+        Serve files with ETag, Last-Modified and Cache-Control validators,
+        304 Not Modified and single or multiple byte Range responses.
+        Symlinks (eg recent folders) use the validators of the target file.
+        Directories are handled by SimpleHTTPRequestHandler.
+        '''
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.startswith(THUMB_PATH + "/"):
+            return self.send_thumb(url)
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return SimpleHTTPRequestHandler.send_head(self)
+        if path.endswith("/"):
+            self.send_error(404, "File not found")
+            return None
+        return self.send_file(path)
+
+    def send_thumb(self, url):
+        '''Send jpg thumbnail of an image. Query parameter w is width px'''
+        if thumb_cache is None:
+            self.send_error(501, "Thumbnails Need PIL or cv2")
+            return None
+        src_path = self.translate_path(url.path[len(THUMB_PATH):])
+        if mediaType(src_path) != "image":
+            self.send_error(415, "Thumbnails Are Only Made for Images")
             return None
+        width = query_int(urllib.parse.parse_qs(url.query), "w", THUMB_WIDTH)
+        try:
+            thumb_path = thumb_cache.get(src_path, width)
+        except FileNotFoundError:
+            self.send_error(404, "File not found")
+            return None
+        except (OSError, ValueError) as e:
+            self.log_error("Thumbnail Failed for %s - %s", src_path, e)
+            self.send_error(500, "Thumbnail Failed")
+            return None
+        return self.send_file(thumb_path, "image/jpeg")
+
+    def send_file(self, path, ctype=None):
+        '''Send headers for file path and return its FileBody or None'''
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = file_etag(st)
+            ctype = ctype or self.guess_type(path)
+            if mediaType(path) == "other" or WEB_MEDIA_MAX_AGE_SEC <= 0:
+                cache_control = "no-cache"
+            else:
+                cache_control = "public, max-age=%i" % WEB_MEDIA_MAX_AGE_SEC
+            if self.not_modified(st, etag):
+                f.close()
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", cache_control)
+                self.end_headers()
+                return None
+            ranges = None
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header and (if_range is None or if_range.strip() == etag):
+                ranges = parse_ranges(range_header, size)
+            if ranges == []:
+                f.close()
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%i" % size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            if not ranges:
+                body = FileBody(f, [(b"", 0, size)])
+                self.send_response(200)
+                self.send_header("Content-type", ctype)
+            elif len(ranges) == 1:
+                first, last = ranges[0]
+                body = FileBody(f, [(b"", first, last - first + 1)])
+                self.send_response(206)
+                self.send_header("Content-type", ctype)
+                self.send_header("Content-Range", "bytes %i-%i/%i" % (first, last, size))
+            else:
+                boundary = os.urandom(12).hex()
+                parts = []
+                for first, last in ranges:
+                    head = ("\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %i-%i/%i\r\n\r\n"
+                            % (boundary, ctype, first, last, size)).encode("latin-1")
+                    parts.append((head, first, last - first + 1))
+                body = FileBody(f, parts, ("\r\n--%s--\r\n" % boundary).encode("latin-1"))
+                self.send_response(206)
+                self.send_header("Content-type", "multipart/byteranges; boundary=%s" % boundary)
+            self.send_header("Content-Length", str(body.length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+            self.send_header("Cache-Control", cache_control)
+            self.end_headers()
+            return body
+        except Exception:
+            f.close()
+            raise
 
-        if WEB_LIST_BY_DATETIME_ON:
-            # Sort by most recent modified date/time first
-            list.sort(key=lambda x: os.stat(os.path.join(path, x)).st_mtime, reverse=WEB_LIST_BY_DATETIME_ON)
+    def send_chunked_header(self):
+        '''Send Transfer-Encoding chunked header. HTTP/1.0 clients get the body until close'''
+        if self.request_version == "HTTP/1.0":
+            self.send_header("Connection", "close")
         else:
-            # Sort by File Name
-            list.sort(key=lambda a: a.lower(), reverse=WEB_LIST_BY_DATETIME_ON)
-        f = BytesIO()
-        displaypath = html.escape(urllib.parse.unquote(self.path))
+            self.send_header("Transfer-Encoding", "chunked")
+
+    def write_chunked(self, chunks, bufsize=CHUNK_SIZE):
+        '''Send bytes from generator chunks joined into chunks of about bufsize'''
+        chunked = self.request_version != "HTTP/1.0"
+        buf = bytearray()
+        for data in chunks:
+            buf += data
+            if len(buf) >= bufsize:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(buf), buf) if chunked else buf)
+                del buf[:]
+        if buf:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(buf), buf) if chunked else buf)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def copyfile(self, source, outputfile):
+        '''
+        Send FileBody parts with socket.sendfile so file data is copied by
+        the kernel (os.sendfile) instead of through python. socket.sendfile
+        falls back to chunked reads where sendfile is not available.
+        '''
+        if isinstance(source, ChunkedBody):
+            self.write_chunked(source.chunks)
+            return
+        if not isinstance(source, FileBody):
+            SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+            return
+        for head, offset, length in source.parts:
+            if head:
+                outputfile.write(head)
+            if length > 0:
+                self.connection.sendfile(source.file, offset, length)
+        if source.trailer:
+            outputfile.write(source.trailer)
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_calendar(self, url):
+        '''
+        Send a page with one row per day and one cell per hour shaded by motion
+        events. Night hours are dark. Only the rollup file of each day is read.
+        '''
+        days = max(1, min(query_int(urllib.parse.parse_qs(url.query), "days", WEB_CALENDAR_DAYS),
+                          CALENDAR_DAYS_MAX))
+        rows = readDays(ROLLUP_DIR, days)
+        max_events = max([totals.get("motion_events", 0)
+                          for _, hours in rows for totals in hours.values()] + [1])
+        out = ['<html><head><title>%s Calendar</title><style>'
+               'td {width: 22px; height: 18px; font-size: 11px; text-align: center}'
+               '</style></head><body><center><b>Motion Events per Hour</b>'
+               '&nbsp;&nbsp;Last %i Days&nbsp;&nbsp;Dark= Night</center>'
+               '<table style="border-spacing: 2px; margin: auto"><tr><td></td>'
+               % (html.escape(WEB_PAGE_TITLE), days)]
+        out += ["<td>%i</td>" % hour for hour in range(24)]
+        out.append('<td style="width: auto">Day Total</td></tr>')
+        for day, hours in rows:
+            out.append('<tr><td style="width: auto; white-space: nowrap">%s</td>' % day)
+            for hour in range(24):
+                totals = hours.get(hour)
+                if not totals:
+                    out.append('<td style="background: #f4f4f4"></td>')
+                    continue
+                events = totals.get("motion_events", 0)
+                night = totals.get("night_sec", 0) > totals.get("day_sec", 0)
+                if events:
+                    color = "rgba(220, 0, 0, %.2f)" % (0.2 + 0.8 * events / max_events)
+                else:
+                    color = "#555" if night else "#cde"
+                out.append('<td style="background: %s; color: %s" title="%s %02i:00 %s&#10;'
+                           'motion %i events %i files&#10;timelapse %i frames&#10;%i files %s">%s</td>'
+                           % (color, "#fff" if night or events else "#000", day, hour,
+                              "Night" if night else "Day", events, totals.get("motion_files", 0),
+                              totals.get("timelapse_frames", 0), totals.get("files", 0),
+                              humanSize(totals.get("bytes", 0)), events or ""))
+            out.append('<td style="width: auto; white-space: nowrap">%i events %s</td></tr>'
+                       % (sum(totals.get("motion_events", 0) for totals in hours.values()),
+                          humanSize(sum(totals.get("bytes", 0) for totals in hours.values()))))
+        out.append("</table></body></html>")
+        body = "".join(out).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_media_json(self, url):
+        '''
+        Send media index query results newest first as json. Query parameters
+        type (motion, timelapse, video, pano, pantilt, image or video files),
+        from and to (eg 2026-10-19 or 2026-10-19T12:00), prefix, min_size,
+        folder, order (asc or desc), limit (default 50) and cursor (next
+        value of the previous page)
+        '''
+        if media_index is None:
+            self.send_json({"error": "Media Index Off. Set WEB_MEDIA_INDEX_ON = True in config.py"}, 404)
+            return
+        query = urllib.parse.parse_qs(url.query)
+        param = lambda key: query.get(key, [""])[0]
+        try:
+            rows, next_cursor = media_index.query(
+                kind=param("type") or None,
+                start=parse_time(param("from")),
+                end=parse_time(param("to"), end=True),
+                prefix=param("prefix") or None,
+                min_size=query_int(query, "min_size", 0),
+                folder=param("folder").strip("/") or None,
+                limit=max(1, min(query_int(query, "limit", 50), API_LIST_LIMIT_MAX)),
+                cursor=param("cursor") or None,
+                newest_first=param("order") != "asc")
+        except ValueError:  # bad time or cursor
+            self.send_json({"error": "Bad from, to or cursor"}, 400)
+            return
+        entries = []
+        for row in rows:
+            href = urllib.parse.quote("/" + row["path"])
+            entries.append({"name": os.path.basename(row["path"]),
+                            "path": row["path"],
+                            "href": href,
+                            "kind": row["kind"],
+                            "type": row["type"],
+                            "thumb": (urllib.parse.quote(THUMB_PATH + "/" + row["path"])
+                                      + "?w=%i" % THUMB_WIDTH if row["type"] == "image" else None),
+                            "size": row["size"],
+                            "time": row["time"],
+                            "modified": time.strftime('%H:%M:%S %d-%b-%Y', time.localtime(row["time"]))})
+        self.send_json({"entries": entries, "next": next_cursor})
+
+    def send_list_json(self, url):
+        '''
+        Send one page of a directory listing as json. Query parameters are
+        offset (default 0) and limit (default WEB_LIST_PAGE_SIZE)
+        '''
+        url_path = url.path[len(API_LIST_PATH):] or "/"
+        if not url_path.endswith("/"):
+            url_path += "/"
+        path = self.translate_path(url_path)
+        try:
+            entries = dir_cache.get(path)
+        except OSError:
+            self.send_json({"error": "Directory Not Found"}, 404)
+            return
+        if WEB_MAX_LIST_ENTRIES > 1:
+            entries = entries[:WEB_MAX_LIST_ENTRIES]
+        query = urllib.parse.parse_qs(url.query)
+        offset = query_int(query, "offset", 0)
+        limit = min(query_int(query, "limit", WEB_LIST_PAGE_SIZE), API_LIST_LIMIT_MAX)
+        page = entries[offset:offset + limit]
+        next_offset = offset + len(page)
+        self.send_json({"path": urllib.parse.unquote(url_path),
+                        "total": len(entries),
+                        "offset": offset,
+                        "next": next_offset if next_offset < len(entries) else None,
+                        "entries": [entry_info(entry, url_path) for entry in page]})
+
+    def list_directory(self, path):
+        '''
+        Send headers for a directory listing page and return its ChunkedBody.
+        listing_html() makes the page while it is sent so the iframe and first
+        entries show before the rest of the page is made.
+        '''
+        try:
+            list = dir_cache.get(path)
+        except OSError:
+            self.send_error(404, "No permission to list directory")
+            return None
+        dir_entries = len(list)
+        if WEB_MAX_LIST_ENTRIES > 1:
+            list = list[:WEB_MAX_LIST_ENTRIES]
+        url = urllib.parse.urlsplit(self.path)
+        # Only one page of entries is rendered. Browser script loads more on scroll
+        offset = min(query_int(urllib.parse.parse_qs(url.query), "offset", 0), len(list))
+        self.send_response(200)
+        encoding = sys.getfilesystemencoding()
+        self.send_header("Content-type", "text/html; charset=%s" % encoding)
+        self.send_chunked_header()
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        return ChunkedBody(self.listing_html(list, dir_entries, url.path, offset))
+
+    def listing_html(self, list, dir_entries, url_path, offset):
+        '''Generate listing page html with one page of list entries from offset'''
+        all_entries = len(list)
+        page_end = min(offset + WEB_LIST_PAGE_SIZE, all_entries)
+        displaypath = html.escape(urllib.parse.unquote(url_path))
         # find index of first file or hyperlink
 
         file_found = False
         cnt = 0
         for entry in list:  # See if there is a file for initializing iframe
-            fullname = os.path.join(path, entry)
-            if os.path.islink(fullname) or os.path.isfile(fullname):
+            if entry.is_link or not entry.is_dir:
                 file_found = True
                 break
             cnt += 1
         # Start HTML formatting code
-        f.write(b'<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
-        f.write(b'<head>')
+        yield b'<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">'
+        yield b'<head>'
         # Setup Meta Tags and better viewing on small screen devices
-        f.write(b'<meta "Content-Type" content="txt/html; charset=ISO-8859-1" />')
-        f.write(b'<meta name="viewport" content="width=device-width, initial-scale=1.0" />')
-        if WEB_PAGE_REFRESH_ON:
-            f.write(b'<meta http-equiv="refresh" content="%s" />' % WEB_PAGE_REFRESH_SEC.encode('utf-8'))
-        f.write(b'</head>')
-
-        tpath, cur_folder = os.path.split(self.path)
-        f.write(b"<html><title>%s %s</title>" % (WEB_PAGE_TITLE.encode('utf-8'), self.path.encode('utf-8')))
-        f.write(b"<body>")
-        f.write(b"""
+        yield b'<meta "Content-Type" content="txt/html; charset=ISO-8859-1" />'
+        yield b'<meta name="viewport" content="width=device-width, initial-scale=1.0" />'
+        if WEB_PAGE_REFRESH_ON and not WEB_EVENTS_ON:
+            yield b'<meta http-equiv="refresh" content="%s" />' % WEB_PAGE_REFRESH_SEC.encode('utf-8')
+        yield b'</head>'
+
+        tpath, cur_folder = os.path.split(url_path)
+        yield b"<html><title>%s %s</title>" % (WEB_PAGE_TITLE.encode('utf-8'), displaypath.encode('utf-8'))
+        yield b"<body>"
+        yield b"""
                 <script>
 
 document.onkeydown = checkKey;
@@ -148,89 +1112,189 @@ function checkKey(e) {
       nextA.click()
     }
 
+}
+
+// Lazy load further pages of the file list from the json api as it is scrolled
+var listNext = %i, listTotal = %i, listLoading = false;
+
+function entryItem(e) {
+    var li = document.createElement("li");
+    var a = document.createElement("a");
+    li.dataset.name = e.name;
+    a.href = e.href;
+    a.textContent = e.display;
+    li.appendChild(a);
+    if (e.type != "dir") {
+        a.target = "imgbox";
+        li.appendChild(document.createTextNode(" - " + e.modified));
+    }
+    return li;
+}
+
+function loadMore() {
+    if (listLoading || listNext >= listTotal) return;
+    listLoading = true;
+    fetch("%s" + window.location.pathname + "?offset=" + listNext + "&limit=%i")
+        .then((r) => r.json())
+        .then(function(data) {
+            var menu = document.getElementById("menu");
+            var more = document.getElementById("more");
+            data.entries.forEach(function(e) {
+                menu.insertBefore(entryItem(e), more);
+            });
+            listNext = (data.next === null) ? listTotal : data.next;
+            if (listNext >= listTotal) more.style.display = "none";
+            else more.firstChild.href = "?offset=" + listNext;
+            listLoading = false;
+        })
+        .catch(function() { listLoading = false; });
+}
+
+function listScroll(div) {
+    if (div.scrollTop + div.clientHeight > div.scrollHeight - 200) loadMore();
 }
                 </script>
-                """)
+                """ % (page_end, all_entries, API_LIST_PATH.encode('utf-8'), WEB_LIST_PAGE_SIZE)
                 
         # display top web page title
-        f.write(b'<center><b>%s &nbsp &nbsp &nbsp</b>' % WEB_PAGE_TITLE.encode('utf-8'))
-        f.write(b'<em>Note: Left/Right Arrow Keys Scroll File List</em></div></center>') 
+        yield b'<center><b>%s &nbsp &nbsp &nbsp</b>' % WEB_PAGE_TITLE.encode('utf-8')
+        yield b'<em>Note: Left/Right Arrow Keys Scroll File List</em></div></center>' 
         
         # Start Left iframe Image Panel
-        f.write(b'<iframe width="%s" height="%s" align="left"'
-                % (WEB_IFRAME_WIDTH_PERCENT.encode('utf-8'), WEB_IMAGE_HEIGHT.encode('utf-8')))
+        yield (b'<iframe width="%s" height="%s" align="left"'
+               % (WEB_IFRAME_WIDTH_PERCENT.encode('utf-8'), WEB_IMAGE_HEIGHT.encode('utf-8')))
         if file_found:  # Display file in left pane
-            f.write(b'src="%s" name="imgbox" id="imgbox" alt="%s">'
-                    % (list[cnt].encode('utf-8'), WEB_PAGE_TITLE.encode('utf-8')))     
+            yield (b'src="%s" name="imgbox" id="imgbox" alt="%s">'
+                   % (urllib.parse.quote(list[cnt].name).encode('utf-8'), WEB_PAGE_TITLE.encode('utf-8')))     
         else:  # No files found so blank left pane
-            f.write(b'src="%s" name="imgbox" id="imgbox" alt="%s">'
-                    % (b"about:blank", WEB_PAGE_TITLE.encode('utf-8')))
+            yield (b'src="%s" name="imgbox" id="imgbox" alt="%s">'
+                   % (b"about:blank", WEB_PAGE_TITLE.encode('utf-8')))
 
-        f.write(b'<p>iframes are not supported by your browser.</p></iframe>')
+        yield b'<p>iframes are not supported by your browser.</p></iframe>'
         # Start Right File selection List Panel
-        list_style = b'<div style="height: ' + WEB_LIST_HEIGHT.encode('utf-8') + b'px; overflow: auto; white-space: nowrap;">'
-        f.write(list_style)
-        # f.write(b'<center><b>%s</b></center>' % (self.path.encode('utf-8')))
+        list_style = (b'<div onscroll="listScroll(this)" style="height: ' + WEB_LIST_HEIGHT.encode('utf-8')
+                      + b'px; overflow: auto; white-space: nowrap;">')
+        yield list_style
+        # yield (b'<center><b>%s</b></center>' % (self.path.encode('utf-8')))
         # Show a refresh button at top of right pane listing
         refresh_button = ('''<FORM>&nbsp;&nbsp;<INPUT TYPE="button" onClick="history.go(0)"
-VALUE="Refresh">&nbsp;&nbsp;<b>%s</b></FORM>''' % list_title)
-        f.write(b'%s' % refresh_button.encode('utf-8'))
-        f.write(b'<ul name="menu" id="menu" style="list-style-type:none; padding-left: 4px">')
+VALUE="Refresh">&nbsp;&nbsp;<b>%s</b>&nbsp;&nbsp;<a href="%s" title="Download folder as zip">ZIP</a></FORM>'''
+                          % (list_title, ZIP_PATH + url_path))
+        yield b'%s' % refresh_button.encode('utf-8')
+        yield b'<ul name="menu" id="menu" style="list-style-type:none; padding-left: 4px">'
         # Create the formatted list of right panel hyper-links to files in the specified directory
-        if self.path != "/":   # Display folder Back arrow navigation if not in web root
-            f.write(b'<li><a href="%s" >%s</a></li>\n'
-                    % (urllib.parse.quote("..").encode('utf-8'), html.escape("< BACK").encode('utf-8')))
-        display_entries = 0
-        file_found = False
-        for name in list:
-            display_entries += 1
-            if WEB_MAX_LIST_ENTRIES > 1:
-                if display_entries >= WEB_MAX_LIST_ENTRIES:
-                    break
-            fullname = os.path.join(path, name)
-            displayname = linkname = name
-            date_modified = time.strftime('%H:%M:%S %d-%b-%Y', time.localtime(os.path.getmtime(fullname)))
-            # Append / for directories or @ for symbolic links
-            if os.path.islink(fullname):
-                displayname = name + "@"  # symbolic link found
-            if os.path.isdir(fullname):   # check if entry is a directory
-                displayname = name + "/"
-                linkname = os.path.join(displaypath, displayname)
-                f.write(b'<li><a href="%s" >%s</a></li>\n'
-                        % (urllib.parse.quote(linkname).encode('utf-8'), html.escape(displayname).encode('utf-8')))
+        if url_path != "/":   # Display folder Back arrow navigation if not in web root
+            yield (b'<li><a href="%s" >%s</a></li>\n'
+                   % (urllib.parse.quote("..").encode('utf-8'), html.escape("< BACK").encode('utf-8')))
+        else:
+            if LIVE_VIEW_ON:
+                yield b'<li><a href="%s" target="imgbox">LIVE VIEW</a></li>\n' % LIVE_PAGE_PATH.encode('utf-8')
+            yield b'<li><a href="%s" target="imgbox">CALENDAR</a></li>\n' % CALENDAR_PATH.encode('utf-8')
+        if offset > 0:
+            yield (b'<li><a href="?offset=%i" >%s</a></li>\n'
+                   % (max(0, offset - WEB_LIST_PAGE_SIZE), html.escape("< PREVIOUS").encode('utf-8')))
+        display_entries = page_end - offset
+        for entry in list[offset:page_end]:
+            info = entry_info(entry, url_path)
+            data_name = html.escape(info["name"]).encode('utf-8')
+            if entry.is_dir:   # check if entry is a directory
+                yield (b'<li data-name="%s"><a href="%s" >%s</a></li>\n'
+                       % (data_name, info["href"].encode('utf-8'), html.escape(info["display"]).encode('utf-8')))
             else:
-                f.write(b'<li><a href="%s" target="imgbox">%s</a> - %s</li>\n'
-                        % (urllib.parse.quote(linkname).encode('utf-8'), html.escape(displayname).encode('utf-8'), date_modified.encode('utf-8')))
-        if (self.path != "/") and display_entries > 35:   # Display folder Back arrow navigation if not in web root
-            f.write(b'<li><a href="%s" >%s</a></li>\n' % (urllib.parse.quote("..").encode('utf-8'), html.escape("< BACK").encode('utf-8')))
-        f.write(b'</ul></div><p><b>')
-        drive_status = df(MNT_POINT)
-        f.write(b'<div style="float: left; padding-left: 5px;">WebDir=%s %s</div>' %
-                (WEB_SERVER_ROOT.encode('utf-8'), drive_status.encode('utf-8')))
-        if WEB_PAGE_REFRESH_ON:  # Display web refresh info only if setting is turned on
-            f.write(b'<div style="float: left; padding-left: 10px;">Refresh=%ssec</div>' % WEB_PAGE_REFRESH_SEC.encode('utf-8'))
+                yield (b'<li data-name="%s"><a href="%s" target="imgbox">%s</a> - %s</li>\n'
+                       % (data_name, info["href"].encode('utf-8'), html.escape(info["display"]).encode('utf-8'),
+                          info["modified"].encode('utf-8')))
+        # Without javascript the MORE link shows the next page
+        yield (b'<li id="more"%s><a href="?offset=%i" >%s</a></li>\n'
+               % (b'' if page_end < all_entries else b' style="display:none"',
+                  page_end, html.escape("MORE >").encode('utf-8')))
+        if (url_path != "/") and display_entries > 35:   # Display folder Back arrow navigation if not in web root
+            yield b'<li><a href="%s" >%s</a></li>\n' % (urllib.parse.quote("..").encode('utf-8'), html.escape("< BACK").encode('utf-8'))
+        yield b'</ul></div>'
+        if WEB_EVENTS_ON:
+            yield b"""
+                <script>
+
+// New and deleted media are pushed by the server so the page is not reloaded
+var listSortTime = %s, listOffset = %i;
+
+function listItems() {
+    return Array.from(document.querySelectorAll("#menu li[data-name]"));
+}
+
+function mediaCreated(e) {
+    var menu = document.getElementById("menu");
+    var more = document.getElementById("more");
+    var items = listItems();
+    var old = items.find((li) => li.dataset.name == e.name);
+    if (old) {
+        if (!listSortTime) {
+            menu.replaceChild(entryItem(e), old);
+            return;
+        }
+        menu.removeChild(old);  // moves to top of time sorted list
+        listNext--;
+        listTotal--;
+    }
+    var before;
+    if (listSortTime) {
+        before = (listOffset == 0) ? (items.find((li) => li != old) || more) : null;
+    } else {
+        var name = e.name.toLowerCase();
+        before = items.find((li) => li.dataset.name.toLowerCase() > name);
+        if (!before && listNext >= listTotal) before = more;
+    }
+    listTotal++;
+    if (before) {
+        menu.insertBefore(entryItem(e), before);
+        listNext++;
+    } else if (listSortTime) {
+        listNext++;  // added to an earlier page. keep the next offset in step
+    }
+}
+
+function mediaDeleted(e) {
+    var old = listItems().find((li) => li.dataset.name == e.name);
+    if (old) {
+        old.parentNode.removeChild(old);
+        listNext--;
+    }
+    listTotal--;
+}
+
+if (window.EventSource) {
+    var events = new EventSource("%s" + window.location.pathname);
+    events.addEventListener("created", (m) => mediaCreated(JSON.parse(m.data)));
+    events.addEventListener("deleted", (m) => mediaDeleted(JSON.parse(m.data)));
+} else if (%s) {
+    setTimeout(() => window.location.reload(), %s * 1000);
+}
+                </script>
+                """ % (b"true" if WEB_LIST_BY_DATETIME_ON else b"false", offset,
+                       API_EVENTS_PATH.encode('utf-8'),
+                       b"true" if WEB_PAGE_REFRESH_ON else b"false", WEB_PAGE_REFRESH_SEC.encode('utf-8'))
+        yield b'<p><b>'
+        yield (b'<div style="float: left; padding-left: 5px;">WebDir=%s %s %s</div>' %
+               (WEB_SERVER_ROOT.encode('utf-8'), disk_status.get().encode('utf-8'),
+                media_usage.summary().encode('utf-8')))
+        if WEB_EVENTS_ON:
+            yield b'<div style="float: left; padding-left: 10px;">Refresh=Live</div>'
+        elif WEB_PAGE_REFRESH_ON:  # Display web refresh info only if setting is turned on
+            yield b'<div style="float: left; padding-left: 10px;">Refresh=%ssec</div>' % WEB_PAGE_REFRESH_SEC.encode('utf-8')
 
         if WEB_MAX_LIST_ENTRIES > 1:
-            f.write(b'<div style="text-align: right; padding-right: 40px;">Listing Only %i of %i Files in %s</div>'
-                    % (display_entries.encode('utf-8'), all_entries.encode('utf-8'), self.path.encode('utf-8')))
+            yield (b'<div style="text-align: right; padding-right: 40px;">Listing Only %i of %i Files in %s</div>'
+                   % (all_entries, dir_entries, displaypath.encode('utf-8')))
         else:
-            f.write(b'<div style="text-align: right; padding-right: 50px;">Listing All %i Files in %s</div>'
-                    % (all_entries, self.path.encode('utf-8')))
+            yield (b'<div style="text-align: right; padding-right: 50px;">Listing All %i Files in %s</div>'
+                   % (all_entries, displaypath.encode('utf-8')))
 
-        f.write(b'</b></p>')
-        length = f.tell()
-        f.seek(0)
-        self.send_response(200)
-        encoding = sys.getfilesystemencoding()
-        self.send_header(b"Content-type", b"text/html; charset=%s" % encoding.encode('utf-8'))
-        self.send_header("Content-Length".encode('utf-8'), str(length))
-        self.end_headers()
-        return f
+        yield b'</b></p>'
 
 # Start Web Server Processing
 os.chdir(WEB_SERVER_ROOT)
-socketserver.TCPServer.allow_reuse_address = True
-httpd = socketserver.TCPServer(("", WEB_SERVER_PORT), DirectoryHandler)
+httpd = PoolHTTPServer(("", WEB_SERVER_PORT), DirectoryHandler, WEB_SERVER_WORKERS,
+                       WEB_CONN_TIMEOUT_SEC)
 
 net_interface_names = [ b'eth0', b'wlan0' ]   # byte string list of interface names to check
 ip_list = []
@@ -245,12 +1309,18 @@ print("---------------------------- Settings --------------------------")
 print("Server  - WEB_PAGE_TITLE   = %s" % WEB_PAGE_TITLE)
 print("          WEB_SERVER_ROOT  = %s/%s" % (BASE_DIR, WEB_SERVER_ROOT))
 print("          WEB_SERVER_PORT  = %i " % WEB_SERVER_PORT)
+print("          WEB_SERVER_WORKERS = %i  WEB_CONN_TIMEOUT_SEC = %i" % (WEB_SERVER_WORKERS, WEB_CONN_TIMEOUT_SEC))
 print("Content - WEB_IMAGE_HEIGHT = %s px (height of content)" % WEB_IMAGE_HEIGHT)
 print("          WEB_IFRAME_WIDTH = %s  WEB_IFRAME_HEIGHT = %s" % (WEB_IFRAME_WIDTH, WEB_IFRAME_HEIGHT))
 print("          WEB_IFRAME_WIDTH_PERCENT = %s (of avail screen)" % (WEB_IFRAME_WIDTH_PERCENT))
 print("          WEB_PAGE_REFRESH_SEC = %s  (default=180 sec)" % WEB_PAGE_REFRESH_SEC)
 print("          WEB_PAGE_BLANK_ON = %s ( True=blank left pane until item selected)" % WEB_PAGE_BLANK_ON)
+print("          Calendar at %s  Last WEB_CALENDAR_DAYS = %i" % (CALENDAR_PATH, WEB_CALENDAR_DAYS))
+print("          WEB_MEDIA_INDEX_ON = %s (query at %s?type=motion&limit=50)" % (WEB_MEDIA_INDEX_ON, API_MEDIA_PATH))
+print("          WEB_EVENTS_ON = %s (True=push new media to open pages at %s)" % (WEB_EVENTS_ON, API_EVENTS_PATH))
 print("Listing - WEB_MAX_LIST_ENTRIES = %s ( 0=all )" % WEB_MAX_LIST_ENTRIES)
+print("          WEB_LIST_PAGE_SIZE = %i (entries per page, more load on scroll)" % WEB_LIST_PAGE_SIZE)
+print("          WEB_THUMB_CACHE_MB = %i (thumbnails at %s/path?w=%i)" % (WEB_THUMB_CACHE_MB, THUMB_PATH, THUMB_WIDTH))
 print("          WEB_LIST_BY_DATETIME_ON = %s  sort_decending = %s" % (WEB_LIST_BY_DATETIME_ON, WEB_LIST_BY_DATETIME_ON))
 print("----------------------------------------------------------------")
 print("From a computer on the same LAN. Use a Web Browser to access this server at")
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+tlvideo.py - Timelapse video helpers for pi-timolo2
+
+Incremental daily timelapse video. Every TIMELAPSE_SEGMENT_FRAMES new
+timelapse images are encoded into a short mp4 segment by a low priority
+background ffmpeg process. When the day changes, the segments for that
+day are joined with a stream copy concat (no re-encode) so the daily
+video is ready shortly after the last frame is taken.
+
+Working files are kept per day in the segment folder eg
+    media/timelapse-segments/20250215/pending.txt   frames not yet encoded
+    media/timelapse-segments/20250215/seg-0001.txt  ffmpeg concat list
+    media/timelapse-segments/20250215/seg-0001.mp4  encoded segment
+    media/timelapse-segments/20250215/tmp-seg-0002.mp4  segment being encoded
+
+A segment is renamed to seg-NNNN.mp4 only after ffmpeg succeeds. Before
+a day is joined, any segment list without its mp4 (eg the camera was
+restarted during an encode) is encoded again.
+
+Manual join of a day folder (eg after an outage)
+
+    ./tlvideo.py join media/timelapse-segments/20250215
+
+Batch encode a backlog of days. Images are grouped per day using the
+date in the file name, the dated sub folder name or the file modified
+date. Days are encoded concurrently by a process pool sized to the cpu
+cores and available memory. Days whose video is newer than all of its
+images are skipped, so an interrupted batch can simply be run again.
+
+    ./tlvideo.py batch media/timelapse media/motion -o media/videos
+
+Optional deflicker (requires numpy and PIL). Frame brightness is measured
+on reduced size decodes, smoothed with a moving window and each frame is
+gain corrected as it is piped to ffmpeg. Frames are processed in small
+batches so memory use does not depend on the number of frames.
+
+    ./tlvideo.py batch media/timelapse -o media/videos --deflicker 15
+"""
+import argparse
+import datetime
+import glob
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sysinfo import memAvailableMB
+
+FFMPEG_PATH = shutil.which("ffmpeg") or "/usr/bin/ffmpeg"
+SEGMENT_NICE = 19  # Run background encodes at lowest cpu priority
+PENDING_FILE = "pending.txt"
+ENCODE_JOB_MB = 150  # Approx memory used by one ffmpeg 720p encode job
+DEFLICKER_BATCH = 8  # Frames decoded per batch. 8 x 720p float frames is approx 90 MB
+DEFLICKER_STAT_SIZE = (160, 120)  # Reduced size used to measure frame brightness
+DEFLICKER_MAX_GAIN = 2.0  # Limit gain correction to 1/2 .. 2 times
+# Date in image file names eg tl-cam1-20250215-120000.jpg
+FILE_DATE_RE = re.compile(r"(20\d{6})-\d{6}")
+# Date in sub folder names made by createSubdir eg tl-2025-0215-1200
+SUBDIR_DATE_RE = re.compile(r"(20\d{2})-(\d{4})-\d{4}$")
+
+
+# ------------------------------------------------------------------------------
+def lowPriority():
+    """preexec_fn for subprocess to lower cpu priority of child"""
+    try:
+        os.nice(SEGMENT_NICE)
+    except OSError:
+        pass
+
+
+# ------------------------------------------------------------------------------
+def idleIo(cmd):
+    """Prefix cmd with ionice idle class so camera SD card writes are not delayed"""
+    ionice = shutil.which("ionice")
+    if ionice:
+        return [ionice, "-c3"] + cmd
+    return cmd
+
+
+# ------------------------------------------------------------------------------
+def writeConcatList(list_path, file_paths, fps=None):
+    """
+    Write an ffmpeg concat demuxer list file. If fps is given each entry
+    gets a duration so still images play at the requested frame rate.
+    """
+    with open(list_path, "w", encoding="utf-8") as f:
+        for file_path in file_paths:
+            f.write("file '%s'\n" % os.path.abspath(file_path).replace("'", "'\\''"))
+            if fps:
+                f.write("duration %.6f\n" % (1.0 / fps))
+        if fps and file_paths:
+            # concat demuxer ignores duration of last entry unless repeated
+            f.write("file '%s'\n" % os.path.abspath(file_paths[-1]).replace("'", "'\\''"))
+
+
+# ------------------------------------------------------------------------------
+def segmentCmd(list_path, seg_path, fps, vid_size, threads=0):
+    """
+    ffmpeg command to encode a concat list of images into an mp4.
+    threads=0 lets ffmpeg decide.
+    """
+    return [FFMPEG_PATH, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-vf", "scale=%s,fps=%i" % (vid_size.replace("x", ":"), fps),
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-threads", str(threads), "-r", str(fps), seg_path]
+
+
+# ------------------------------------------------------------------------------
+def joinCmd(list_path, video_path):
+    """ffmpeg command to join mp4 segments using stream copy (no re-encode)"""
+    return [FFMPEG_PATH, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "+faststart", video_path]
+
+
+# ------------------------------------------------------------------------------
+def readLines(file_path):
+    """Return list of non blank lines in file_path or empty list"""
+    if not os.path.isfile(file_path):
+        return []
+    with open(file_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+# ------------------------------------------------------------------------------
+def joinSegments(day_dir, video_path):
+    """
+    Join all seg-*.mp4 files in day_dir into video_path.
+    Returns True if the video was created.
+    """
+    seg_list = sorted(glob.glob(os.path.join(day_dir, "seg-*.mp4")))
+    seg_list = [seg for seg in seg_list if os.path.getsize(seg) > 0]
+    if not seg_list:
+        logging.warning("No Segments Found in %s", day_dir)
+        return False
+    list_path = os.path.join(day_dir, "join.txt")
+    writeConcatList(list_path, seg_list)
+    video_dir = os.path.dirname(video_path)
+    if video_dir and not os.path.isdir(video_dir):
+        os.makedirs(video_dir)
+    tmp_path = video_path + ".part.mp4"
+    logging.info("Join %i Segments to %s", len(seg_list), video_path)
+    result = subprocess.run(idleIo(joinCmd(list_path, tmp_path)), preexec_fn=lowPriority)
+    if result.returncode != 0:
+        logging.error("Join Failed for %s", video_path)
+        return False
+    os.replace(tmp_path, video_path)
+    logging.info("Saved Daily Video %s", video_path)
+    return True
+
+
+# ------------------------------------------------------------------------------
+def finishSegment(proc, seg_path):
+    """
+    Rename a finished segment encode (Popen or CompletedProcess) from its
+    temporary file to seg_path. A failed encode's partial file is removed.
+    Returns True if seg_path was saved.
+    """
+    tmp_path = proc.args[-1]
+    if proc.returncode == 0 and os.path.isfile(tmp_path):
+        os.replace(tmp_path, seg_path)
+        return True
+    logging.error("Segment Encode Failed %s", seg_path)
+    if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+    return False
+
+
+# ------------------------------------------------------------------------------
+class TlSegmenter:
+    '''
+    Collect timelapse image paths and encode them into daily video
+    segments in the background. Call addFrame() after each timelapse
+    image is saved.
+    '''
+
+    def __init__(self, seg_dir, video_dir, video_prefix,
+                 seg_frames=60, fps=10, vid_size="1280x720"):
+        self.seg_dir = seg_dir
+        self.video_dir = video_dir
+        self.video_prefix = video_prefix
+        self.seg_frames = max(1, seg_frames)
+        self.fps = fps
+        self.vid_size = vid_size
+        self.procs = {}  # day -> list of running segment Popen objects
+        self.lock = threading.Lock()
+        self.day = datetime.datetime.now().strftime("%Y%m%d")
+        if not os.path.isdir(self.seg_dir):
+            os.makedirs(self.seg_dir)
+        self.joinPrevious()
+
+    def dayDir(self, day):
+        return os.path.join(self.seg_dir, day)
+
+    def videoPath(self, day):
+        return os.path.join(self.video_dir, self.video_prefix + day + ".mp4")
+
+    def addFrame(self, file_path):
+        '''Record a new timelapse image and start a segment encode if required'''
+        day = datetime.datetime.now().strftime("%Y%m%d")
+        if day != self.day:
+            self.endDay(self.day)
+            self.day = day
+        day_dir = self.dayDir(day)
+        if not os.path.isdir(day_dir):
+            os.makedirs(day_dir)
+        with open(os.path.join(day_dir, PENDING_FILE), "a", encoding="utf-8") as f:
+            f.write(os.path.abspath(file_path) + "\n")
+        self.reap()
+        if len(readLines(os.path.join(day_dir, PENDING_FILE))) >= self.seg_frames:
+            self.flush(day)
+
+    def flush(self, day):
+        '''Encode pending frames for day into the next segment'''
+        day_dir = self.dayDir(day)
+        pending_path = os.path.join(day_dir, PENDING_FILE)
+        frames = [frame for frame in readLines(pending_path) if os.path.isfile(frame)]
+        if os.path.isfile(pending_path):
+            os.remove(pending_path)
+        if not frames:
+            return None
+        seg_num = len(glob.glob(os.path.join(day_dir, "seg-*.txt"))) + 1
+        list_path = os.path.join(day_dir, "seg-%04i.txt" % seg_num)
+        seg_path = os.path.join(day_dir, "seg-%04i.mp4" % seg_num)
+        tmp_path = os.path.join(day_dir, "tmp-seg-%04i.mp4" % seg_num)
+        writeConcatList(list_path, frames, self.fps)
+        logging.info("Encode %i Frames to %s", len(frames), seg_path)
+        try:
+            proc = subprocess.Popen(idleIo(segmentCmd(list_path, tmp_path, self.fps, self.vid_size)),
+                                    stdin=subprocess.DEVNULL, close_fds=True,
+                                    preexec_fn=lowPriority)
+        except OSError as e:
+            logging.error("Failed to Start %s - %s", FFMPEG_PATH, str(e))
+            return None
+        with self.lock:
+            self.procs.setdefault(day, []).append((proc, seg_path))
+        return proc
+
+    def reap(self):
+        '''Finish completed segment encodes and log any failures'''
+        with self.lock:
+            for day, procs in self.procs.items():
+                for item in procs[:]:
+                    proc, seg_path = item
+                    if proc.poll() is not None:
+                        finishSegment(proc, seg_path)
+                        procs.remove(item)
+
+    def endDay(self, day):
+        '''Flush remaining frames then join the day's segments in a thread'''
+        self.flush(day)
+        thread = threading.Thread(target=self.joinDay, args=(day,))
+        thread.daemon = True
+        thread.start()
+
+    def joinDay(self, day):
+        with self.lock:
+            procs = list(self.procs.pop(day, []))
+        for proc, seg_path in procs:  # wait for in progress segment encodes
+            proc.wait()
+            finishSegment(proc, seg_path)
+        self.encodeMissing(day)
+        if joinSegments(self.dayDir(day), self.videoPath(day)):
+            open(os.path.join(self.dayDir(day), "done"), "w").close()
+
+    def encodeMissing(self, day):
+        '''Encode segment lists that have no mp4 eg after a restart or failed encode'''
+        day_dir = self.dayDir(day)
+        for list_path in sorted(glob.glob(os.path.join(day_dir, "seg-*.txt"))):
+            seg_path = list_path[:-4] + ".mp4"
+            if os.path.isfile(seg_path):
+                continue
+            tmp_path = os.path.join(day_dir, "tmp-" + os.path.basename(seg_path))
+            logging.info("Encode Missing Segment %s", seg_path)
+            try:
+                result = subprocess.run(idleIo(segmentCmd(list_path, tmp_path, self.fps,
+                                                          self.vid_size)),
+                                        stdin=subprocess.DEVNULL, preexec_fn=lowPriority)
+            except OSError as e:
+                logging.error("Failed to Start %s - %s", FFMPEG_PATH, str(e))
+                return
+            finishSegment(result, seg_path)
+
+    def joinPrevious(self):
+        '''Join any earlier day folders left unfinished by a restart'''
+        for day_dir in sorted(glob.glob(os.path.join(self.seg_dir, "[0-9]" * 8))):
+            day = os.path.basename(day_dir)
+            if day < self.day and not os.path.isfile(os.path.join(day_dir, "done")):
+                logging.info("Finish Previous Day %s", day_dir)
+                self.endDay(day)
+
+
+# ------------------------------------------------------------------------------
+def poolSize(jobs=0):
+    """Number of concurrent encode jobs per cpu cores and available memory"""
+    cores = os.cpu_count() or 1
+    if jobs > 0:
+        return jobs
+    mem_mb = memAvailableMB()
+    if mem_mb is None:
+        return cores
+    return max(1, min(cores, mem_mb // ENCODE_JOB_MB))
+
+
+# ------------------------------------------------------------------------------
+def fileDay(file_name, subdir_day, mtime):
+    """Return YYYYMMDD for an image from its name, sub folder or mtime"""
+    match = FILE_DATE_RE.search(file_name)
+    if match:
+        return match.group(1)
+    if subdir_day:
+        return subdir_day
+    return time.strftime("%Y%m%d", time.localtime(mtime))
+
+
+# ------------------------------------------------------------------------------
+def findDayGroups(source_dirs, file_ext="jpg"):
+    """
+    Walk source_dirs and return a dict of YYYYMMDD -> list of (mtime, path)
+    sorted oldest first. Symlinks (eg recent folders) are ignored.
+    """
+    groups = {}
+    for source_dir in source_dirs:
+        for dir_path, dir_names, file_names in os.walk(source_dir):
+            match = SUBDIR_DATE_RE.search(os.path.basename(dir_path))
+            subdir_day = match.group(1) + match.group(2) if match else None
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(file_ext) or not entry.is_file(follow_symlinks=False):
+                        continue
+                    mtime = entry.stat().st_mtime
+                    day = fileDay(entry.name, subdir_day, mtime)
+                    groups.setdefault(day, []).append((mtime, entry.path))
+    for frames in groups.values():
+        frames.sort()
+    return groups
+
+
+# ------------------------------------------------------------------------------
+def dayIsCurrent(video_path, frames):
+    """True if video_path exists and is newer than all frames"""
+    try:
+        video_mtime = os.path.getmtime(video_path)
+    except OSError:
+        return False
+    return video_mtime >= frames[-1][0]
+
+
+# ------------------------------------------------------------------------------
+def loadFrame(file_path, size, mode="RGB"):
+    """
+    Decode an image at size as a float32 numpy array. JPEG draft mode
+    decodes at a reduced scale so small sizes never decode the full image.
+    """
+    import numpy as np
+    from PIL import Image
+    with Image.open(file_path) as im:
+        im.draft(mode, size)
+        im = im.convert(mode)
+        if im.size != size:
+            im = im.resize(size)
+        return np.asarray(im, dtype=np.float32)
+
+
+# ------------------------------------------------------------------------------
+def frameLuminance(frame_paths, batch=DEFLICKER_BATCH):
+    """Return array of mean brightness per frame measured on reduced decodes"""
+    import numpy as np
+    lum = np.empty(len(frame_paths), dtype=np.float32)
+    for start in range(0, len(frame_paths), batch):
+        chunk = frame_paths[start:start + batch]
+        stack = np.stack([loadFrame(path, DEFLICKER_STAT_SIZE, "L") for path in chunk])
+        lum[start:start + len(chunk)] = stack.mean(axis=(1, 2))
+    return lum
+
+
+# ------------------------------------------------------------------------------
+def deflickerGains(lum, window, max_gain=DEFLICKER_MAX_GAIN):
+    """
+    Fit a smoothed brightness curve through lum using a hanning weighted
+    moving window and return the per frame gain to reach it.
+    """
+    import numpy as np
+    window = max(1, min(window, len(lum)))
+    if window % 2 == 0:
+        window -= 1
+    if window < 3:
+        return np.ones(len(lum), dtype=np.float32)
+    kernel = np.hanning(window + 2)[1:-1]
+    kernel /= kernel.sum()
+    padded = np.pad(lum, window // 2, mode="edge")
+    smooth = np.convolve(padded, kernel, mode="valid")
+    gains = smooth / np.maximum(lum, 1.0)
+    return np.clip(gains, 1.0 / max_gain, max_gain).astype(np.float32)
+
+
+# ------------------------------------------------------------------------------
+def encodeDeflicker(frame_paths, video_path, fps, vid_size, window, threads=0):
+    """
+    Encode frame_paths to video_path applying deflicker gains.
+    Frames are streamed to ffmpeg as raw rgb in batches.
+    Returns True if successful.
+    """
+    import numpy as np
+    lum = frameLuminance(frame_paths)
+    gains = deflickerGains(lum, window)
+    logging.info("Deflicker %i Frames Gain min %.2f max %.2f",
+                 len(frame_paths), gains.min(), gains.max())
+    width, height = [int(val) for val in vid_size.split("x")]
+    cmd = [FFMPEG_PATH, "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", vid_size,
+           "-r", str(fps), "-i", "-",
+           "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+           "-threads", str(threads), video_path]
+    proc = subprocess.Popen(idleIo(cmd), stdin=subprocess.PIPE, preexec_fn=lowPriority)
+    ok = False
+    try:
+        for start in range(0, len(frame_paths), DEFLICKER_BATCH):
+            chunk = frame_paths[start:start + DEFLICKER_BATCH]
+            stack = np.stack([loadFrame(path, (width, height)) for path in chunk])
+            stack *= gains[start:start + len(chunk), None, None, None]
+            np.clip(stack, 0, 255, out=stack)
+            proc.stdin.write(stack.astype(np.uint8).tobytes())
+        proc.stdin.close()
+        ok = proc.wait() == 0
+    except BrokenPipeError:
+        logging.error("ffmpeg Exited Early for %s", video_path)
+    finally:
+        # eg a truncated frame raised. Do not leave ffmpeg or a partial video behind
+        if not ok:
+            if proc.poll() is None:
+                proc.kill()
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.wait()
+            if os.path.isfile(video_path):
+                os.remove(video_path)
+    return ok
+
+
+# ------------------------------------------------------------------------------
+def encodeDay(day, frame_paths, video_path, work_dir, fps, vid_size, threads,
+              deflicker=0):
+    """
+    Process pool worker. Encode frame_paths into video_path.
+    deflicker is the smoothing window in frames. 0=Off
+    Returns (day, ok, frame count, seconds)
+    """
+    start_time = time.time()
+    tmp_path = video_path + ".part.mp4"
+    if deflicker > 0:
+        try:
+            ok = encodeDeflicker(frame_paths, tmp_path, fps, vid_size, deflicker, threads)
+        except (ImportError, OSError) as e:
+            logging.error("Deflicker Failed for %s - %s", day, str(e))
+            ok = False
+    else:
+        list_path = os.path.join(work_dir, "batch-%s.txt" % day)
+        writeConcatList(list_path, frame_paths, fps)
+        cmd = idleIo(segmentCmd(list_path, tmp_path, fps, vid_size, threads))
+        try:
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, preexec_fn=lowPriority)
+            ok = result.returncode == 0
+        except OSError:
+            ok = False
+        os.remove(list_path)
+    if ok:
+        os.replace(tmp_path, video_path)
+    elif os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+    return day, ok, len(frame_paths), time.time() - start_time
+
+
+# ------------------------------------------------------------------------------
+def batchEncode(source_dirs, video_dir, video_prefix="TL-", fps=10,
+                vid_size="1280x720", file_ext="jpg", jobs=0, today=False,
+                deflicker=0):
+    """
+    Encode one video per day found in source_dirs using a process pool.
+    Returns number of failed days.
+    """
+    groups = findDayGroups(source_dirs, file_ext)
+    this_day = datetime.datetime.now().strftime("%Y%m%d")
+    if not os.path.isdir(video_dir):
+        os.makedirs(video_dir)
+    work_dir = os.path.join(video_dir, ".batch")
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    todo = []
+    for day in sorted(groups):
+        video_path = os.path.join(video_dir, video_prefix + day + ".mp4")
+        if day == this_day and not today:
+            logging.info("Skip %s Still in Progress", day)
+        elif dayIsCurrent(video_path, groups[day]):
+            logging.info("Skip %s Video is Current %s", day, video_path)
+        else:
+            todo.append((day, [path for mtime, path in groups[day]], video_path))
+    if not todo:
+        logging.info("Nothing to Encode in %s", " ".join(source_dirs))
+        return 0
+    workers = min(poolSize(jobs), len(todo))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logging.info("Encode %i Days with %i Workers x %i Threads", len(todo), workers, threads)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(encodeDay, day, frame_paths, video_path,
+                               work_dir, fps, vid_size, threads, deflicker)
+                   for day, frame_paths, video_path in todo]
+        for future in as_completed(futures):
+            day, ok, frame_cnt, secs = future.result()
+            if ok:
+                logging.info("Day %s %i Frames Encoded in %.1f sec", day, frame_cnt, secs)
+            else:
+                failed += 1
+                logging.error("Day %s Encode Failed", day)
+    return failed
+
+
+# ------------------------------------------------------------------------------
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(funcName)-10s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(description="pi-timolo2 timelapse video helper")
+    sub = parser.add_subparsers(dest="cmd")
+    join_parser = sub.add_parser("join", help="join segments in a day folder")
+    join_parser.add_argument("day_dir")
+    join_parser.add_argument("-o", "--output", help="output video path")
+    batch_parser = sub.add_parser("batch", help="encode one video per day")
+    batch_parser.add_argument("source_dirs", nargs="+")
+    batch_parser.add_argument("-o", "--output", default="media/videos", help="video folder")
+    batch_parser.add_argument("--prefix", default="TL-", help="video name prefix")
+    batch_parser.add_argument("--fps", type=int, default=10)
+    batch_parser.add_argument("--size", default="1280x720", help="video width x height")
+    batch_parser.add_argument("--ext", default="jpg", help="image file extension")
+    batch_parser.add_argument("-j", "--jobs", type=int, default=0, help="0=auto")
+    batch_parser.add_argument("--today", action="store_true", help="include today")
+    batch_parser.add_argument("--deflicker", type=int, default=0,
+                              help="deflicker smoothing window in frames 0=Off")
+    args = parser.parse_args()
+    if args.cmd == "join":
+        day_dir = args.day_dir.rstrip("/")
+        video_path = args.output or os.path.join(
+            "media/videos", "TL-" + os.path.basename(day_dir) + ".mp4")
+        sys.exit(0 if joinSegments(day_dir, video_path) else 1)
+    elif args.cmd == "batch":
+        failed = batchEncode(args.source_dirs, args.output, args.prefix, args.fps,
+                             args.size, args.ext, args.jobs, args.today,
+                             args.deflicker)
+        sys.exit(1 if failed else 0)
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
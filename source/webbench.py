@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+webbench.py - Benchmarks for the timolo2-web.py media server
+
+sendfile  Compare sending a file body through python (shutil.copyfileobj,
+          as SimpleHTTPRequestHandler does) with socket.sendfile (kernel
+          copy) over a loopback connection. Reports throughput and sender
+          cpu time per MB.
+
+    ./webbench.py sendfile                        # 200 MB temporary file
+    ./webbench.py sendfile media/videos/mo-1000.mp4 --repeat 5
+
+run       Load test timolo2-web.py. Synthetic media trees are made (or
+          reused) in the temp folder. Each has a large flat motion folder,
+          timelapse images in nested day folders, sparse mp4 videos and a
+          recent folder of symlinks. For each tree a copy of the web server
+          and its config is started on a free port, then listing, file, range
+          and thumbnail requests are sent by concurrent keep-alive clients.
+          The idle scenario first opens 6 idle connections per client (as a
+          browser leaves kept alive connections open), then sends status
+          requests, so latency shows if idle connections hold workers.
+          Reports p50/p95/p99 latency, throughput, server RSS and syscalls per
+          request (strace -c if installed and permitted, otherwise only the
+          read/write family counted in /proc/pid/io) and saves results as json.
+
+    ./webbench.py run                             # 1k, 10k and 100k files. 1 and 8 clients
+    ./webbench.py run --files 10000 --clients 1,4,16 --requests 500 --out before.json
+
+compare   Show the change between two run json result files
+
+    ./webbench.py compare before.json after.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+COPY_BUFSIZE = 64 * 1024  # timolo2-web.py chunk size
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_VERSION = 1
+SCENARIOS = ("listing", "file", "range", "thumb_cold", "thumb_hit", "idle")
+TREE_MARKER = ".webbench-tree.json"
+TREE_VERSION = 2            # change to make existing trees again. 2 = image copies, not links
+TIMELAPSE_DIR_FILES = 1000  # timelapse images per nested day folder
+RECENT_LINKS = 100          # symlinks in recent/motion
+VIDEO_MB = 20               # sparse video file size
+RANGE_BYTES = 1024 * 1024   # bytes per range request
+THUMB_HIT_IMAGES = 20       # images repeated by thumb_hit
+IDLE_CONNS_PER_CLIENT = 6   # idle keep-alive connections a browser leaves open in idle
+
+
+# ------------------------------------------------------------------------------
+def sendCopy(sock, f, size):
+    """Current SimpleHTTPRequestHandler body copy through python"""
+    wfile = sock.makefile("wb", buffering=0)
+    shutil.copyfileobj(f, wfile, COPY_BUFSIZE)
+
+
+# ------------------------------------------------------------------------------
+def sendKernel(sock, f, size):
+    """timolo2-web.py FileBody path"""
+    sock.sendfile(f, 0, size)
+
+
+# ------------------------------------------------------------------------------
+def drain(sock, size, result):
+    """Client thread. Read and discard size bytes"""
+    buf = bytearray(256 * 1024)
+    received = 0
+    while received < size:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    result.append(received)
+
+
+# ------------------------------------------------------------------------------
+def benchSend(send_fn, file_path):
+    """Return (seconds, sender cpu seconds, bytes) to send file_path once"""
+    size = os.path.getsize(file_path)
+    listener = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+    result = []
+    reader = threading.Thread(target=drain, args=(client, size, result))
+    reader.start()
+    with open(file_path, "rb") as f:
+        start_time = time.perf_counter()
+        start_cpu = time.thread_time()
+        send_fn(server, f, size)
+        cpu_sec = time.thread_time() - start_cpu
+        server.shutdown(socket.SHUT_WR)
+        reader.join()
+        elapsed = time.perf_counter() - start_time
+    server.close()
+    client.close()
+    if result[0] != size:
+        raise RuntimeError("Received %i of %i bytes" % (result[0], size))
+    return elapsed, cpu_sec, size
+
+
+# ------------------------------------------------------------------------------
+def runSendfile(args):
+    tmp_path = None
+    file_path = args.file
+    if file_path is None:
+        fd, tmp_path = tempfile.mkstemp(prefix="webbench-", suffix=".mp4")
+        with os.fdopen(fd, "wb") as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(chunk)
+        file_path = tmp_path
+    try:
+        size_mb = os.path.getsize(file_path) / 1048576.0
+        print("File %s  %.1f MB  repeat %i" % (file_path, size_mb, args.repeat))
+        for name, send_fn in (("copyfileobj", sendCopy), ("sendfile", sendKernel)):
+            benchSend(send_fn, file_path)  # warm page cache
+            runs = [benchSend(send_fn, file_path) for _ in range(args.repeat)]
+            elapsed = min(run[0] for run in runs)
+            cpu_sec = min(run[1] for run in runs)
+            print("  %-12s %8.1f MB/s  cpu %7.3f ms/MB" %
+                  (name, size_mb / elapsed, cpu_sec * 1000.0 / size_mb))
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+# ------------------------------------------------------------------------------
+def makeTemplateJpeg(path):
+    """Write a 1920x1080 jpg to path. Returns False if PIL and cv2 are missing"""
+    try:
+        from PIL import Image
+        img = Image.linear_gradient("L").resize((1920, 1080)).convert("RGB")
+        img.save(path, "JPEG", quality=85, optimize=True)
+        return True
+    except ImportError:
+        pass
+    try:
+        import cv2
+        import numpy as np
+        row = np.linspace(0, 255, 1920, dtype=np.uint8)
+        img = np.dstack([np.tile(row, (1080, 1))] * 3)
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        return True
+    except ImportError:
+        with open(path, "wb") as f:  # not decodable. thumbnails are skipped
+            f.write(os.urandom(200 * 1024))
+        return False
+
+
+# ------------------------------------------------------------------------------
+def treeLayout(files):
+    """Return file counts per folder for a tree of about files files"""
+    motion = files * 60 // 100
+    timelapse = files * 30 // 100
+    return {"version": TREE_VERSION, "files": files, "motion": motion,
+            "timelapse": timelapse,
+            "videos": max(1, files - motion - timelapse),
+            "recent": min(RECENT_LINKS, motion)}
+
+
+# ------------------------------------------------------------------------------
+def makeTree(tree_dir, files):
+    """
+    Make or reuse a synthetic media tree in tree_dir and return its layout.
+    Each image is its own copy of a small template jpg (about 32 KB), so
+    every image has its own mtime as real media does. Videos are sparse
+    files. A 100000 file tree uses about 3 GB.
+    """
+    layout = treeLayout(files)
+    marker = os.path.join(tree_dir, TREE_MARKER)
+    if os.path.exists(marker):
+        with open(marker) as f:
+            saved = json.load(f)
+        decodable = saved.pop("decodable", None)
+        if saved == layout and decodable is not None:
+            layout["decodable"] = decodable
+            return layout
+        shutil.rmtree(tree_dir)
+    elif os.path.isdir(tree_dir) and os.listdir(tree_dir):
+        raise SystemExit("ERROR: %s is not empty and not a webbench tree" % tree_dir)
+    print("Making %i file tree in %s" % (files, tree_dir))
+    for folder in ("motion", "timelapse", "videos", "recent/motion"):
+        os.makedirs(os.path.join(tree_dir, folder), exist_ok=True)
+    template = os.path.join(tree_dir, "template.jpg")
+    layout["decodable"] = makeTemplateJpeg(template)
+    with open(template, "rb") as f:
+        template_data = f.read()
+    start_time = time.time() - files * 60  # one file per minute up to now
+
+    def addImage(path, mtime):
+        with open(path, "wb") as f:
+            f.write(template_data)
+        os.utime(path, (mtime, mtime))
+
+    for i in range(layout["motion"]):
+        addImage(os.path.join(tree_dir, "motion", "mo-%06i.jpg" % i), start_time + i * 60)
+    for i in range(layout["timelapse"]):
+        day_dir = os.path.join(tree_dir, "timelapse", "day-%03i" % (i // TIMELAPSE_DIR_FILES))
+        if i % TIMELAPSE_DIR_FILES == 0:
+            os.makedirs(day_dir, exist_ok=True)
+        addImage(os.path.join(day_dir, "tl-%06i.jpg" % i), start_time + i * 60)
+    for i in range(layout["videos"]):
+        video_path = os.path.join(tree_dir, "videos", "mo-%06i.mp4" % i)
+        with open(video_path, "wb") as f:
+            f.truncate(VIDEO_MB * 1024 * 1024)
+        os.utime(video_path, (start_time + i * 60,) * 2)
+    for i in range(layout["motion"] - layout["recent"], layout["motion"]):
+        os.symlink(os.path.join("..", "..", "motion", "mo-%06i.jpg" % i),
+                   os.path.join(tree_dir, "recent", "motion", "mo-%06i.jpg" % i))
+    os.remove(template)
+    with open(marker, "w") as f:
+        json.dump(layout, f)
+    return layout
+
+
+# ------------------------------------------------------------------------------
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ------------------------------------------------------------------------------
+def startServer(tree_dir, server_dir, port, workers):
+    """
+    Copy timolo2-web.py, its modules and config.py to server_dir with the
+    web root set to tree_dir, start it and wait until it accepts connections.
+    Thumbnails are cached in server_dir/data/thumbs, not the real cache.
+    """
+    os.makedirs(server_dir, exist_ok=True)
+    for name in os.listdir(SCRIPT_DIR):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(SCRIPT_DIR, name), server_dir)
+    shutil.rmtree(os.path.join(server_dir, "data"), ignore_errors=True)
+    with open(os.path.join(server_dir, "config.py"), "a") as f:
+        f.write("\n# webbench.py settings\n")
+        f.write("WEB_SERVER_ROOT = %r\n" % os.path.abspath(tree_dir))
+        f.write("WEB_SERVER_PORT = %i\n" % port)
+        f.write("WEB_SERVER_WORKERS = %i\n" % workers)
+        f.write("LIVE_VIEW_ON = False\n")
+    log = open(os.path.join(server_dir, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, "timolo2-web.py"], cwd=server_dir,
+                            stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("ERROR: Web server exited. See %s" % log.name)
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("ERROR: Web server did not start. See %s" % log.name)
+
+
+# ------------------------------------------------------------------------------
+def procStatus(pid):
+    """Return (rss kb, peak rss kb) of process pid"""
+    values = {}
+    with open("/proc/%i/status" % pid) as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(value.split()[0])
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+# ------------------------------------------------------------------------------
+def procIoSyscalls(pid):
+    """Return read and write family syscalls of process pid. Not socket send/recv"""
+    values = {}
+    with open("/proc/%i/io" % pid) as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            values[key] = int(value)
+    return values["syscr"] + values["syscw"]
+
+
+# ------------------------------------------------------------------------------
+def scenarioRequests(scenario, layout, count, rng):
+    """Return list of (url path, headers) for a scenario"""
+    motion = layout["motion"]
+    recent_start = motion - layout["recent"]
+    requests = []
+    for i in range(count):
+        if scenario == "listing":
+            requests.append(("/motion/", {}))
+        elif scenario == "file":  # every second file through the recent symlinks
+            n = rng.randrange(recent_start, motion) if i % 2 else rng.randrange(motion)
+            requests.append(("/%s/mo-%06i.jpg" % ("recent/motion" if i % 2 else "motion", n), {}))
+        elif scenario == "range":
+            start = rng.randrange(0, VIDEO_MB * 1024 * 1024 - RANGE_BYTES)
+            requests.append(("/videos/mo-%06i.mp4" % rng.randrange(layout["videos"]),
+                             {"Range": "bytes=%i-%i" % (start, start + RANGE_BYTES - 1)}))
+        elif scenario == "thumb_cold":  # each image once while images last
+            requests.append(("/thumb/motion/mo-%06i.jpg?w=320" % (i % motion), {}))
+        elif scenario == "thumb_hit":
+            requests.append(("/thumb/motion/mo-%06i.jpg?w=320"
+                             % (motion - 1 - i % THUMB_HIT_IMAGES), {}))
+        elif scenario == "idle":
+            requests.append(("/api/status", {}))
+    return requests
+
+
+# ------------------------------------------------------------------------------
+def openIdle(port, count):
+    """
+    Return count connections left open without a request. To the server
+    they are the same as kept alive connections between page requests.
+    """
+    return [socket.create_connection(("127.0.0.1", port), timeout=120)
+            for _ in range(count)]
+
+
+# ------------------------------------------------------------------------------
+def clientLoop(port, requests, latencies, counts):
+    """Client thread. Send requests on one keep-alive connection. counts is this client's"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    for path, headers in requests:
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            counts["errors"] += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            continue
+        latencies.append(time.perf_counter() - start)
+        counts["bytes"] += len(body)
+        if resp.status not in (200, 206):
+            counts["errors"] += 1
+    conn.close()
+
+
+# ------------------------------------------------------------------------------
+def drive(port, requests, clients):
+    """Send requests split between clients threads. Returns (latencies, counts, seconds)"""
+    latencies = []
+    client_counts = [{"errors": 0, "bytes": 0} for _ in range(clients)]
+    threads = [threading.Thread(target=clientLoop,
+                                args=(port, requests[i::clients], latencies, client_counts[i]))
+               for i in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts = {key: sum(c[key] for c in client_counts) for key in ("errors", "bytes")}
+    return latencies, counts, time.perf_counter() - start_time
+
+
+# ------------------------------------------------------------------------------
+def straceSyscalls(pid, run_fn):
+    """
+    Return syscalls made by all threads of pid while run_fn() runs, or None
+    if strace is not installed or may not attach (run as root).
+    Idle server loops (select timeouts) are included.
+    """
+    strace = shutil.which("strace")
+    if strace is None:
+        return None
+    fd, out_path = tempfile.mkstemp(prefix="webbench-strace-")
+    os.close(fd)
+    cmd = [strace, "-c", "-f", "-o", out_path]
+    for tid in os.listdir("/proc/%i/task" % pid):
+        cmd += ["-p", tid]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)  # allow strace to attach
+    try:
+        run_fn()
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait(timeout=30)
+    total = None
+    with open(out_path) as f:
+        for line in f:
+            parts = line.split()
+            if parts and parts[-1] == "total":
+                total = int(parts[3])
+    os.remove(out_path)
+    return total
+
+
+# ------------------------------------------------------------------------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100.0))]
+
+
+# ------------------------------------------------------------------------------
+def benchScenario(proc, port, layout, scenario, clients, count, strace_on):
+    rng = random.Random(1)
+    if scenario == "thumb_hit":  # make the repeated thumbnails first
+        drive(port, scenarioRequests(scenario, layout, THUMB_HIT_IMAGES, rng), 1)
+    elif scenario != "thumb_cold":
+        drive(port, scenarioRequests(scenario, layout, min(count, 20), rng), 1)  # warm up
+    requests = scenarioRequests(scenario, layout, count, rng)
+    idle_conns = openIdle(port, clients * IDLE_CONNS_PER_CLIENT) if scenario == "idle" else []
+    try:
+        io_start = procIoSyscalls(proc.pid)
+        latencies, counts, elapsed = drive(port, requests, clients)
+        io_calls = procIoSyscalls(proc.pid) - io_start
+    finally:
+        for conn in idle_conns:
+            conn.close()
+    rss_kb, peak_kb = procStatus(proc.pid)
+    syscalls = None
+    if strace_on and scenario != "thumb_cold":
+        strace_requests = scenarioRequests(scenario, layout, min(count, 50), rng)
+        total = straceSyscalls(proc.pid, lambda: drive(port, strace_requests, 1))
+        if total is not None:
+            syscalls = round(total / float(len(strace_requests)), 1)
+    latencies.sort()
+    ms = lambda value: round(value * 1000.0, 2) if value is not None else None
+    return {"scenario": scenario,
+            "files": layout["files"],
+            "clients": clients,
+            "requests": len(requests),
+            "errors": counts["errors"],
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+            "req_per_sec": round(len(latencies) / elapsed, 1),
+            "mb_per_sec": round(counts["bytes"] / elapsed / 1048576.0, 2),
+            "syscalls_per_req": syscalls,
+            "io_syscalls_per_req": round(io_calls / float(len(requests)), 1),
+            "rss_kb": rss_kb,
+            "rss_peak_kb": peak_kb}
+
+
+# ------------------------------------------------------------------------------
+def runLoad(args):
+    files_list = [int(n) for n in args.files.split(",")]
+    clients_list = [int(n) for n in args.clients.split(",")]
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise SystemExit("ERROR: Unknown scenario %s. Use %s" % (scenario, ",".join(SCENARIOS)))
+    strace_on = not args.no_strace and shutil.which("strace") is not None
+    if not strace_on:
+        print("strace Not Used. syscalls_per_req is null. io_syscalls_per_req is read/write calls only")
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="webbench-server-")
+    try:
+        for files in files_list:
+            tree_dir = os.path.join(args.tree_dir, "webbench-tree-%i" % files)
+            layout = makeTree(tree_dir, files)
+            for clients in clients_list:
+                port = freePort()
+                proc = startServer(tree_dir, os.path.join(work_dir, "server"), port,
+                                   args.workers)
+                try:
+                    for scenario in scenarios:
+                        if scenario.startswith("thumb") and not layout["decodable"]:
+                            continue
+                        result = benchScenario(proc, port, layout, scenario, clients,
+                                               args.requests, strace_on)
+                        results.append(result)
+                        print("%-10s files %6i clients %3i  p50 %8.2f  p95 %8.2f  p99 %8.2f ms"
+                              "  %7.1f req/s %7.2f MB/s  rss %6s kb  errors %i"
+                              % (scenario, files, clients, result["p50_ms"] or 0,
+                                 result["p95_ms"] or 0, result["p99_ms"] or 0,
+                                 result["req_per_sec"], result["mb_per_sec"],
+                                 result["rss_kb"], result["errors"]))
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report = {"version": RESULT_VERSION,
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "host": {"machine": platform.machine(),
+                       "platform": platform.platform(),
+                       "python": platform.python_version(),
+                       "cpus": os.cpu_count()},
+              "settings": {"requests": args.requests, "workers": args.workers,
+                           "strace": strace_on},
+              "results": results}
+    out_path = args.out or time.strftime("webbench-%Y%m%d-%H%M%S.json")
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=1)
+    print("Saved %s" % out_path)
+
+
+# ------------------------------------------------------------------------------
+def runCompare(args):
+    reports = []
+    for path in (args.before, args.after):
+        with open(path) as f:
+            reports.append(json.load(f))
+    key = lambda r: (r["scenario"], r["files"], r["clients"])
+    before = {key(r): r for r in reports[0]["results"]}
+    print("%-10s %6s %4s %-12s %10s %10s %8s" % ("scenario", "files", "cli", "metric",
+                                                 "before", "after", "change"))
+    for result in reports[1]["results"]:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "req_per_sec", "syscalls_per_req", "rss_kb"):
+            if old.get(metric) is None or result.get(metric) is None:
+                continue
+            change = ("%+7.1f%%" % ((result[metric] - old[metric]) * 100.0 / old[metric])
+                      if old[metric] else "")
+            print("%-10s %6i %4i %-12s %10s %10s %8s" % (result["scenario"], result["files"],
+                                                          result["clients"], metric, old[metric],
+                                                          result[metric], change))
+
+
+# ------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="timolo2-web.py benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("sendfile", help="python copy vs sendfile body")
+    bench.add_argument("file", nargs="?", help="file to send. Default temporary file")
+    bench.add_argument("--size-mb", type=int, default=200, help="temporary file size")
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.set_defaults(func=runSendfile)
+    bench = commands.add_parser("run", help="load test timolo2-web.py on synthetic trees")
+    bench.add_argument("--files", default="1000,10000,100000", help="tree sizes eg 1000,10000")
+    bench.add_argument("--clients", default="1,8", help="concurrent clients eg 1,8,32")
+    bench.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    bench.add_argument("--scenarios", default=",".join(SCENARIOS))
+    bench.add_argument("--workers", type=int, default=8, help="WEB_SERVER_WORKERS")
+    bench.add_argument("--tree-dir", default=tempfile.gettempdir(),
+                       help="folder for reusable webbench-tree-<files> trees")
+    bench.add_argument("--no-strace", action="store_true", help="skip strace syscall counts")
+    bench.add_argument("--out", help="json result file. Default webbench-<datetime>.json")
+    bench.set_defaults(func=runLoad)
+    bench = commands.add_parser("compare", help="compare two run json result files")
+    bench.add_argument("before")
+    bench.add_argument("after")
+    bench.set_defaults(func=runCompare)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+zipstream.py - Stream a zip archive of media files for timolo2-web.py
+
+Files are stored (not compressed, jpg and mp4 do not compress) so the
+size and byte position of every part of the archive is known from the
+file sizes before anything is sent. The archive is generated while it
+is sent and never written to disk or held in memory.
+Since the layout is fixed, chunks(start) can resume a download at any
+byte offset. CRC32s of files before the resume point are read from a
+small in memory cache, or computed by reading (not sending) the files.
+ZIP64 records are only added when an archive or file needs them.
+
+Zip a folder from the command line
+
+    ./zipstream.py media/motion > motion.zip
+"""
+import collections
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DESCRIPTOR = struct.Struct("<IIII")
+DESCRIPTOR64 = struct.Struct("<IIQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+END_LOCATOR64 = struct.Struct("<IIQI")
+ZIP32_MAX = 0xFFFFFFFF     # size and offset fields set to this are in the zip64 extra field
+ZIP64_LIMIT = ZIP32_MAX    # sizes and offsets from this use zip64
+ENTRIES32_MAX = 0xFFFF
+FLAGS = 0x0808       # sizes and crc in data descriptor, utf-8 names
+VERSION = 20
+VERSION64 = 45
+MADE_BY = (3 << 8) | VERSION64   # unix
+FILE_ATTR = 0o100644 << 16
+
+READ_SIZE = 64 * 1024
+CRC_CACHE_MAX = 20000  # crc32 of recently zipped files. Speeds up resumed downloads
+
+
+# ------------------------------------------------------------------------------
+def dosTime(mtime):
+    """Return (dos time, dos date) of a unix time. Zip dates start in 1980"""
+    t = time.localtime(max(mtime, 315532800))
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+# ------------------------------------------------------------------------------
+class ZipStream:
+    '''
+    Stored zip archive of files, a list of (arcname, path, os.stat result).
+    size is the archive length and etag changes if any file changes.
+    chunks(start, end) yields the archive bytes start to end inclusive.
+    '''
+
+    crc_lock = threading.Lock()
+    crc_cache = collections.OrderedDict()  # (path, ino, size, mtime_ns) -> crc32
+
+    def __init__(self, files):
+        self.files = files
+        self.names = [arcname.encode("utf-8") for arcname, _, _ in files]
+        self.offsets = []
+        offset = 0
+        digest = hashlib.sha1()
+        for name, (_, _, st) in zip(self.names, files):
+            self.offsets.append(offset)
+            zip64 = st.st_size >= ZIP64_LIMIT
+            offset += (LOCAL_HEADER.size + len(name) + (20 if zip64 else 0) + st.st_size
+                       + (DESCRIPTOR64.size if zip64 else DESCRIPTOR.size))
+            digest.update(b"%s:%i:%i:%i\0" % (name, st.st_ino, st.st_size, st.st_mtime_ns))
+        self.offsets.append(offset)
+        self.cd_offset = offset
+        self.cd_size = sum(CENTRAL_HEADER.size + len(name) + self.central64Size(i)
+                           for i, name in enumerate(self.names))
+        self.zip64 = (len(files) >= ENTRIES32_MAX or self.cd_offset >= ZIP64_LIMIT
+                      or self.cd_size >= ZIP64_LIMIT)
+        self.size = (self.cd_offset + self.cd_size + END_RECORD.size
+                     + (END_RECORD64.size + END_LOCATOR64.size if self.zip64 else 0))
+        self.etag = '"zip-%s"' % digest.hexdigest()[:20]
+        self.crcs = [None] * len(files)
+
+    def central64Size(self, i):
+        '''Length of the central directory zip64 extra field of entry i'''
+        values = ((2 if self.files[i][2].st_size >= ZIP64_LIMIT else 0)
+                  + (1 if self.offsets[i] >= ZIP64_LIMIT else 0))
+        return 4 + 8 * values if values else 0
+
+    def localHeader(self, i):
+        st = self.files[i][2]
+        name = self.names[i]
+        dos_time, dos_date = dosTime(st.st_mtime)
+        if st.st_size >= ZIP64_LIMIT:
+            extra = struct.pack("<HHQQ", 1, 16, st.st_size, st.st_size)
+            return LOCAL_HEADER.pack(0x04034b50, VERSION64, FLAGS, 0, dos_time, dos_date, 0,
+                                     ZIP32_MAX, ZIP32_MAX, len(name), len(extra)) + name + extra
+        return LOCAL_HEADER.pack(0x04034b50, VERSION, FLAGS, 0, dos_time, dos_date, 0,
+                                 st.st_size, st.st_size, len(name), 0) + name
+
+    def descriptor(self, i):
+        size = self.files[i][2].st_size
+        if size >= ZIP64_LIMIT:
+            return DESCRIPTOR64.pack(0x08074b50, self.crcs[i], size, size)
+        return DESCRIPTOR.pack(0x08074b50, self.crcs[i], size, size)
+
+    def centralHeader(self, i):
+        st = self.files[i][2]
+        name = self.names[i]
+        dos_time, dos_date = dosTime(st.st_mtime)
+        size = st.st_size
+        offset = self.offsets[i]
+        values = []
+        if size >= ZIP64_LIMIT:
+            values += [size, size]
+            size = ZIP32_MAX
+        if offset >= ZIP64_LIMIT:
+            values.append(offset)
+            offset = ZIP32_MAX
+        extra = struct.pack("<HH%iQ" % len(values), 1, 8 * len(values), *values) if values else b""
+        version = VERSION64 if extra else VERSION
+        return CENTRAL_HEADER.pack(0x02014b50, MADE_BY, version, FLAGS, 0, dos_time, dos_date,
+                                   self.crcs[i], size, size, len(name), len(extra), 0, 0, 0,
+                                   FILE_ATTR, offset) + name + extra
+
+    def endRecords(self):
+        count = len(self.files)
+        records = b""
+        if self.zip64:
+            records += END_RECORD64.pack(0x06064b50, END_RECORD64.size - 12, MADE_BY, VERSION64,
+                                         0, 0, count, count, self.cd_size, self.cd_offset)
+            records += END_LOCATOR64.pack(0x07064b50, 0, self.cd_offset + self.cd_size, 1)
+        return records + END_RECORD.pack(0x06054b50, 0, 0, ENTRIES32_MAX if self.zip64 else count,
+                                          ENTRIES32_MAX if self.zip64 else count,
+                                          ZIP32_MAX if self.zip64 else self.cd_size,
+                                          ZIP32_MAX if self.zip64 else self.cd_offset, 0)
+
+    def cacheKey(self, i):
+        _, path, st = self.files[i]
+        return (path, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def readFile(self, i, skip=0):
+        '''
+        Yield the data of file i after skip bytes and set its crc32.
+        Skipped data is still read for the crc unless the crc is cached.
+        '''
+        _, path, st = self.files[i]
+        key = self.cacheKey(i)
+        with self.crc_lock:
+            cached = self.crc_cache.get(key)
+            if cached is not None:
+                self.crc_cache.move_to_end(key)
+        crc = 0
+        pos = 0
+        with open(path, "rb") as f:
+            if cached is not None and skip:
+                f.seek(skip)
+                pos = skip
+            while pos < st.st_size:
+                data = f.read(min(READ_SIZE, st.st_size - pos))
+                if not data:
+                    raise OSError("File Changed While Zipping %s" % path)
+                if cached is None:
+                    crc = zlib.crc32(data, crc)
+                if pos + len(data) > skip:
+                    yield data[max(0, skip - pos):]
+                pos += len(data)
+        if cached is None:
+            cached = crc
+            with self.crc_lock:
+                self.crc_cache[key] = crc
+                while len(self.crc_cache) > CRC_CACHE_MAX:
+                    self.crc_cache.popitem(last=False)
+        self.crcs[i] = cached
+
+    def chunks(self, start=0, end=None):
+        '''Yield archive bytes start to end inclusive (default the whole archive)'''
+        if end is None or end >= self.size:
+            end = self.size - 1
+        for i in range(len(self.files)):
+            entry_start, entry_end = self.offsets[i], self.offsets[i + 1]
+            if entry_start > end:
+                return
+            if entry_end <= start:  # before resume point. only the crc is needed
+                for _ in self.readFile(i, self.files[i][2].st_size):
+                    pass
+                continue
+            header = self.localHeader(i)
+            data_start = entry_start + len(header)
+            if data_start > start:
+                yield header[max(0, start - entry_start):end + 1 - entry_start]
+            pos = max(start, data_start)
+            for data in self.readFile(i, pos - data_start):
+                if pos > end:
+                    break
+                yield data[:end + 1 - pos]
+                pos += len(data)
+            if pos > end:
+                return
+            descriptor = self.descriptor(i)
+            desc_start = entry_end - len(descriptor)
+            yield descriptor[max(0, start - desc_start):end + 1 - desc_start]
+        pos = self.cd_offset
+        for i in range(len(self.files)):
+            if pos > end:
+                return
+            header = self.centralHeader(i)
+            if pos + len(header) > start:
+                yield header[max(0, start - pos):end + 1 - pos]
+            pos += len(header)
+        records = self.endRecords()
+        if pos <= end:
+            yield records[max(0, start - pos):end + 1 - pos]
+
+
+# ------------------------------------------------------------------------------
+def folderFiles(folder_path, keep=None):
+    """
+    Return sorted (arcname, path, os.stat result) of files under folder_path.
+    Symlinked files (eg recent folders) are followed. keep(path, st) filters.
+    """
+    files = []
+    for dir_path, dir_names, file_names in os.walk(folder_path):
+        dir_names.sort()
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            try:
+                st = os.stat(path)
+            except OSError:  # broken symlink
+                continue
+            if keep is None or keep(path, st):
+                files.append((os.path.relpath(path, folder_path).replace(os.sep, "/"), path, st))
+    files.sort()
+    return files
+
+
+# ------------------------------------------------------------------------------
+def main():
+    if len(sys.argv) < 2 or sys.stdout.isatty():
+        print("Usage: %s folder_path > archive.zip" % sys.argv[0])
+        sys.exit(1)
+    archive = ZipStream(folderFiles(sys.argv[1]))
+    out = sys.stdout.buffer
+    for data in archive.chunks():
+        out.write(data)
+    sys.stderr.write("Zipped %i files %i bytes\n" % (len(archive.files), archive.size))
+
+
+if __name__ == "__main__":
+    main()